@@ -0,0 +1,53 @@
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+# Индексы под постраничный вывод по (created_at, id) и фильтры списка
+# транзакций
+INDEXES = [
+    (
+        "ix_transactions_user_id_created_at_id",
+        "transactions",
+        ["user_id", "created_at", "id"],
+    ),
+    (
+        "ix_transactions_account_id_created_at_id",
+        "transactions",
+        ["account_id", "created_at", "id"],
+    ),
+    ("ix_transactions_user_id_amount", "transactions", ["user_id", "amount"]),
+    (
+        "ix_accounts_user_id_created_at_id",
+        "accounts",
+        ["user_id", "created_at", "id"],
+    ),
+]
+
+
+def upgrade():
+    # CONCURRENTLY не блокирует запись в таблицы, но не работает
+    # внутри транзакции
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(
+                name,
+                table_name=table,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
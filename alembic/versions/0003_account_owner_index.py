@@ -0,0 +1,37 @@
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+# Проверка владельца счёта в вебхуке читает (id, user_id): составной индекс
+# позволяет отвечать из индекса, не обращаясь к таблице
+INDEXES = [
+    ("ix_accounts_id_user_id", "accounts", ["id", "user_id"]),
+]
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+    op.execute("ANALYZE accounts")
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(
+                name,
+                table_name=table,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
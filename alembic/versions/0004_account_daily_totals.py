@@ -0,0 +1,38 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Зачисления по счёту за сутки (UTC); ведутся при каждом платеже,
+    # существующие данные переносятся командой python -m app.rollups
+    op.create_table(
+        "account_daily_totals",
+        sa.Column(
+            "account_id",
+            sa.Integer,
+            sa.ForeignKey("accounts.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column("day", sa.Date, primary_key=True),
+        sa.Column(
+            "credit_count",
+            sa.Integer,
+            nullable=False,
+            server_default="0",
+        ),
+        sa.Column(
+            "total",
+            sa.Numeric(14, 2),
+            nullable=False,
+            server_default="0",
+        ),
+    )
+
+
+def downgrade():
+    op.drop_table("account_daily_totals")
@@ -0,0 +1,45 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+# Суммы переводятся в целые копейки (BIGINT). Смена типа переписывает
+# таблицу под эксклюзивной блокировкой, поэтому миграцию запускают в окно
+# обслуживания; индексы по этим столбцам перестраиваются вместе с ней.
+COLUMNS = [
+    ("accounts", "balance", "balance_cents", sa.Numeric),
+    ("transactions", "amount", "amount_cents", sa.Numeric),
+    ("account_daily_totals", "total", "total_cents", sa.Numeric(14, 2)),
+]
+
+
+def upgrade():
+    for table, old, new, _ in COLUMNS:
+        op.alter_column(
+            table,
+            old,
+            type_=sa.BigInteger,
+            postgresql_using=f"round(coalesce({old}, 0) * 100)::bigint",
+        )
+        op.alter_column(table, old, new_column_name=new)
+    op.alter_column(
+        "accounts", "balance_cents", nullable=False, server_default="0"
+    )
+    # Прежнее значение по умолчанию осталось бы '0'::numeric
+    op.alter_column("account_daily_totals", "total_cents", server_default="0")
+
+
+def downgrade():
+    op.alter_column("accounts", "balance_cents", nullable=True)
+    for table, old, new, type_ in reversed(COLUMNS):
+        op.alter_column(table, new, new_column_name=old)
+        op.alter_column(
+            table,
+            old,
+            type_=type_,
+            postgresql_using=f"round({old}::numeric / 100, 2)",
+        )
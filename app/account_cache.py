@@ -0,0 +1,167 @@
+from importlib import import_module
+from typing import Optional
+
+from app.cache import LRUCache, TTLCache
+from app.config import settings
+from app.money import to_float
+
+
+class AccountCacheBackend:
+    """
+    Storage behind `AccountCache`: user id -> list of account dicts.
+
+    The default keeps entries in the worker's memory. To share one cache
+    between workers, point ACCOUNT_CACHE_BACKEND at a `module:factory`
+    called with (maxsize, ttl) that returns a subclass storing entries in
+    a shared service; the values are JSON-compatible (ints, strings and
+    float balances) so they can be serialized as they are.
+    """
+
+    async def get(self, user_id: int) -> Optional[list[dict]]:
+        raise NotImplementedError
+
+    async def set(self, user_id: int, accounts: list[dict]):
+        raise NotImplementedError
+
+    async def delete(self, user_id: int):
+        raise NotImplementedError
+
+    async def clear(self):
+        raise NotImplementedError
+
+    def size(self) -> Optional[int]:
+        """Number of entries, or None when the store cannot tell cheaply."""
+        return None
+
+
+class MemoryBackend(AccountCacheBackend):
+    """Per-worker LRU of at most `maxsize` users, each kept `ttl` seconds."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.entries = TTLCache(maxsize, ttl)
+
+    async def get(self, user_id: int) -> Optional[list[dict]]:
+        return self.entries.get(user_id)
+
+    async def set(self, user_id: int, accounts: list[dict]):
+        self.entries.set(user_id, accounts)
+
+    async def delete(self, user_id: int):
+        self.entries.pop(user_id)
+
+    async def clear(self):
+        self.entries.clear()
+
+    def size(self) -> Optional[int]:
+        return len(self.entries)
+
+
+def load_backend(spec: str, maxsize: int, ttl: float) -> AccountCacheBackend:
+    """`memory` or the `module:factory` of a custom backend."""
+    if spec == "memory":
+        return MemoryBackend(maxsize, ttl)
+    module, _, name = spec.partition(":")
+    return getattr(import_module(module), name)(maxsize, ttl)
+
+
+class AccountCache:
+    """
+    Cache of each user's account list for /users/me/accounts.
+
+    Filled on a miss from the database; after a committed credit the new
+    balance is written through with `credit`, and admin changes drop the
+    user with `invalidate`. Credits are always positive, so a balance
+    only grows: a write-through keeps the larger of the cached and the
+    committed balance, which makes commits finishing out of order safe.
+    A fill that started before a write or invalidation of the same user
+    in this worker is discarded; anything else is bounded by the TTL.
+    """
+
+    def __init__(self, backend: AccountCacheBackend, enabled: bool = True):
+        self.backend = backend
+        self.enabled = enabled
+        self._versions = LRUCache(settings.ACCOUNT_CACHE_SIZE)
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.invalidations = 0
+
+    def version(self, user_id: int) -> int:
+        """Pass to `fill` to detect writes that happened meanwhile."""
+        return self._versions.get(user_id, 0)
+
+    def _bump(self, user_id: int):
+        self._versions.set(user_id, self._versions.get(user_id, 0) + 1)
+
+    async def get(self, user_id: int) -> Optional[list[dict]]:
+        if not self.enabled:
+            return None
+        accounts = await self.backend.get(user_id)
+        if accounts is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return accounts
+
+    async def fill(self, user_id: int, accounts: list[dict], version: int):
+        if self.enabled and self.version(user_id) == version:
+            await self.backend.set(user_id, accounts)
+
+    async def credit(self, user_id: int, account_id: int, balance_cents: int):
+        """Write a committed balance through to the cached account list."""
+        if not self.enabled:
+            return
+        self._bump(user_id)
+        accounts = await self.backend.get(user_id)
+        if accounts is None:
+            return
+        if not any(account["id"] == account_id for account in accounts):
+            # Счёт создан этим платежом: его полей в кэше нет
+            await self.invalidate(user_id)
+            return
+        balance = to_float(balance_cents)
+        await self.backend.set(
+            user_id,
+            [
+                (
+                    dict(account, balance=max(account["balance"], balance))
+                    if account["id"] == account_id
+                    else account
+                )
+                for account in accounts
+            ],
+        )
+        self.writes += 1
+
+    async def invalidate(self, user_id: int):
+        if not self.enabled:
+            return
+        self._bump(user_id)
+        await self.backend.delete(user_id)
+        self.invalidations += 1
+
+    async def clear(self):
+        await self.backend.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "backend": type(self.backend).__name__,
+            "entries": self.backend.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "writes": self.writes,
+            "invalidations": self.invalidations,
+        }
+
+
+account_cache = AccountCache(
+    load_backend(
+        settings.ACCOUNT_CACHE_BACKEND,
+        settings.ACCOUNT_CACHE_SIZE,
+        settings.ACCOUNT_CACHE_TTL,
+    ),
+    enabled=settings.ACCOUNT_CACHE_ENABLED,
+)
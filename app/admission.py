@@ -0,0 +1,216 @@
+import math
+import time
+from typing import Callable, Optional
+
+from app.cache import LRUCache
+from app.config import settings
+from app.database import pool_load
+from app.metrics import Counter, registry
+
+ADMITTED = "admitted"
+SHED_RATE = "shed_rate"
+SHED_IN_FLIGHT = "shed_in_flight"
+
+WEBHOOK_PATHS = frozenset({"/webhook/payment", "/webhook/payments/batch"})
+
+_REJECT_BODY = b'{"detail":"Service is overloaded, retry later"}'
+
+
+class TokenBucket:
+    """`rate` tokens per second up to `burst`; starts full."""
+
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, rate: float, burst: float, now: float) -> float:
+        """Take one token; return 0 or the seconds until one is available."""
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / rate
+
+
+class AdmissionController:
+    """
+    Decides whether a webhook request may proceed.
+
+    Two limits, checked in this order:
+
+    * capacity: with `max_in_flight` set, at most that many admitted
+      requests are processed at once. Otherwise the live state of the
+      connection pool from `pool_load` decides: a request is shed only
+      when every connection is checked out and `max_pool_waiters`
+      checkouts already wait for one, because it would only queue
+      behind them and time out.
+    * per source: each source has a token bucket of `rate` requests per
+      second with bursts up to `burst`. One provider's retry storm then
+      cannot crowd out the others. `rate=0` turns it off.
+
+    Sources are held in an LRU of `max_sources` buckets; an evicted source
+    comes back with a full bucket. With `enabled` off every request is
+    admitted without being counted.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        max_in_flight: int = 0,
+        max_sources: int = 10_000,
+        retry_after: float = 1.0,
+        pool_load: Optional[Callable[[], Optional[tuple]]] = None,
+        max_pool_waiters: int = 0,
+        enabled: bool = True,
+    ):
+        self.enabled = enabled
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_in_flight = max_in_flight
+        self.pool_load = pool_load
+        self.max_pool_waiters = max_pool_waiters
+        self.retry_after = retry_after
+        self._buckets = LRUCache(max_sources)
+        self.in_flight = 0
+        self.max_seen_in_flight = 0
+
+    def admit(self, source: str) -> Optional[float]:
+        """Admit a request; on rejection return seconds to Retry-After."""
+        if self._at_capacity():
+            admission_decisions.inc(SHED_IN_FLIGHT)
+            return self.retry_after
+
+        if self.rate > 0:
+            now = time.monotonic()
+            bucket = self._buckets.get(source)
+            if bucket is None:
+                bucket = TokenBucket(self.burst, now)
+                self._buckets.set(source, bucket)
+            wait = bucket.take(self.rate, self.burst, now)
+            if wait:
+                admission_decisions.inc(SHED_RATE)
+                return wait
+
+        admission_decisions.inc(ADMITTED)
+        self.in_flight += 1
+        if self.in_flight > self.max_seen_in_flight:
+            self.max_seen_in_flight = self.in_flight
+        return None
+
+    def _at_capacity(self) -> bool:
+        if self.max_in_flight:
+            return self.in_flight >= self.max_in_flight
+        load = self.pool_load() if self.pool_load is not None else None
+        if load is None:
+            return False
+        checked_out, capacity, waiting = load
+        return checked_out >= capacity and waiting >= self.max_pool_waiters
+
+    def release(self):
+        self.in_flight -= 1
+
+    def stats(self) -> dict:
+        load = self.pool_load() if self.pool_load is not None else None
+        return {
+            "enabled": self.enabled,
+            "rate": self.rate,
+            "burst": self.burst,
+            "max_in_flight": self.max_in_flight,
+            "max_pool_waiters": self.max_pool_waiters,
+            "pool_checked_out": load[0] if load else None,
+            "pool_capacity": load[1] if load else None,
+            "pool_waiting": load[2] if load else None,
+            "in_flight": self.in_flight,
+            "max_seen_in_flight": self.max_seen_in_flight,
+            "sources": len(self._buckets),
+            "admitted": admission_decisions.value(ADMITTED),
+            "shed_rate": admission_decisions.value(SHED_RATE),
+            "shed_in_flight": admission_decisions.value(SHED_IN_FLIGHT),
+        }
+
+
+class AdmissionMiddleware:
+    """
+    Pure ASGI middleware that applies `controller` to POST requests on
+    `paths` before routing.
+
+    A rejected request gets 503 with Retry-After without its body being
+    read. The request never reaches validation, the signature check or the
+    database. The source is the `source_header` value when set (e.g. a
+    provider id added by the gateway), otherwise the client address.
+    """
+
+    def __init__(
+        self,
+        app,
+        controller: AdmissionController,
+        paths=WEBHOOK_PATHS,
+        source_header: str = "",
+    ):
+        self.app = app
+        self.controller = controller
+        self.paths = paths
+        self.source_header = source_header.lower().encode()
+
+    def _source(self, scope) -> str:
+        if self.source_header:
+            for name, value in scope["headers"]:
+                if name == self.source_header:
+                    return value.decode("latin-1")
+        client = scope.get("client")
+        return client[0] if client else ""
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not self.controller.enabled
+            or scope["method"] != "POST"
+            or scope["path"] not in self.paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        retry_after = self.controller.admit(self._source(scope))
+        if retry_after is not None:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 503,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"content-length", b"%d" % len(_REJECT_BODY)),
+                        (b"retry-after", b"%d" % math.ceil(retry_after)),
+                    ],
+                }
+            )
+            await send({"type": "http.response.body", "body": _REJECT_BODY})
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release()
+
+
+admission_decisions = registry.register(
+    Counter(
+        "webhook_admission_total",
+        "Webhook requests admitted or shed by admission control",
+        labels=("decision",),
+    )
+)
+
+webhook_admission = AdmissionController(
+    rate=settings.ADMISSION_RATE,
+    burst=settings.ADMISSION_BURST,
+    max_in_flight=settings.ADMISSION_MAX_IN_FLIGHT,
+    max_sources=settings.ADMISSION_MAX_SOURCES,
+    retry_after=settings.ADMISSION_RETRY_AFTER,
+    pool_load=pool_load,
+    max_pool_waiters=settings.ADMISSION_MAX_POOL_WAITERS,
+    enabled=settings.ADMISSION_ENABLED,
+)
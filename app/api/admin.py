@@ -1,26 +1,46 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
-from app import models, schemas
-from app.database import get_async_session
+from app import export, models, refresh_tokens, schemas, user_import
+from app.config import settings
+from app.database import get_async_session, get_read_session, pool_status
 from app import auth
+from app.account_cache import account_cache
+from app.admission import webhook_admission
+from app.hashing import bulk_password_hasher, password_hasher
+from app.idempotency import idempotency_cache
+from app.intake import intake_log
+from app.pagination import decode_cursor, page_limit, paginate
+from app.responses import rows_response, schema_columns
 
 router = APIRouter()
 
 
 @router.get("/users", response_model=list[schemas.User])
 async def read_users(
-    _: models.User = Depends(auth.get_current_admin),
-    db: AsyncSession = Depends(get_async_session),
+    limit: int = Depends(page_limit),
+    cursor: Optional[str] = Query(None),
+    _: schemas.User = Depends(auth.get_current_admin),
+    db: AsyncSession = Depends(get_read_session),
 ):
-    users = await db.execute(select(models.User))
-    return users.scalars().all()
+    after = decode_cursor(cursor, int) if cursor else None
+    users = await models.User.get_users(
+        db,
+        limit=limit + 1,
+        after_id=after[0] if after else None,
+        columns=schema_columns(models.User, schemas.User),
+    )
+    users, headers = paginate(users, limit, key=lambda u: (u.id,))
+    return rows_response(users, schemas.User, headers)
 
 
 @router.post("/users", response_model=schemas.User)
 async def create_user(
     user: schemas.UserCreate,
-    _: models.User = Depends(auth.get_current_admin),
+    _: schemas.User = Depends(auth.get_current_admin),
     db: AsyncSession = Depends(get_async_session),
 ):
     db_user = await models.User.get_by_email(db, user.email)
@@ -30,7 +50,7 @@ async def create_user(
             detail="Email already registered",
         )
 
-    hashed_password = auth.get_password_hash(user.password)
+    hashed_password = await auth.hash_password(user.password)
     new_user = models.User(
         email=user.email,
         full_name=user.full_name,
@@ -44,21 +64,125 @@ async def create_user(
     return new_user
 
 
+@router.get("/transactions/export")
+async def export_transactions(
+    request: Request,
+    format: str = Query(export.CSV, pattern="^(csv|ndjson)$"),
+    date_from: Optional[datetime] = Query(None),
+    date_to: Optional[datetime] = Query(None),
+    user_id: Optional[int] = Query(None),
+    account_id: Optional[int] = Query(None),
+    after_created_at: Optional[datetime] = Query(None),
+    after_id: Optional[int] = Query(None),
+    _: schemas.User = Depends(auth.get_current_admin),
+):
+    """
+    Stream transactions in (created_at, id) order as CSV or NDJSON.
+
+    Pass the `created_at` and `id` of the last row received as
+    `after_created_at` / `after_id` to resume an interrupted export. The
+    body is gzip-compressed when the client accepts it.
+    """
+    if (after_created_at is None) != (after_id is None):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="after_created_at and after_id go together",
+        )
+    compress = export.accepts_gzip(request.headers.get("accept-encoding", ""))
+    headers = {
+        "Content-Disposition": f'attachment; filename="transactions.{format}"',
+        "Vary": "Accept-Encoding",
+    }
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        export.export_transactions(
+            format,
+            compress=compress,
+            batch_size=settings.EXPORT_BATCH_SIZE,
+            after=(
+                (after_created_at, after_id) if after_id is not None else None
+            ),
+            date_from=date_from,
+            date_to=date_to,
+            user_id=user_id,
+            account_id=account_id,
+        ),
+        media_type=export.MEDIA_TYPES[format],
+        headers=headers,
+    )
+
+
+@router.post("/users/bulk", response_model=schemas.UserImportResult)
+async def import_users(
+    request: Request,
+    _: schemas.User = Depends(auth.get_current_admin),
+    db: AsyncSession = Depends(get_async_session),
+):
+    """
+    Create users from a streamed CSV or NDJSON body.
+
+    CSV needs a header with `email`, `full_name` and `password` columns;
+    NDJSON has one object with those keys per line. Rows are imported in
+    chunks and invalid or taken emails are listed in the error report.
+    """
+    content_type = request.headers.get("content-type", "")
+    fmt = user_import.CONTENT_TYPES.get(content_type.split(";")[0].strip())
+    if fmt is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Send text/csv or application/x-ndjson",
+        )
+
+    report = user_import.ImportReport(settings.BULK_IMPORT_MAX_ERRORS)
+    lines = user_import.iter_lines(
+        request.stream(), settings.BULK_IMPORT_MAX_LINE
+    )
+    try:
+        await user_import.import_users(
+            db,
+            user_import.iter_records(lines, fmt),
+            bulk_password_hasher,
+            settings.BULK_IMPORT_CHUNK_SIZE,
+            report,
+        )
+    except user_import.ImportFormatError as e:
+        # Уже созданные пакеты остаются; в отчёте видно, сколько создано
+        result = report.as_dict()
+        result["error"] = str(e)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=result
+        )
+    return report.as_dict()
+
+
 @router.get("/users/{user_id}/accounts", response_model=list[schemas.Account])
 async def read_users_accounts(
     user_id: int,
-    _: models.User = Depends(auth.get_current_admin),
-    db: AsyncSession = Depends(get_async_session),
+    limit: int = Depends(page_limit),
+    cursor: Optional[str] = Query(None),
+    _: schemas.User = Depends(auth.get_current_admin),
+    db: AsyncSession = Depends(get_read_session),
 ):
-    accounts = await models.Account.get_user_accounts(db, user_id)
-    return accounts
+    after = decode_cursor(cursor, datetime, int) if cursor else None
+    accounts = await models.Account.get_user_accounts(
+        db,
+        user_id,
+        limit=limit + 1,
+        after=after,
+        columns=schema_columns(models.Account, schemas.Account),
+    )
+    accounts, headers = paginate(
+        accounts, limit, key=lambda a: (a.created_at, a.id)
+    )
+    return rows_response(accounts, schemas.Account, headers)
 
 
 @router.put("/users/{user_id}", response_model=schemas.User)
 async def update_user(
     user_id: int,
     user: schemas.UserCreate,
-    _: models.User = Depends(auth.get_current_admin),
+    _: schemas.User = Depends(auth.get_current_admin),
     db: AsyncSession = Depends(get_async_session),
 ):
     db_user = await models.User.get_by_id(db, user_id)
@@ -70,10 +194,14 @@ async def update_user(
     db_user.email = user.email
     db_user.full_name = user.full_name
     if user.password:
-        db_user.hashed_password = auth.get_password_hash(user.password)
+        db_user.hashed_password = await auth.hash_password(user.password)
+        # Сессии со старым паролем больше не обновляются
+        await refresh_tokens.revoke_user(db, user_id)
 
     await db.commit()
     await db.refresh(db_user)
+    auth.principal_cache.invalidate_user(user_id)
+    await account_cache.invalidate(user_id)
 
     return db_user
 
@@ -81,7 +209,7 @@ async def update_user(
 @router.delete("/users/{user_id}", response_model=schemas.User)
 async def delete_user(
     user_id: int,
-    _: models.User = Depends(auth.get_current_admin),
+    _: schemas.User = Depends(auth.get_current_admin),
     db: AsyncSession = Depends(get_async_session),
 ):
     db_user = await models.User.get_by_id(db, user_id)
@@ -92,5 +220,85 @@ async def delete_user(
 
     await db.delete(db_user)
     await db.commit()
+    auth.principal_cache.invalidate_user(user_id)
+    await account_cache.invalidate(user_id)
 
     return db_user
+
+
+@router.delete("/users/{user_id}/refresh-tokens")
+async def revoke_user_refresh_tokens(
+    user_id: int,
+    _: schemas.User = Depends(auth.get_current_admin),
+    db: AsyncSession = Depends(get_async_session),
+):
+    """Revoke every refresh token of a user; access tokens already issued
+    stay valid until they expire."""
+    revoked = await refresh_tokens.revoke_user(db, user_id)
+    await db.commit()
+    return {"revoked": revoked}
+
+
+@router.get("/db/pool")
+async def read_db_pool(_: schemas.User = Depends(auth.get_current_admin)):
+    """Connection pool usage and checkout wait statistics of this worker."""
+    return pool_status()
+
+
+@router.get("/cache/idempotency")
+async def read_idempotency_cache(
+    _: schemas.User = Depends(auth.get_current_admin),
+):
+    """Size and hit/miss counters of the transaction_id front cache."""
+    return idempotency_cache.stats()
+
+
+@router.get("/cache/accounts")
+async def read_account_cache(
+    _: schemas.User = Depends(auth.get_current_admin),
+):
+    """Entries, hit rate, write-throughs and invalidations of the account
+    cache."""
+    return account_cache.stats()
+
+
+@router.get("/hashing")
+async def read_hashing_pool(
+    _: schemas.User = Depends(auth.get_current_admin),
+):
+    """Queue depth and timings of the password hashing pool."""
+    return password_hasher.stats()
+
+
+@router.get("/cache/principals")
+async def read_principal_cache(
+    _: schemas.User = Depends(auth.get_current_admin),
+):
+    """Size and hit rate of the authenticated principal cache."""
+    return auth.principal_cache.stats()
+
+
+@router.get("/intake")
+async def read_intake_log(
+    _: schemas.User = Depends(auth.get_current_admin),
+):
+    """Depth, lag and group commit statistics of the webhook intake log."""
+    return intake_log.stats()
+
+
+@router.get("/intake/dead-letters")
+async def read_intake_dead_letters(
+    limit: int = Query(100, ge=1, le=1000),
+    _: schemas.User = Depends(auth.get_current_admin),
+):
+    """Intake payments that were accepted with 202 but never credited:
+    rejected, malformed or failing entries, oldest first."""
+    return await intake_log.dead_letters(limit)
+
+
+@router.get("/admission")
+async def read_webhook_admission(
+    _: schemas.User = Depends(auth.get_current_admin),
+):
+    """Limits, requests in flight and shed counts of webhook admission."""
+    return webhook_admission.stats()
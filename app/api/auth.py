@@ -1,8 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Request,
+    Response,
+    status,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
+from typing import Optional
 
-from app import schemas, auth
+from app import schemas, auth, refresh_tokens
 from app.database import get_async_session
 from app.config import settings
 
@@ -31,10 +39,66 @@ async def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    refresh_token = None
+    if settings.REFRESH_TOKEN_ENABLED:
+        refresh_token = refresh_tokens.issue(db, user.id)
+        await db.commit()
+    return token_response(user.id, refresh_token)
+
+
+def token_response(user_id: int, refresh_token: Optional[str]) -> dict:
     access_token_expires = timedelta(
         minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
     )
     access_token = auth.create_access_token(
-        data={"sub": str(user.id)}, expires_delta=access_token_expires
+        data={"sub": str(user_id)}, expires_delta=access_token_expires
     )
-    return {"access_token": access_token, "token_type": "bearer"}
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "refresh_token": refresh_token,
+    }
+
+
+async def read_refresh_token(request: Request) -> str:
+    form_data = await request.form()
+    refresh_token = form_data.get("refresh_token")
+    if not refresh_token:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="refresh_token is required",
+        )
+    return refresh_token
+
+
+@router.post("/token/refresh", response_model=schemas.Token)
+async def refresh_access_token(
+    refresh_token: str = Depends(read_refresh_token),
+    db: AsyncSession = Depends(get_async_session),
+):
+    """Новая пара токенов по refresh-токену, без проверки пароля;
+    предъявленный токен больше не действует"""
+    if not settings.REFRESH_TOKEN_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Refresh tokens are disabled",
+        )
+    try:
+        user_id, new_token = await refresh_tokens.rotate(db, refresh_token)
+    except refresh_tokens.RefreshTokenError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return token_response(user_id, new_token)
+
+
+@router.post("/token/revoke", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_refresh_token(
+    refresh_token: str = Depends(read_refresh_token),
+    db: AsyncSession = Depends(get_async_session),
+):
+    """Выход: отзывает всё семейство токена; неизвестный токен не ошибка"""
+    await refresh_tokens.revoke(db, refresh_token)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
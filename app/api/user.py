@@ -1,34 +1,131 @@
-from fastapi import APIRouter, Depends
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Optional
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import schemas, auth, models
-from app.database import get_async_session
+from app.account_cache import account_cache
+from app.money import to_cents, to_decimal
+from app.pagination import decode_cursor, page_limit, paginate
+from app.responses import FastJSONResponse, rows_response, schema_columns
 
 router = APIRouter()
 
 
 @router.get("/me", response_model=schemas.User)
 async def read_users_me(
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: schemas.User = Depends(auth.get_current_user),
 ):
     return current_user
 
 
 @router.get("/me/accounts", response_model=list[schemas.Account])
 async def read_user_accounts(
-    current_user: models.User = Depends(auth.get_current_user),
-    db: AsyncSession = Depends(get_async_session),
+    request: Request,
+    current_user: schemas.User = Depends(auth.get_current_user),
 ):
-    accounts = await models.Account.get_user_accounts(db, current_user.id)
-    return accounts
+    """Счета пользователя; повторные запросы отдаются из кэша счетов"""
+    accounts = await account_cache.get(current_user.id)
+    if accounts is not None:
+        return FastJSONResponse(accounts)
+
+    version = account_cache.version(current_user.id)
+    async with await auth.open_user_read_session(
+        request, current_user
+    ) as db:
+        rows = await models.Account.get_user_accounts(
+            db,
+            current_user.id,
+            columns=schema_columns(models.Account, schemas.Account),
+        )
+    response = rows_response(rows, schemas.Account)
+    # В кэше — значения в том виде, в каком они уходят в JSON
+    await account_cache.fill(
+        current_user.id, orjson.loads(response.body), version
+    )
+    return response
 
 
 @router.get("/me/transactions", response_model=list[schemas.Transaction])
 async def read_user_transactions(
-    current_user: models.User = Depends(auth.get_current_user),
-    db: AsyncSession = Depends(get_async_session),
+    limit: int = Depends(page_limit),
+    cursor: Optional[str] = Query(None),
+    date_from: Optional[datetime] = Query(None),
+    date_to: Optional[datetime] = Query(None),
+    account_id: Optional[int] = Query(None),
+    amount_min: Optional[Decimal] = Query(None),
+    amount_max: Optional[Decimal] = Query(None),
+    current_user: schemas.User = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(auth.get_user_read_session),
 ):
+    """Транзакции пользователя по (created_at, id); курсор следующей
+    страницы возвращается в заголовке X-Next-Cursor"""
+    after = decode_cursor(cursor, datetime, int) if cursor else None
     transactions = await models.Transaction.get_user_transactions(
-        db, current_user.id
+        db,
+        current_user.id,
+        limit=limit + 1,
+        after=after,
+        date_from=date_from,
+        date_to=date_to,
+        account_id=account_id,
+        amount_min_cents=(
+            to_cents(amount_min) if amount_min is not None else None
+        ),
+        amount_max_cents=(
+            to_cents(amount_max) if amount_max is not None else None
+        ),
+        columns=schema_columns(models.Transaction, schemas.Transaction),
+    )
+    transactions, headers = paginate(
+        transactions, limit, key=lambda t: (t.created_at, t.id)
+    )
+    return rows_response(transactions, schemas.Transaction, headers)
+
+
+@router.get(
+    "/me/accounts/{account_id}/summary", response_model=schemas.AccountSummary
+)
+async def read_account_summary(
+    account_id: int,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    current_user: schemas.User = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(auth.get_user_read_session),
+):
+    """Зачисления по счёту за дни [from, to] (UTC) из суточных итогов;
+    по умолчанию с начала текущего месяца по сегодня"""
+    owners = await models.Account.get_owners(db, {account_id})
+    if owners.get(account_id) != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Account not found"
+        )
+    date_to = date_to or datetime.now(timezone.utc).date()
+    date_from = date_from or date_to.replace(day=1)
+    if date_from > date_to:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="'from' must not be after 'to'",
+        )
+
+    days = await models.AccountDailyTotal.get_days(
+        db, account_id, date_from, date_to
     )
-    return transactions
+    return {
+        "account_id": account_id,
+        "date_from": date_from,
+        "date_to": date_to,
+        "credit_count": sum(day.credit_count for day in days),
+        "total": to_decimal(sum(day.total_cents for day in days)),
+        "days": [
+            {
+                "day": day.day,
+                "credit_count": day.credit_count,
+                "total": to_decimal(day.total_cents),
+            }
+            for day in days
+        ],
+    }
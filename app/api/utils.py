@@ -1,7 +1,7 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, status
 from uuid import uuid4
-from app.config import settings
-from app.security import generate_signature
+from app.money import to_cents
+from app.security import webhook_signer
 
 router = APIRouter()
 
@@ -14,13 +14,19 @@ async def generate_uuid():
 
 @router.post("/signature-check")
 async def debug_signature(data: dict):
+    try:
+        amount_cents = to_cents(float(data["amount"]))
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Invalid data format: {str(e)}",
+        )
     return {
-        "generated": generate_signature(
+        "generated": webhook_signer.sign(
             account_id=data["account_id"],
-            amount=data["amount"],
+            amount_cents=amount_cents,
             transaction_id=data["transaction_id"],
             user_id=data["user_id"],
-            secret_key=settings.SECRET_KEY,
         ),
         "input_data": data,
     }
@@ -1,114 +1,269 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from decimal import Decimal, InvalidOperation
+from decimal import InvalidOperation
 from uuid import UUID
-from sqlalchemy.future import select
-from app import models, schemas
+from app import idempotency, models, payments, schemas
+from app.money import format_cents, to_cents
+from app.account_cache import account_cache
+from app.metrics import StageTimer, webhook_outcomes, webhook_stage_latency
+from app.coalescer import credit_coalescer
+from app.idempotency import idempotency_cache
+from app.intake import intake_log
 from app.config import settings
-from app.database import get_async_session
-from app.security import generate_signature
+from app.database import get_async_session, mark_written
+from app.security import webhook_signer
 
 router = APIRouter()
 
 
+def normalize_payment(data: schemas.WebhookData) -> tuple[int, str]:
+    """Перевести сумму в копейки и проверить формат UUID транзакции."""
+    amount_cents = to_cents(data.amount)
+    transaction_id = str(UUID(str(data.transaction_id)))
+    return amount_cents, transaction_id
+
+
 @router.post("/payment")
 async def handle_webhook(
     data: schemas.WebhookData,
+    response: Response,
     session: AsyncSession = Depends(get_async_session),
 ):
     """Обработчик входящих платежей с проверкой подписи и обработкой транзакций"""
+    timer = StageTimer(webhook_stage_latency)
 
     # 1. Проверка и нормализация данных
     try:
-        amount = Decimal(str(data.amount)).quantize(Decimal("0.00"))
-        transaction_id = str(UUID(str(data.transaction_id)))  # Валидация UUID
+        amount_cents, transaction_id = normalize_payment(data)
     except (InvalidOperation, ValueError) as e:
+        webhook_outcomes.inc(payments.INVALID_DATA)
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             detail=f"Invalid data format: {str(e)}",
         )
+    timer.mark("normalize")
 
-    # 2. Генерация и проверка подписи
-    expected_sig = generate_signature(
+    # 2. Проверка подписи (за постоянное время, любым активным ключом)
+    if not webhook_signer.verify(
+        data.signature,
         account_id=data.account_id,
-        amount=float(amount),  # Передаем float для совместимости
+        amount_cents=amount_cents,
         transaction_id=transaction_id,
         user_id=data.user_id,
-        secret_key=settings.SECRET_KEY,
-    )
-
-    if data.signature != expected_sig:
-        # logger.error(
-        #     f"Signature mismatch for transaction {transaction_id}\n"
-        #     f"Expected: {expected_sig}\n"
-        #     f"Received: {data.signature}\n"
-        #     f"Data: {data.dict()}"
-        # )
+    ):
+        timer.mark("signature")
+        webhook_outcomes.inc(payments.INVALID_SIGNATURE)
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail={
                 "error": "Invalid signature",
-                "expected": expected_sig,
                 "received": data.signature,
                 "hint": "Check if secret keys match and data formats are identical",
             },
         )
 
-    # 3. Проверка существования транзакции
-    if await session.scalar(
-        select(models.Transaction).where(
-            models.Transaction.transaction_id == transaction_id
-        )
-    ):
+    timer.mark("signature")
+
+    # 3. Повторы из кэша отклоняем без обращения к БД; в БД идём только
+    # если фильтр Блума допускает, что платёж уже был (в режиме приёма
+    # не идём: повтор отсеет перенос журнала в БД)
+    seen = idempotency_cache.check(transaction_id)
+    if seen == idempotency.MAYBE and not settings.INTAKE_ENABLED:
+        if await models.Transaction.exists(session, transaction_id):
+            seen = idempotency.DUPLICATE
+            idempotency_cache.add(transaction_id)
+        else:
+            idempotency_cache.record_false_positive()
+    timer.mark("dedup")
+    if seen == idempotency.DUPLICATE:
+        webhook_outcomes.inc(payments.DUPLICATE)
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="Transaction already processed",
         )
 
-    # 4. Проверка пользователя
-    if not await session.get(models.User, data.user_id):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
-        )
-
-    # 5. Получение или создание счета
-    account = await session.scalar(
-        select(models.Account).where(
-            models.Account.id == data.account_id,
-            models.Account.user_id == data.user_id,
-        )
+    # 4. Дедупликация, проверка пользователя, создание счёта и пополнение
+    # баланса одним запросом
+    credit = payments.Credit(
+        transaction_id=transaction_id,
+        user_id=data.user_id,
+        account_id=data.account_id,
+        amount_cents=amount_cents,
     )
 
-    if not account:
-        account = models.Account(
-            id=data.account_id, user_id=data.user_id, balance=Decimal("0.00")
-        )
-        session.add(account)
+    # 4а. Режим приёма: подтверждаем платёж, как только он записан в журнал.
+    # 202 значит «принят к обработке», а не «зачислен»: пользователь и
+    # владелец счёта проверяются при переносе в БД, отказы попадают в
+    # INTAKE_LOG_PATH.dead (GET /admin/intake/dead-letters)
+    if settings.INTAKE_ENABLED:
+        try:
+            await intake_log.append(credit)
+        except Exception:
+            timer.mark("intake")
+            webhook_outcomes.inc("error")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Payment intake is unavailable",
+            )
+        timer.mark("intake")
+        webhook_outcomes.inc("accepted")
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {
+            "status": "accepted",
+            "transaction_id": transaction_id,
+            "account_id": data.account_id,
+        }
 
-    # 6. Обновление баланса и создание транзакции
     try:
-        account.balance += amount
-
-        transaction = models.Transaction(
-            transaction_id=transaction_id,
-            user_id=data.user_id,
-            account_id=account.id,
-            amount=amount,
-        )
-        session.add(transaction)
-
-        await session.commit()
+        if settings.WEBHOOK_COALESCE_ENABLED:
+            result = await credit_coalescer.submit(credit)
+        else:
+            result = await payments.credit_account(session, credit)
     except Exception as e:
         await session.rollback()
+        timer.mark("credit")
+        webhook_outcomes.inc("error")
         # logger.exception("Database transaction failed")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Transaction processing failed",
         )
 
+    timer.mark("credit")
+    webhook_outcomes.inc(result.status)
+
+    if result.status in (payments.SUCCESS, payments.DUPLICATE):
+        idempotency_cache.add(transaction_id)
+    if result.status == payments.SUCCESS:
+        mark_written(data.user_id)
+        await account_cache.credit(
+            data.user_id, result.account_id, result.new_balance_cents
+        )
+    if result.status == payments.DUPLICATE:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Transaction already processed",
+        )
+    if result.status == payments.USER_NOT_FOUND:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        )
+    if result.status != payments.SUCCESS:
+        # Счёт с таким id принадлежит другому пользователю
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Transaction processing failed",
+        )
+
     return {
         "status": "success",
-        "new_balance": str(account.balance),
+        "new_balance": format_cents(result.new_balance_cents),
         "transaction_id": transaction_id,
-        "account_id": account.id,
+        "account_id": result.account_id,
+    }
+
+
+@router.post("/payments/batch", response_model=schemas.WebhookBatchResult)
+async def handle_webhook_batch(
+    data: list[schemas.WebhookData],
+    session: AsyncSession = Depends(get_async_session),
+):
+    """Пакетная обработка платежей: проверка подписей и одна фиксация"""
+    if len(data) > settings.WEBHOOK_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=(
+                f"Batch is limited to "
+                f"{settings.WEBHOOK_BATCH_MAX_ITEMS} payments"
+            ),
+        )
+
+    results = [None] * len(data)
+    normalized = []
+    for i, item in enumerate(data):
+        try:
+            amount_cents, transaction_id = normalize_payment(item)
+        except (InvalidOperation, ValueError):
+            webhook_outcomes.inc(payments.INVALID_DATA)
+            results[i] = payments.CreditResult(
+                item.transaction_id, payments.INVALID_DATA, item.account_id
+            )
+            continue
+        normalized.append((i, item, amount_cents, transaction_id))
+
+    valid = webhook_signer.verify_batch(
+        (
+            item.signature,
+            item.account_id,
+            amount_cents,
+            transaction_id,
+            item.user_id,
+        )
+        for _, item, amount_cents, transaction_id in normalized
+    )
+
+    credits, positions = [], []
+    for (i, item, amount_cents, transaction_id), signed in zip(
+        normalized, valid
+    ):
+        if not signed:
+            webhook_outcomes.inc(payments.INVALID_SIGNATURE)
+            results[i] = payments.CreditResult(
+                transaction_id, payments.INVALID_SIGNATURE, item.account_id
+            )
+            continue
+
+        if idempotency_cache.check(transaction_id) == idempotency.DUPLICATE:
+            webhook_outcomes.inc(payments.DUPLICATE)
+            results[i] = payments.CreditResult(
+                transaction_id, payments.DUPLICATE, item.account_id
+            )
+            continue
+
+        credits.append(
+            payments.Credit(
+                transaction_id=transaction_id,
+                user_id=item.user_id,
+                account_id=item.account_id,
+                amount_cents=amount_cents,
+            )
+        )
+        positions.append(i)
+
+    if credits:
+        try:
+            applied = await payments.apply_credits(session, credits)
+        except Exception:
+            webhook_outcomes.inc("error", amount=len(credits))
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Transaction processing failed",
+            )
+        for i, result in zip(positions, applied):
+            results[i] = result
+            webhook_outcomes.inc(result.status)
+            if result.status in (payments.SUCCESS, payments.DUPLICATE):
+                idempotency_cache.add(result.transaction_id)
+            if result.status == payments.SUCCESS:
+                mark_written(data[i].user_id)
+                await account_cache.credit(
+                    data[i].user_id,
+                    result.account_id,
+                    result.new_balance_cents,
+                )
+
+    return {
+        "results": [
+            {
+                "transaction_id": result.transaction_id,
+                "status": result.status,
+                "account_id": result.account_id,
+                "new_balance": (
+                    format_cents(result.new_balance_cents)
+                    if result.new_balance_cents is not None
+                    else None
+                ),
+            }
+            for result in results
+        ]
     }
@@ -1,18 +1,24 @@
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import models, schemas
-from app.database import get_async_session
+from app.cache import TTLCache
+from app.database import (
+    SessionLocal,
+    open_read_session,
+    recent_writes,
+    wants_primary,
+)
 from app.config import settings
+from app.hashing import password_hasher
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
@@ -20,23 +26,96 @@ if not settings.SECRET_KEY or not settings.ALGORITHM:
     raise RuntimeError("Missing SECRET_KEY or ALGORITHM in environment")
 
 
-def verify_password(plain_password: str, hashed_password: str):
-    """Verify a plain password against a hashed password."""
-    return pwd_context.verify(plain_password, hashed_password)
-
-
-def get_password_hash(password: str):
-    """Hash a password using bcrypt."""
-    return pwd_context.hash(password)
+class PrincipalCache:
+    """
+    Per-worker cache of authenticated principals keyed by access token.
+
+    An entry lives until AUTH_CACHE_TTL or the token expiry, whichever
+    comes first. Other workers only see admin changes after their own
+    entries expire.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.tokens = TTLCache(maxsize, ttl, on_evict=self._forget)
+        # Токены каждого пользователя в кэше; вытесненные сразу убираются
+        self.by_user: dict[int, set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[schemas.User]:
+        principal = self.tokens.get(token)
+        if principal is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return principal
+
+    def set(
+        self,
+        token: str,
+        principal: schemas.User,
+        expires_at: Optional[float] = None,
+    ):
+        ttl = None if expires_at is None else expires_at - time.time()
+        self.tokens.set(token, principal, ttl=ttl)
+        if token in self.tokens:
+            self.by_user.setdefault(principal.id, set()).add(token)
+
+    def _forget(self, token: str, principal: schemas.User):
+        tokens = self.by_user.get(principal.id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self.by_user[principal.id]
+
+    def invalidate_user(self, user_id: int):
+        for token in self.by_user.pop(user_id, ()):
+            self.tokens.pop(token)
+
+    def clear(self):
+        self.tokens.clear()
+        self.by_user.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.tokens),
+            "max_entries": self.tokens.maxsize,
+            "ttl": self.tokens.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+principal_cache = PrincipalCache(
+    maxsize=settings.AUTH_CACHE_SIZE, ttl=settings.AUTH_CACHE_TTL
+)
+
+
+async def hash_password(password: str) -> str:
+    """Hash a password on the hashing pool without blocking the loop."""
+    return await password_hasher.hash(password)
 
 
 async def authenticate_user(
     email: str, password: str, db: AsyncSession
 ) -> Optional[models.User]:
-    """Authenticate a user by email and password."""
+    """Authenticate a user by email and password.
+
+    A hash made with an outdated bcrypt cost is replaced on success.
+    """
     user = await models.User.get_by_email(db, email)
-    if not user or not verify_password(password, user.hashed_password):
+    if not user:
         return None
+    valid, new_hash = await password_hasher.verify(
+        password, user.hashed_password
+    )
+    if not valid:
+        return None
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
     return user
 
 
@@ -55,9 +134,16 @@ def create_access_token(
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: AsyncSession = Depends(get_async_session),
-) -> models.User:
-    """Get the current user from the JWT token."""
+) -> schemas.User:
+    """Get the current user from the JWT token.
+
+    The database session is opened only on a principal cache miss, so a
+    cached request does not take a connection for authentication.
+    """
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -74,15 +160,19 @@ async def get_current_user(
     except (JWTError, ValueError):
         raise credentials_exception
 
-    user = await models.User.get_by_id(db, user_id=token_data.user_id)
+    async with SessionLocal() as db:
+        user = await models.User.get_by_id(db, user_id=token_data.user_id)
     if user is None:
         raise credentials_exception
-    return user
+
+    principal = schemas.User.model_validate(user)
+    principal_cache.set(token, principal, expires_at=payload.get("exp"))
+    return principal
 
 
 async def get_current_admin(
-    current_user: models.User = Depends(get_current_user),
-) -> models.User:
+    current_user: schemas.User = Depends(get_current_user),
+) -> schemas.User:
     """Get the current admin user."""
     if not current_user.is_admin:
         raise HTTPException(
@@ -90,3 +180,26 @@ async def get_current_admin(
             detail="Not enough permissions",
         )
     return current_user
+
+
+async def open_user_read_session(
+    request: Request, current_user: schemas.User
+) -> AsyncSession:
+    """
+    Read-only session for the current user's own data: a replica, unless
+    a webhook credited this user within READ_YOUR_WRITES_SECONDS (the
+    replica may not have the payment yet) or the client asks for primary.
+    """
+    primary = wants_primary(request) or current_user.id in recent_writes
+    return await open_read_session(primary=primary)
+
+
+async def get_user_read_session(
+    request: Request,
+    current_user: schemas.User = Depends(get_current_user),
+):
+    session = await open_user_read_session(request, current_user)
+    try:
+        yield session
+    finally:
+        await session.close()
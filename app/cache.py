@@ -0,0 +1,98 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class LRUCache:
+    """
+    Bounded mapping that evicts the least recently used key.
+
+    `on_evict(key, value)` is called for entries the cache drops on its
+    own, not for `pop` or `clear`.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+    ):
+        self.maxsize = max(maxsize, 0)
+        self.on_evict = on_evict
+        self._data: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            return default
+        return self._data[key]
+
+    def set(self, key: Hashable, value: Any = True):
+        if not self.maxsize:
+            return
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._evicted(*self._data.popitem(last=False))
+
+    def _evicted(self, key: Hashable, entry: Any):
+        if self.on_evict is not None:
+            self.on_evict(key, entry)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        return self._data.pop(key, default)
+
+    def keys(self) -> list:
+        return list(self._data)
+
+    def clear(self):
+        self._data.clear()
+
+
+class TTLCache(LRUCache):
+    """LRU cache whose entries also expire after a time-to-live."""
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+    ):
+        super().__init__(maxsize, on_evict)
+        self.ttl = ttl
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = super().get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self._data.pop(key, None)
+            self._evicted(key, entry)
+            return default
+        return value
+
+    def set(self, key: Hashable, value: Any = True, ttl: float = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        super().set(key, (time.monotonic() + ttl, value))
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def _evicted(self, key: Hashable, entry: Any):
+        super()._evicted(key, entry[1])
+
+
+_MISSING = object()
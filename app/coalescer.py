@@ -0,0 +1,83 @@
+import asyncio
+from typing import Optional
+
+from app import payments
+from app.config import settings
+from app.database import SessionLocal
+
+
+class _PendingBatch:
+    def __init__(self):
+        self.items: list[tuple[payments.Credit, asyncio.Future]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class CreditCoalescer:
+    """
+    Gather concurrent credits to the same account into one write.
+
+    The first credit for an account opens a batch that is flushed after
+    `window` seconds or as soon as it holds `max_items` credits. A flush
+    is one `payments.apply_credits` call, i.e. one balance UPDATE and one
+    multi-row transactions INSERT, and every waiter gets its own result.
+    """
+
+    def __init__(self, session_factory, window: float, max_items: int):
+        self.session_factory = session_factory
+        self.window = window
+        self.max_items = max(max_items, 1)
+        self._pending: dict[int, _PendingBatch] = {}
+        self._writes: set[asyncio.Task] = set()
+
+    async def submit(self, credit: payments.Credit) -> payments.CreditResult:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        batch = self._pending.get(credit.account_id)
+        if batch is None:
+            batch = self._pending[credit.account_id] = _PendingBatch()
+            batch.timer = loop.call_later(
+                self.window, self._flush, credit.account_id
+            )
+        batch.items.append((credit, future))
+        if len(batch.items) >= self.max_items:
+            self._flush(credit.account_id)
+
+        return await future
+
+    def _flush(self, account_id: int):
+        batch = self._pending.pop(account_id, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        task = asyncio.ensure_future(self._write(batch.items))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def _write(self, items):
+        credits = [credit for credit, _ in items]
+        try:
+            async with self.session_factory() as session:
+                results = await payments.apply_credits(session, credits)
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(items, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def drain(self):
+        """Flush every open batch and wait for in-flight writes."""
+        for account_id in list(self._pending):
+            self._flush(account_id)
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+
+
+credit_coalescer = CreditCoalescer(
+    SessionLocal,
+    window=settings.WEBHOOK_COALESCE_WINDOW_MS / 1000,
+    max_items=settings.WEBHOOK_COALESCE_MAX_ITEMS,
+)
@@ -4,15 +4,183 @@ from dotenv import load_dotenv
 load_dotenv(override=True)
 
 
+def _getbool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
 class Settings:
     SECRET_KEY = os.getenv("SECRET_KEY")
+    # Ключи подписи вебхуков через запятую: первым подписываем, любым из
+    # списка принимаем (ротация без простоя); по умолчанию SECRET_KEY
+    WEBHOOK_SECRET_KEYS: list[str] = [
+        key.strip()
+        for key in os.getenv("WEBHOOK_SECRET_KEYS", "").split(",")
+        if key.strip()
+    ] or [SECRET_KEY]
     ALGORITHM = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(
         os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30)
     )
+    # Ротируемые refresh-токены: /token/refresh выдаёт новую пару без
+    # проверки пароля; срок жизни считается от последнего обновления
+    REFRESH_TOKEN_ENABLED: bool = _getbool("REFRESH_TOKEN_ENABLED", True)
+    REFRESH_TOKEN_EXPIRE_DAYS: float = float(
+        os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 30)
+    )
+    # Кэш проверенных токенов доступа (AUTH_CACHE_SIZE=0 отключает)
+    AUTH_CACHE_SIZE: int = int(os.getenv("AUTH_CACHE_SIZE", 10_000))
+    AUTH_CACHE_TTL: float = float(os.getenv("AUTH_CACHE_TTL", 60))
+    # Стоимость bcrypt и пул, на котором считаются хэши паролей
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", 12))
+    PASSWORD_HASH_WORKERS: int = int(
+        os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1))
+    )
+    PASSWORD_HASH_EXECUTOR: str = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+    # Массовый импорт пользователей: свой пул процессов для bcrypt, размер
+    # пакета вставки и ограничения на тело запроса
+    BULK_IMPORT_HASH_WORKERS: int = int(
+        os.getenv("BULK_IMPORT_HASH_WORKERS", os.cpu_count() or 1)
+    )
+    BULK_IMPORT_CHUNK_SIZE: int = int(os.getenv("BULK_IMPORT_CHUNK_SIZE", 500))
+    BULK_IMPORT_MAX_LINE: int = int(os.getenv("BULK_IMPORT_MAX_LINE", 65536))
+    BULK_IMPORT_MAX_ERRORS: int = int(
+        os.getenv("BULK_IMPORT_MAX_ERRORS", 1000)
+    )
+    # Боевой запуск (python -m app.serve): число воркеров, цикл событий и
+    # HTTP-парсер uvicorn, перезапуск воркера после N запросов, время на
+    # завершение текущих запросов при SIGTERM
+    SERVER_HOST: str = os.getenv("SERVER_HOST", "0.0.0.0")
+    SERVER_PORT: int = int(os.getenv("SERVER_PORT", 8000))
+    SERVER_WORKERS: int = int(
+        os.getenv("SERVER_WORKERS", os.cpu_count() or 1)
+    )
+    SERVER_LOOP: str = os.getenv("SERVER_LOOP", "auto")
+    SERVER_HTTP: str = os.getenv("SERVER_HTTP", "auto")
+    SERVER_MAX_REQUESTS: int = int(os.getenv("SERVER_MAX_REQUESTS", 0))
+    SERVER_MAX_REQUESTS_JITTER: int = int(
+        os.getenv("SERVER_MAX_REQUESTS_JITTER", 0)
+    )
+    SERVER_GRACEFUL_TIMEOUT: int = int(
+        os.getenv("SERVER_GRACEFUL_TIMEOUT", 30)
+    )
+    SERVER_ACCESS_LOG: bool = _getbool("SERVER_ACCESS_LOG", False)
     DATABASE_URL: str = os.getenv(
         "DATABASE_URL", "sqlite+aiosqlite:///./test.db"
     )
+    # Реплики для чтения через запятую (пусто: всё читается из основной
+    # БД); недоступная реплика пропускается DB_REPLICA_RETRY_SECONDS
+    DATABASE_REPLICA_URLS: list[str] = [
+        url.strip()
+        for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",")
+        if url.strip()
+    ]
+    DB_REPLICA_RETRY_SECONDS: float = float(
+        os.getenv("DB_REPLICA_RETRY_SECONDS", 30)
+    )
+    DB_REPLICA_CONNECT_TIMEOUT: float = float(
+        os.getenv("DB_REPLICA_CONNECT_TIMEOUT", 2)
+    )
+    # Сколько секунд после зачисления чтения пользователя идут в основную
+    # БД (READ_YOUR_WRITES_SECONDS=0 отключает)
+    READ_YOUR_WRITES_SECONDS: float = float(
+        os.getenv("READ_YOUR_WRITES_SECONDS", 10)
+    )
+    READ_YOUR_WRITES_MAX_USERS: int = int(
+        os.getenv("READ_YOUR_WRITES_MAX_USERS", 100_000)
+    )
+    # Пул соединений; DB_POOL_SIZE=0 отключает пул (NullPool)
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 5))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    DB_POOL_PRE_PING: bool = _getbool("DB_POOL_PRE_PING", True)
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", 30))
+    DB_ECHO: bool = _getbool("DB_ECHO", False)
+    # Журнал медленных запросов и заголовки X-DB-Queries / X-DB-Time
+    DB_SLOW_QUERY_MS: float = float(os.getenv("DB_SLOW_QUERY_MS", 200))
+    DB_QUERY_HEADERS: bool = _getbool("DB_QUERY_HEADERS", False)
+    # Замер задержек по маршрутам для /metrics
+    METRICS_ENABLED: bool = _getbool("METRICS_ENABLED", True)
+    # Кэш счетов пользователя для /users/me/accounts: backend "memory"
+    # (в памяти воркера) или "модуль:фабрика" общего хранилища
+    ACCOUNT_CACHE_ENABLED: bool = _getbool("ACCOUNT_CACHE_ENABLED", True)
+    ACCOUNT_CACHE_SIZE: int = int(os.getenv("ACCOUNT_CACHE_SIZE", 10_000))
+    ACCOUNT_CACHE_TTL: float = float(os.getenv("ACCOUNT_CACHE_TTL", 30))
+    ACCOUNT_CACHE_BACKEND: str = os.getenv("ACCOUNT_CACHE_BACKEND", "memory")
+    # Размер страницы для списков (пагинация по курсору)
+    PAGE_SIZE_DEFAULT: int = int(os.getenv("PAGE_SIZE_DEFAULT", 100))
+    PAGE_SIZE_MAX: int = int(os.getenv("PAGE_SIZE_MAX", 1000))
+    # Строк за одно чтение курсора при выгрузке транзакций
+    EXPORT_BATCH_SIZE: int = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+    WEBHOOK_BATCH_MAX_ITEMS: int = int(
+        os.getenv("WEBHOOK_BATCH_MAX_ITEMS", 1000)
+    )
+    # Допуск запросов к вебхуку (по умолчанию выкл.): ведро токенов на
+    # источник (запросов в секунду и всплеск; 0 отключает) и предел
+    # одновременно обрабатываемых запросов; при 0 запрос отклоняется,
+    # только когда все соединения пула заняты и их уже ждут
+    # ADMISSION_MAX_POOL_WAITERS запросов (по умолчанию ёмкость пула)
+    ADMISSION_ENABLED: bool = _getbool("ADMISSION_ENABLED", False)
+    ADMISSION_RATE: float = float(os.getenv("ADMISSION_RATE", 100))
+    ADMISSION_BURST: float = float(os.getenv("ADMISSION_BURST", 200))
+    ADMISSION_MAX_IN_FLIGHT: int = int(
+        os.getenv("ADMISSION_MAX_IN_FLIGHT", 0)
+    )
+    ADMISSION_MAX_POOL_WAITERS: int = int(
+        os.getenv(
+            "ADMISSION_MAX_POOL_WAITERS",
+            max(DB_POOL_SIZE, 0) + max(DB_MAX_OVERFLOW, 0),
+        )
+    )
+    ADMISSION_MAX_SOURCES: int = int(
+        os.getenv("ADMISSION_MAX_SOURCES", 10_000)
+    )
+    ADMISSION_SOURCE_HEADER: str = os.getenv("ADMISSION_SOURCE_HEADER", "")
+    ADMISSION_RETRY_AFTER: float = float(
+        os.getenv("ADMISSION_RETRY_AFTER", 1)
+    )
+    # Объединение параллельных зачислений на один счёт (по умолчанию выкл.)
+    WEBHOOK_COALESCE_ENABLED: bool = _getbool(
+        "WEBHOOK_COALESCE_ENABLED", False
+    )
+    WEBHOOK_COALESCE_WINDOW_MS: float = float(
+        os.getenv("WEBHOOK_COALESCE_WINDOW_MS", 5)
+    )
+    WEBHOOK_COALESCE_MAX_ITEMS: int = int(
+        os.getenv("WEBHOOK_COALESCE_MAX_ITEMS", 100)
+    )
+    # Режим приёма: платежи пишутся в локальный журнал и переносятся в БД
+    # фоновым процессом (по умолчанию выкл.)
+    INTAKE_ENABLED: bool = _getbool("INTAKE_ENABLED", False)
+    INTAKE_LOG_PATH: str = os.getenv("INTAKE_LOG_PATH", "./data/intake.log")
+    INTAKE_FSYNC_WINDOW_MS: float = float(
+        os.getenv("INTAKE_FSYNC_WINDOW_MS", 0)
+    )
+    INTAKE_APPLY_BATCH: int = int(os.getenv("INTAKE_APPLY_BATCH", 500))
+    INTAKE_COMPACT_BYTES: int = int(
+        os.getenv("INTAKE_COMPACT_BYTES", 64 * 1024 * 1024)
+    )
+    # Пакет, не перенесённый за столько попыток (кроме ошибок соединения),
+    # переносится по одной записи; непереносимые уходят в INTAKE_LOG_PATH.dead
+    INTAKE_MAX_ATTEMPTS: int = int(os.getenv("INTAKE_MAX_ATTEMPTS", 5))
+    # Кэш недавно обработанных transaction_id (LRU + фильтр Блума)
+    IDEMPOTENCY_CACHE_ENABLED: bool = _getbool(
+        "IDEMPOTENCY_CACHE_ENABLED", True
+    )
+    IDEMPOTENCY_CACHE_SIZE: int = int(
+        os.getenv("IDEMPOTENCY_CACHE_SIZE", 100_000)
+    )
+    IDEMPOTENCY_BLOOM_BITS: int = int(
+        os.getenv("IDEMPOTENCY_BLOOM_BITS", 8 * 1024 * 1024)
+    )
+    IDEMPOTENCY_BLOOM_HASHES: int = int(
+        os.getenv("IDEMPOTENCY_BLOOM_HASHES", 7)
+    )
+    IDEMPOTENCY_WARMUP_ROWS: int = int(
+        os.getenv("IDEMPOTENCY_WARMUP_ROWS", 10_000)
+    )
 
 
 settings = Settings()
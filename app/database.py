@@ -1,13 +1,20 @@
 from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
     AsyncSession,
     create_async_engine,
     async_sessionmaker,
 )
-from sqlalchemy.pool import NullPool
+from fastapi import Request
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+from app import querylog
+from app.cache import TTLCache
 from app.config import settings
 import asyncio
-import atexit
 import platform
+import time
+from typing import Optional
 
 
 if platform.system() == "Windows":
@@ -18,33 +25,313 @@ DATABASE_URL = settings.DATABASE_URL
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL is not set in the environment")
 
-# Создаем engine с явным указанием параметров для Windows
-engine = create_async_engine(
-    DATABASE_URL,
-    echo=True,
-    future=True,
-    poolclass=NullPool,
-    connect_args={
-        "server_settings": {
-            "client_encoding": "utf8",
-            "application_name": "fastapi_app",
+READ_CONSISTENCY_HEADER = "X-Read-Consistency"
+
+
+class PoolWaitStats:
+    """Accumulated time spent waiting for a pooled connection."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.acquired = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait: float):
+        self.acquired += 1
+        self.total_wait += wait
+        if wait > self.max_wait:
+            self.max_wait = wait
+
+    def as_dict(self) -> dict:
+        return {
+            "acquired": self.acquired,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": (
+                self.total_wait / self.acquired * 1000
+                if self.acquired
+                else 0.0
+            ),
+            "max_wait_ms": self.max_wait * 1000,
+            "total_wait_ms": self.total_wait * 1000,
         }
-    },
-)
 
 
-# Функция для корректного закрытия соединений при завершении
+pool_wait_stats = PoolWaitStats()
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that records how long each checkout waited and counts the
+    checkouts blocked right now on a connection to be returned.
+    """
+
+    _waiting = 0
+
+    def waiting(self) -> int:
+        return self._waiting
+
+    def _do_get(self):
+        start = time.perf_counter()
+        # Открытие нового соединения (overflow) ожиданием не считается
+        blocked = (
+            self.checkedin() == 0 and self.overflow() >= self._max_overflow
+        )
+        self._waiting += blocked
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_wait_stats.timeouts += 1
+            raise
+        finally:
+            self._waiting -= blocked
+        pool_wait_stats.record(time.perf_counter() - start)
+        return connection
+
+
+def _pool_options() -> dict:
+    if settings.DB_POOL_SIZE <= 0:
+        return {"poolclass": NullPool}
+    return {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+    }
+
+
+def _create_engine(url: str, **connect_args) -> AsyncEngine:
+    server_settings = connect_args.pop("server_settings", {})
+    # Создаем engine с явным указанием параметров для Windows
+    engine = create_async_engine(
+        url,
+        echo=settings.DB_ECHO,
+        future=True,
+        **_pool_options(),
+        connect_args={
+            "server_settings": {
+                "client_encoding": "utf8",
+                "application_name": "fastapi_app",
+                **server_settings,
+            },
+            **connect_args,
+        },
+    )
+    # Счётчики и время SQL-запросов по запросам API, журнал медленных
+    # запросов
+    querylog.install(engine)
+    return engine
+
+
+_engine: Optional[AsyncEngine] = None
+
+
+def get_engine() -> AsyncEngine:
+    """
+    The process-wide engine, created on first use.
+
+    The lifespan handler creates it at startup; building it (and loading
+    the asyncpg dialect) is kept out of import so the app module imports
+    fast and CLI tools that never touch the database do not pay for it.
+    """
+    global _engine
+    if _engine is None:
+        _engine = _create_engine(DATABASE_URL)
+    return _engine
+
+
+def __getattr__(name: str):
+    # `from app.database import engine` по-прежнему работает
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Соединения закрываются при остановке приложения (lifespan); у каждого
+# воркера свой engine, созданный уже в его процессе
 async def dispose_engine():
-    await engine.dispose()
+    if _engine is not None:
+        await _engine.dispose()
+    await replicas.dispose()
+
+
+class LazySessionMaker(async_sessionmaker):
+    """Session factory that binds itself to `get_engine()` on first call."""
+
+    def __call__(self, **local_kw) -> AsyncSession:
+        if self.kw.get("bind") is None:
+            self.configure(bind=get_engine())
+        return super().__call__(**local_kw)
+
 
+SessionLocal = LazySessionMaker(
+    expire_on_commit=False, class_=AsyncSession, autoflush=False
+)
+
+
+class ReplicaSet:
+    """
+    Read replicas picked round-robin, each with its own lazily created
+    engine.
+
+    A replica that fails to connect is skipped for `retry_after` seconds;
+    when none is available, reads go to the primary. Replica sessions run
+    with `default_transaction_read_only`, so a write sent there by mistake
+    fails instead of silently diverging.
+    """
+
+    def __init__(
+        self,
+        urls: list[str],
+        retry_after: float = 30.0,
+        connect_timeout: float = 2.0,
+    ):
+        self.urls = list(urls)
+        self.retry_after = retry_after
+        self.connect_timeout = connect_timeout
+        self._makers: list[Optional[async_sessionmaker]] = [None] * len(urls)
+        self._down_until = [0.0] * len(urls)
+        self._next = 0
+        self.sessions = [0] * len(urls)
+        self.failures = [0] * len(urls)
+        self.last_error: list[Optional[str]] = [None] * len(urls)
+        self.fallbacks = 0
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+    def candidates(self) -> list[int]:
+        """Healthy replicas in round-robin order, starting with the next."""
+        now = time.monotonic()
+        count = len(self.urls)
+        start, self._next = self._next, (self._next + 1) % max(count, 1)
+        return [
+            (start + offset) % count
+            for offset in range(count)
+            if self._down_until[(start + offset) % count] <= now
+        ]
+
+    def sessionmaker(self, index: int) -> async_sessionmaker:
+        if self._makers[index] is None:
+            engine = _create_engine(
+                self.urls[index],
+                timeout=self.connect_timeout,
+                server_settings={"default_transaction_read_only": "on"},
+            )
+            self._makers[index] = async_sessionmaker(
+                bind=engine,
+                expire_on_commit=False,
+                class_=AsyncSession,
+                autoflush=False,
+            )
+        return self._makers[index]
 
-# Регистрируем очистку при выходе
-atexit.register(lambda: asyncio.run(dispose_engine()))
+    def mark_down(self, index: int, error: Exception):
+        self.failures[index] += 1
+        self.last_error[index] = repr(error)
+        self._down_until[index] = time.monotonic() + self.retry_after
 
-SessionLocal = async_sessionmaker(
-    bind=engine, expire_on_commit=False, class_=AsyncSession, autoflush=False
+    async def dispose(self):
+        for maker in self._makers:
+            if maker is not None:
+                await maker.kw["bind"].dispose()
+
+    def status(self) -> list[dict]:
+        now = time.monotonic()
+        return [
+            {
+                "url": make_url(url).render_as_string(hide_password=True),
+                "healthy": self._down_until[i] <= now,
+                "sessions": self.sessions[i],
+                "failures": self.failures[i],
+                "last_error": self.last_error[i],
+            }
+            for i, url in enumerate(self.urls)
+        ]
+
+
+replicas = ReplicaSet(
+    settings.DATABASE_REPLICA_URLS,
+    retry_after=settings.DB_REPLICA_RETRY_SECONDS,
+    connect_timeout=settings.DB_REPLICA_CONNECT_TIMEOUT,
 )
 
+# Пользователи, чьи данные недавно изменил вебхук: их чтения идут в
+# основную БД, пока реплика может отставать (учёт в пределах воркера)
+recent_writes = TTLCache(
+    settings.READ_YOUR_WRITES_MAX_USERS, settings.READ_YOUR_WRITES_SECONDS
+)
+
+
+def mark_written(user_id: int):
+    recent_writes.set(user_id)
+
+
+def wants_primary(request: Request) -> bool:
+    """Client asked to read from the primary (X-Read-Consistency)."""
+    value = request.headers.get(READ_CONSISTENCY_HEADER, "")
+    return value.strip().lower() == "primary"
+
+
+async def open_read_session(primary: bool = False) -> AsyncSession:
+    """
+    A session on the next healthy replica, or on the primary when
+    `primary` is set, no replica is configured or none can be reached.
+    """
+    if not primary:
+        for index in replicas.candidates():
+            session = replicas.sessionmaker(index)()
+            try:
+                await session.connection()
+            except (OSError, SQLAlchemyError, asyncio.TimeoutError) as e:
+                await session.close()
+                replicas.mark_down(index, e)
+                continue
+            replicas.sessions[index] += 1
+            return session
+        if len(replicas):
+            replicas.fallbacks += 1
+    return SessionLocal()
+
+
+def pool_load() -> Optional[tuple[int, int, int]]:
+    """
+    (checked out, capacity, waiting checkouts) of this worker's primary
+    pool; None before the engine exists or when the pool is unbounded.
+    """
+    if _engine is None or settings.DB_MAX_OVERFLOW < 0:
+        return None
+    pool = _engine.pool
+    if not isinstance(pool, InstrumentedQueuePool):
+        return None
+    capacity = pool.size() + settings.DB_MAX_OVERFLOW
+    return pool.checkedout(), capacity, pool.waiting()
+
+
+def pool_status() -> dict:
+    """Snapshot of the engine pool for capacity planning."""
+    pool = get_engine().pool
+    status = {"pool": type(pool).__name__, "wait": pool_wait_stats.as_dict()}
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        status.update(
+            size=pool.size(),
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            checked_out=pool.checkedout(),
+            waiting=pool.waiting(),
+            idle=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+            timeout=pool.timeout(),
+        )
+    if len(replicas):
+        status["replicas"] = replicas.status()
+        status["replica_fallbacks"] = replicas.fallbacks
+    return status
+
 
 async def get_async_session():
     session = SessionLocal()
@@ -55,3 +342,12 @@ async def get_async_session():
         raise e
     finally:
         await session.close()
+
+
+async def get_read_session(request: Request):
+    """Read-only session: a replica unless the client asks for primary."""
+    session = await open_read_session(primary=wants_primary(request))
+    try:
+        yield session
+    finally:
+        await session.close()
@@ -0,0 +1,158 @@
+import asyncio
+import time
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from functools import lru_cache
+from typing import Optional
+
+from app.config import settings
+
+
+@lru_cache(maxsize=None)
+def _context(rounds: int):
+    from passlib.context import CryptContext
+
+    # min/max равны целевой стоимости: хэши с другой стоимостью
+    # помечаются как устаревшие и пересчитываются при входе
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds,
+    )
+
+
+def hash_password(password: str, rounds: int) -> str:
+    """Hash a password using bcrypt with the given cost."""
+    return _context(rounds).hash(password)
+
+
+def verify_password(
+    password: str, hashed_password: str, rounds: int
+) -> tuple[bool, Optional[str]]:
+    """
+    Verify a password and return a replacement hash if its cost is stale.
+
+    Returns:
+        (is_valid, new_hash); new_hash is None unless the password is valid
+        and the stored hash was made with a different cost.
+    """
+    return _context(rounds).verify_and_update(password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated executor so it never blocks the event loop.
+
+    At most `workers` hashes run at once; further calls wait in line and
+    are counted in `stats()` as queue depth.
+    """
+
+    def __init__(self, rounds: int, workers: int, executor: str = "thread"):
+        self.rounds = rounds
+        self.workers = max(workers, 1)
+        self.executor_kind = executor
+        self._executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._slots_loop = None
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.max_queued = 0
+        self.total_wait = 0.0
+        self.total_run = 0.0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "process":
+                self._executor = ProcessPoolExecutor(self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    self.workers, thread_name_prefix="password-hasher"
+                )
+        return self._executor
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(self.workers)
+            self._slots_loop = loop
+        return self._slots
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        slots = self._get_slots()
+        queued_at = time.perf_counter()
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        try:
+            await slots.acquire()
+        finally:
+            self.queued -= 1
+
+        started_at = time.perf_counter()
+        self.total_wait += started_at - queued_at
+        self.running += 1
+        try:
+            return await loop.run_in_executor(
+                self._get_executor(), func, *args
+            )
+        finally:
+            slots.release()
+            self.running -= 1
+            self.completed += 1
+            self.total_run += time.perf_counter() - started_at
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password, self.rounds)
+
+    async def verify(
+        self, password: str, hashed_password: str
+    ) -> tuple[bool, Optional[str]]:
+        return await self._run(
+            verify_password, password, hashed_password, self.rounds
+        )
+
+    def stats(self) -> dict:
+        return {
+            "executor": self.executor_kind,
+            "workers": self.workers,
+            "rounds": self.rounds,
+            "queue_depth": self.queued,
+            "max_queue_depth": self.max_queued,
+            "running": self.running,
+            "completed": self.completed,
+            "avg_wait_ms": (
+                self.total_wait / self.completed * 1000
+                if self.completed
+                else 0.0
+            ),
+            "avg_run_ms": (
+                self.total_run / self.completed * 1000
+                if self.completed
+                else 0.0
+            ),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    rounds=settings.BCRYPT_ROUNDS,
+    workers=settings.PASSWORD_HASH_WORKERS,
+    executor=settings.PASSWORD_HASH_EXECUTOR,
+)
+
+# Отдельный пул для массового импорта, чтобы он не занимал пул входа
+bulk_password_hasher = PasswordHasher(
+    rounds=settings.BCRYPT_ROUNDS,
+    workers=settings.BULK_IMPORT_HASH_WORKERS,
+    executor="process",
+)
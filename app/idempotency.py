@@ -0,0 +1,132 @@
+import hashlib
+import logging
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.cache import LRUCache
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE = "duplicate"
+MAYBE = "maybe"
+NEW = "new"
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing on BLAKE2b)."""
+
+    def __init__(self, bits: int, hashes: int):
+        self.bits = max(bits, 8)
+        self.hashes = max(hashes, 1)
+        self.count = 0
+        self._array = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.bits
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self._array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self._array[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+    def clear(self):
+        self._array = bytearray(len(self._array))
+        self.count = 0
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._array)
+
+
+class IdempotencyCache:
+    """
+    Front cache for `transaction_id` deduplication.
+
+    The LRU holds recently committed ids, so a hit is a known duplicate
+    and needs no database check. The Bloom filter remembers more ids than
+    the LRU can hold; only ids it may contain need a database lookup,
+    everything else is certainly not committed through this worker.
+    """
+
+    def __init__(self, enabled: bool, size: int, bloom_bits: int, hashes: int):
+        self.enabled = enabled
+        self.recent = LRUCache(size)
+        self.bloom = BloomFilter(bloom_bits, hashes)
+        # После стольких вставок фильтр пересобирается из LRU
+        self.bloom_capacity = max(size, 1) * 4
+        self.hits = 0
+        self.maybe = 0
+        self.misses = 0
+        self.false_positives = 0
+
+    def check(self, transaction_id: str) -> str:
+        if not self.enabled:
+            return NEW
+        if self.recent.get(transaction_id):
+            self.hits += 1
+            return DUPLICATE
+        if transaction_id in self.bloom:
+            self.maybe += 1
+            return MAYBE
+        self.misses += 1
+        return NEW
+
+    def add(self, transaction_id: str):
+        if not self.enabled:
+            return
+        self.recent.set(transaction_id)
+        self.bloom.add(transaction_id)
+        if self.bloom.count > self.bloom_capacity:
+            self.bloom.clear()
+            for key in self.recent.keys():
+                self.bloom.add(key)
+
+    def record_false_positive(self):
+        self.false_positives += 1
+
+    def clear(self):
+        self.recent.clear()
+        self.bloom.clear()
+
+    async def warm_up(self, session: AsyncSession, limit: int) -> int:
+        """Load the most recent committed ids, oldest first."""
+        if not self.enabled or limit <= 0:
+            return 0
+        ids = await models.Transaction.get_recent_ids(session, limit)
+        for transaction_id in reversed(ids):
+            self.add(str(transaction_id))
+        logger.info("Idempotency cache warmed up with %d ids", len(ids))
+        return len(ids)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self.recent),
+            "max_entries": self.recent.maxsize,
+            "bloom_bytes": self.bloom.nbytes,
+            "bloom_items": self.bloom.count,
+            "hits": self.hits,
+            "maybe": self.maybe,
+            "misses": self.misses,
+            "false_positives": self.false_positives,
+        }
+
+
+idempotency_cache = IdempotencyCache(
+    enabled=settings.IDEMPOTENCY_CACHE_ENABLED,
+    size=settings.IDEMPOTENCY_CACHE_SIZE,
+    bloom_bits=settings.IDEMPOTENCY_BLOOM_BITS,
+    hashes=settings.IDEMPOTENCY_BLOOM_HASHES,
+)
@@ -0,0 +1,543 @@
+import asyncio
+import glob
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Optional
+
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app import payments
+from app.account_cache import account_cache
+from app.config import settings
+from app.database import SessionLocal, mark_written
+from app.idempotency import idempotency_cache
+from app.money import format_cents, to_cents
+
+try:
+    import fcntl
+except ImportError:  # Windows: один воркер на журнал, без блокировки
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, при которых пакет не виноват: БД недоступна или перегружена
+_TRANSIENT_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    OperationalError,
+    InterfaceError,
+    PoolTimeoutError,
+)
+
+
+class IntakeLog:
+    """
+    Local write-ahead log for accepted webhook payments.
+
+    `append` returns once the payment is on disk: appends that arrive while
+    an fsync is running are written and fsynced together in the next group.
+    A background applier moves the log into the database in batches with
+    `payments.apply_credits` and records the applied byte offset in a
+    checkpoint file. Entries after the checkpoint are applied again after a
+    restart; `transactions.transaction_id` makes that a no-op.
+
+    Each worker process holds an exclusive lock on its log file. A worker
+    that finds `path` taken uses the first free `path.1`, `path.2`, ...
+    slot, so several workers can share one INTAKE_LOG_PATH, and a
+    recycled worker picks up the entries its predecessor left behind.
+
+    Failed batches are retried every `retry_delay` seconds. A batch that
+    fails `max_attempts` times with anything but a connection error is
+    applied entry by entry, and the entries that still fail are moved to
+    the dead-letter file `path.dead` so they cannot stall the log.
+    Payments the database turns down (unknown user, account owned by
+    someone else) and malformed entries are written there as well: an
+    accepted (202) payment that was never credited always leaves a record.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        session_factory,
+        flush_window: float = 0.0,
+        apply_batch: int = 500,
+        compact_bytes: int = 64 * 1024 * 1024,
+        retry_delay: float = 1.0,
+        max_attempts: int = 5,
+    ):
+        self.base_path = path
+        self.path = path
+        self.session_factory = session_factory
+        self.flush_window = flush_window
+        self.apply_batch = max(apply_batch, 1)
+        self.compact_bytes = compact_bytes
+        self.retry_delay = retry_delay
+        self.max_attempts = max(max_attempts, 1)
+        self.running = False
+        self._file = None
+        self._pending: list[tuple[bytes, float, asyncio.Future]] = []
+        # (конец записи в файле, время приёма) для ещё не перенесённых
+        self._entries: deque = deque()
+        self._lock: Optional[asyncio.Lock] = None
+        self._has_pending: Optional[asyncio.Event] = None
+        self._has_entries: Optional[asyncio.Event] = None
+        self._tasks: list[asyncio.Task] = []
+        self.size = 0
+        self.offset = 0
+        self.appended = 0
+        self.applied = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.fsyncs = 0
+        self.apply_errors = 0
+        self.dead_lettered = 0
+        self.last_error: Optional[str] = None
+        # Смещение пакета, который не удаётся перенести, и число попыток
+        self._failing_offset = -1
+        self._attempts = 0
+        # Запись в журнал не удалось откатить: новые платежи не принимаются
+        self.write_error: Optional[str] = None
+
+    @property
+    def checkpoint_path(self) -> str:
+        return self.path + ".checkpoint"
+
+    @property
+    def dead_letter_path(self) -> str:
+        return self.path + ".dead"
+
+    async def start(self):
+        if self.running:
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._open)
+        self._lock = asyncio.Lock()
+        self._has_pending = asyncio.Event()
+        self._has_entries = asyncio.Event()
+        if self._entries:
+            self._has_entries.set()
+        self.running = True
+        self._tasks = [
+            asyncio.ensure_future(self._flusher()),
+            asyncio.ensure_future(self._applier()),
+        ]
+        for task in self._tasks:
+            task.add_done_callback(self._task_done)
+        logger.info(
+            "Intake log %s opened, %d entries to apply",
+            self.path,
+            len(self._entries),
+        )
+
+    def _claim(self):
+        """Open and lock the first log slot no other process holds."""
+        slot = 0
+        while True:
+            path = self.base_path if slot == 0 else f"{self.base_path}.{slot}"
+            file = open(path, "ab+")
+            if fcntl is None:
+                break
+            try:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                file.close()
+                slot += 1
+        self.path = path
+        self._file = file
+
+    def _open(self):
+        directory = os.path.dirname(os.path.abspath(self.base_path))
+        os.makedirs(directory, exist_ok=True)
+        self._claim()
+        self.size = self._file.seek(0, os.SEEK_END)
+        try:
+            with open(self.checkpoint_path) as f:
+                self.offset = int(f.read().strip() or 0)
+        except FileNotFoundError:
+            self.offset = 0
+        if self.offset > self.size:
+            # Журнал усечён после переноса, а контрольная точка не успела
+            # записаться: повторный перенос безопасен
+            self.offset = 0
+
+        self._file.seek(self.offset)
+        position = self.offset
+        self._entries.clear()
+        for line in self._file:
+            if not line.endswith(b"\n"):
+                break
+            position += len(line)
+            try:
+                received_at = json.loads(line)["ts"]
+            except (ValueError, KeyError):
+                received_at = time.time()
+            self._entries.append((position, received_at))
+        if position < self.size:
+            # Недописанная строка: запрос не был подтверждён
+            self._file.truncate(position)
+            os.fsync(self._file.fileno())
+            self.size = position
+
+    async def append(self, credit: payments.Credit):
+        """Write a payment to the log and wait until it is fsynced."""
+        if not self.running:
+            raise RuntimeError("Intake log is not running")
+        if self.write_error is not None:
+            raise RuntimeError(f"Intake log is broken: {self.write_error}")
+        received_at = time.time()
+        line = json.dumps(
+            {
+                "transaction_id": credit.transaction_id,
+                "user_id": credit.user_id,
+                "account_id": credit.account_id,
+                "amount": format_cents(credit.amount_cents),
+                "ts": received_at,
+            },
+            separators=(",", ":"),
+        ).encode()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((line + b"\n", received_at, future))
+        self._has_pending.set()
+        await future
+
+    async def _flusher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._has_pending.wait()
+            if self.flush_window:
+                await asyncio.sleep(self.flush_window)
+            self._has_pending.clear()
+            group, self._pending = self._pending, []
+            if not group:
+                continue
+
+            data = b"".join(line for line, _, _ in group)
+            try:
+                async with self._lock:
+                    await loop.run_in_executor(
+                        None, self._write, data, self.size
+                    )
+            except Exception as e:
+                logger.exception("Intake log write failed")
+                for _, _, future in group:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.fsyncs += 1
+            self.appended += len(group)
+            position = self.size
+            for line, received_at, _ in group:
+                position += len(line)
+                self._entries.append((position, received_at))
+            self.size = position
+            self._has_entries.set()
+            for _, _, future in group:
+                if not future.done():
+                    future.set_result(None)
+
+    def _write(self, data: bytes, size: int):
+        """
+        Append `data` at `size` and fsync. On failure the file is cut back
+        to `size`, so a half-written group never prefixes the next one.
+        """
+        fd = self._file.fileno()
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view) :]
+            os.fsync(fd)
+        except OSError:
+            try:
+                os.ftruncate(fd, size)
+                os.fsync(fd)
+            except OSError as e:
+                self.write_error = repr(e)
+                logger.exception("Intake log %s rollback failed", self.path)
+            raise
+
+    def _task_done(self, task: asyncio.Task):
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            # Без фоновой задачи журнал не пишется или не переносится
+            self.last_error = repr(error)
+            logger.critical(
+                "Intake log %s task died",
+                self.path,
+                exc_info=(type(error), error, error.__traceback__),
+            )
+
+    async def _applier(self):
+        while True:
+            try:
+                await self._apply_next()
+            except Exception as e:
+                self.apply_errors += 1
+                self.last_error = repr(e)
+                logger.warning("Intake apply failed, retrying: %r", e)
+                await asyncio.sleep(self.retry_delay)
+
+    async def _apply_next(self):
+        """Move the next batch of the log into the database."""
+        loop = asyncio.get_running_loop()
+        if self.offset >= self.size:
+            self._has_entries.clear()
+            await self._maybe_compact()
+            if self.offset >= self.size:
+                await self._has_entries.wait()
+            return
+
+        lines, end = await loop.run_in_executor(
+            None, self._read, self.offset, self.size
+        )
+        entries = []
+        dead = []
+        for line in lines:
+            try:
+                entry = json.loads(line)
+                entries.append(
+                    (
+                        line,
+                        payments.Credit(
+                            transaction_id=entry["transaction_id"],
+                            user_id=entry["user_id"],
+                            account_id=entry["account_id"],
+                            amount_cents=to_cents(entry["amount"]),
+                        ),
+                    )
+                )
+            except (ValueError, KeyError, TypeError, ArithmeticError):
+                logger.error("Skipping malformed intake entry %r", line)
+                self.rejected += 1
+                dead.append(self._dead_record(line, "malformed"))
+
+        try:
+            results = await self._apply([credit for _, credit in entries])
+        except Exception as e:
+            if self._failing_offset != self.offset:
+                self._failing_offset = self.offset
+                self._attempts = 0
+            self._attempts += 1
+            if self._attempts < self.max_attempts or isinstance(
+                e, _TRANSIENT_ERRORS
+            ):
+                raise
+            logger.error(
+                "Intake batch at offset %d failed %d times, applying "
+                "entries one by one: %r",
+                self.offset,
+                self._attempts,
+                e,
+            )
+            results, failed = await self._apply_each(entries)
+            dead.extend(failed)
+        self._failing_offset = -1
+
+        for (line, credit), result in zip(entries, results):
+            if result is None:
+                continue
+            if result.status == payments.SUCCESS:
+                self.applied += 1
+                mark_written(credit.user_id)
+                await account_cache.credit(
+                    credit.user_id,
+                    result.account_id,
+                    result.new_balance_cents,
+                )
+            elif result.status == payments.DUPLICATE:
+                self.duplicates += 1
+            else:
+                self.rejected += 1
+                logger.warning(
+                    "Intake payment %s rejected: %s",
+                    result.transaction_id,
+                    result.status,
+                )
+                dead.append(self._dead_record(line, result.status))
+                continue
+            idempotency_cache.add(result.transaction_id)
+
+        if dead:
+            await loop.run_in_executor(None, self._write_dead_letters, dead)
+            self.dead_lettered += len(dead)
+        await loop.run_in_executor(None, self._write_checkpoint, end)
+        self.offset = end
+        while self._entries and self._entries[0][0] <= end:
+            self._entries.popleft()
+
+    async def _apply(
+        self, credits: list[payments.Credit]
+    ) -> list[payments.CreditResult]:
+        if not credits:
+            return []
+        async with self.session_factory() as session:
+            return await payments.apply_credits(session, credits)
+
+    async def _apply_each(
+        self, entries: list[tuple[bytes, payments.Credit]]
+    ) -> tuple[list, list[dict]]:
+        """
+        Apply entries one at a time; an entry that fails gets a None result
+        and a dead-letter record. Connection errors are raised, so a
+        database outage never empties the log into the dead-letter file.
+        """
+        results = []
+        dead = []
+        for line, credit in entries:
+            try:
+                results.extend(await self._apply([credit]))
+            except _TRANSIENT_ERRORS:
+                raise
+            except Exception as e:
+                logger.error(
+                    "Intake payment %s moved to %s: %r",
+                    credit.transaction_id,
+                    self.dead_letter_path,
+                    e,
+                )
+                results.append(None)
+                dead.append(self._dead_record(line, "error", repr(e)))
+        return results, dead
+
+    @staticmethod
+    def _dead_record(
+        line: bytes, reason: str, error: Optional[str] = None
+    ) -> dict:
+        return {
+            "entry": line.decode("utf-8", "replace").rstrip("\n"),
+            "reason": reason,
+            "error": error,
+            "ts": time.time(),
+        }
+
+    def _write_dead_letters(self, records: list[dict]):
+        with open(self.dead_letter_path, "ab") as f:
+            for record in records:
+                f.write(json.dumps(record, separators=(",", ":")).encode())
+                f.write(b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def dead_letters(self, limit: int = 100) -> list[dict]:
+        """
+        The last `limit` dead-letter records of every log slot, oldest
+        first.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._read_dead_letters, limit)
+
+    def _read_dead_letters(self, limit: int) -> list[dict]:
+        records = []
+        pattern = glob.escape(self.base_path) + "*.dead"
+        for path in glob.glob(pattern):
+            with open(path, "rb") as f:
+                for line in deque(f, maxlen=limit):
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    record["log"] = path[: -len(".dead")]
+                    records.append(record)
+        records.sort(key=lambda record: record.get("ts", 0))
+        return records[-limit:]
+
+    def _read(self, start: int, stop: int) -> tuple[list[bytes], int]:
+        lines = []
+        position = start
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            while position < stop and len(lines) < self.apply_batch:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break
+                position += len(line)
+                lines.append(line)
+        return lines, position
+
+    def _write_checkpoint(self, offset: int):
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.checkpoint_path)
+
+    async def _maybe_compact(self):
+        """Truncate a fully applied log once it grows past `compact_bytes`."""
+        if self.size < self.compact_bytes or self._pending:
+            return
+        async with self._lock:
+            if self.offset < self.size:
+                return
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._compact)
+            self.size = self.offset = 0
+
+    def _compact(self):
+        self._file.truncate(0)
+        os.fsync(self._file.fileno())
+        self._write_checkpoint(0)
+
+    async def stop(self, timeout: float = 5.0):
+        """
+        Make every accepted payment durable, give the applier `timeout`
+        seconds to catch up and stop; the rest is applied on next start.
+        """
+        if not self.running:
+            return
+        deadline = time.monotonic() + timeout
+        while (self._pending or self.offset < self.size) and (
+            time.monotonic() < deadline
+        ):
+            await asyncio.sleep(0.01)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for _, _, future in self._pending:
+            if not future.done():
+                future.set_exception(RuntimeError("Intake log stopped"))
+        self._pending = []
+        self._file.close()
+        self._file = None
+        self.running = False
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.running,
+            "path": self.path,
+            "depth": len(self._entries),
+            "pending_bytes": self.size - self.offset,
+            "lag_seconds": (
+                time.time() - self._entries[0][1] if self._entries else 0.0
+            ),
+            "appended": self.appended,
+            "applied": self.applied,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "fsyncs": self.fsyncs,
+            "avg_group_size": (
+                self.appended / self.fsyncs if self.fsyncs else 0.0
+            ),
+            "apply_errors": self.apply_errors,
+            "dead_lettered": self.dead_lettered,
+            "last_error": self.last_error,
+            "write_error": self.write_error,
+        }
+
+
+intake_log = IntakeLog(
+    settings.INTAKE_LOG_PATH,
+    SessionLocal,
+    flush_window=settings.INTAKE_FSYNC_WINDOW_MS / 1000,
+    apply_batch=settings.INTAKE_APPLY_BATCH,
+    compact_bytes=settings.INTAKE_COMPACT_BYTES,
+    max_attempts=settings.INTAKE_MAX_ATTEMPTS,
+)
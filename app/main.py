@@ -1,14 +1,19 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.database import engine
+from fastapi.responses import PlainTextResponse
+from app.admission import AdmissionMiddleware, webhook_admission
+from app.coalescer import credit_coalescer
+from app.config import settings
+from app.database import SessionLocal, dispose_engine, get_engine
+from app.hashing import bulk_password_hasher, password_hasher
+from app.idempotency import idempotency_cache
+from app.intake import intake_log
+from app.metrics import CONTENT_TYPE, MetricsMiddleware, registry
+from app.querylog import QueryStatsMiddleware
 from app.api import router as api_router
 import logging
 import platform
 import asyncio
-import uvicorn
-from alembic.config import Config
-from alembic import command
-from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
@@ -20,14 +25,37 @@ if platform.system() == "Windows":
 async def lifespan(app: FastAPI):
     # Startup logic
     logger.info("Starting application...")
+    get_engine()
+    try:
+        async with SessionLocal() as session:
+            await idempotency_cache.warm_up(
+                session, settings.IDEMPOTENCY_WARMUP_ROWS
+            )
+    except Exception:
+        logger.exception("Idempotency cache warm-up failed")
+    if settings.INTAKE_ENABLED:
+        await intake_log.start()
     yield
     # Shutdown logic
     logger.info("Shutting down application...")
-    await engine.dispose()
+    await intake_log.stop()
+    await credit_coalescer.drain()
+    password_hasher.shutdown()
+    bulk_password_hasher.shutdown()
+    await dispose_engine()
 
 
 app = FastAPI(lifespan=lifespan)
 app.include_router(api_router)
+app.add_middleware(QueryStatsMiddleware)
+# Допуск включается и выключается на лету (webhook_admission.enabled)
+app.add_middleware(
+    AdmissionMiddleware,
+    controller=webhook_admission,
+    source_header=settings.ADMISSION_SOURCE_HEADER,
+)
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
 
 
 @app.get("/", tags=["root"])
@@ -35,16 +63,14 @@ async def read_root() -> dict:
     return {"message": "Welcome to your app!"}
 
 
-def run_alembic_migrations():
-    # Путь до alembic.ini
-    alembic_cfg = Config(
-        str(Path(__file__).resolve().parent.parent / "alembic.ini")
-    )
-    alembic_cfg.set_main_option("script_location", "alembic")
-    alembic_cfg.set_main_option("sqlalchemy.url", str(engine.url))
-    command.upgrade(alembic_cfg, "head")
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    """Метрики воркера в текстовом формате Prometheus"""
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
 
 
 if __name__ == "__main__":
-    run_alembic_migrations()
+    # Миграции выполняются отдельно: python -m app.migrate
+    import uvicorn
+
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,247 @@
+import time
+from bisect import bisect_left
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Границы корзин в секундах: от 50 мкс до 10 с
+LATENCY_BUCKETS = (
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\n", "\\n")
+        .replace('"', '\\"')
+    )
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with a fixed set of label names."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: dict[tuple, int] = {}
+
+    def inc(self, *labels, amount: int = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> int:
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        for labels, value in self._values.items():
+            yield self.name, _format_labels(self.labels, labels), value
+
+    def clear(self):
+        self._values.clear()
+
+
+class Histogram:
+    """
+    Latency histogram with fixed buckets.
+
+    `observe` costs one bisect over the bucket bounds and two additions;
+    counts are stored per bucket and made cumulative only when rendered.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple = (),
+        buckets: tuple = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            # [счётчики корзин..., +Inf, сумма]
+            series = self._series[labels] = [0] * (len(self.buckets) + 1)
+            series.append(0.0)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return sum(series[:-1]) if series else 0
+
+    def samples(self):
+        bounds = self.buckets + (float("inf"),)
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(bounds, series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield (
+                    f"{self.name}_bucket",
+                    _format_labels(self.labels, labels, le),
+                    cumulative,
+                )
+            yield f"{self.name}_sum", _format_labels(
+                self.labels, labels
+            ), series[-1]
+            yield f"{self.name}_count", _format_labels(
+                self.labels, labels
+            ), cumulative
+
+    def clear(self):
+        self._series.clear()
+
+
+class Registry:
+    """Set of metrics of one worker process, rendered for Prometheus."""
+
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        for metric in self._metrics:
+            metric.clear()
+
+
+class StageTimer:
+    """
+    Records the time spent in consecutive stages of one request.
+
+    Each `mark(stage)` observes the time since the previous mark (or since
+    the timer was created) in the histogram under that stage label.
+    """
+
+    __slots__ = ("histogram", "_last")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+        self._last = time.perf_counter()
+
+    def mark(self, stage: str):
+        now = time.perf_counter()
+        self.histogram.observe(now - self._last, stage)
+        self._last = now
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware that times every HTTP request.
+
+    Requests are labelled with the name of the route handler
+    (`handle_webhook`), not the raw path, so the number of series stays
+    bounded; requests that match no route share the `<unmatched>` label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            handler = getattr(route, "name", None) or "<unmatched>"
+            method = scope["method"]
+            request_latency.observe(
+                time.perf_counter() - started, method, handler
+            )
+            requests_total.inc(method, handler, str(status_code))
+
+
+registry = Registry()
+
+request_latency = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "HTTP request latency by route handler",
+        labels=("method", "handler"),
+    )
+)
+requests_total = registry.register(
+    Counter(
+        "http_requests_total",
+        "HTTP responses by route handler and status code",
+        labels=("method", "handler", "status"),
+    )
+)
+webhook_stage_latency = registry.register(
+    Histogram(
+        "webhook_stage_duration_seconds",
+        "Time spent in each stage of the payment webhook",
+        labels=("stage",),
+    )
+)
+webhook_outcomes = registry.register(
+    Counter(
+        "webhook_outcomes_total",
+        "Payment webhook results by outcome",
+        labels=("outcome",),
+    )
+)
@@ -0,0 +1,31 @@
+"""
+One-shot migration entry point: `python -m app.migrate [revision]`.
+
+Runs before the app is started (see start.sh) instead of on every app
+import, so web workers never load alembic.
+"""
+
+import sys
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+
+from app.config import settings
+
+
+def run_alembic_migrations(revision: str = "head"):
+    # Путь до alembic.ini
+    alembic_cfg = Config(
+        str(Path(__file__).resolve().parent.parent / "alembic.ini")
+    )
+    alembic_cfg.set_main_option("script_location", "alembic")
+    # configparser: "%" в пароле нужно экранировать
+    alembic_cfg.set_main_option(
+        "sqlalchemy.url", settings.DATABASE_URL.replace("%", "%%")
+    )
+    command.upgrade(alembic_cfg, revision)
+
+
+if __name__ == "__main__":
+    run_alembic_migrations(*sys.argv[1:2])
@@ -4,16 +4,23 @@ from sqlalchemy import (
     String,
     ForeignKey,
     Boolean,
-    Numeric,
+    BigInteger,
+    Date,
     DateTime,
     select,
+    tuple_,
+    Index,
     UniqueConstraint,
 )
 from sqlalchemy.orm import relationship, declarative_base
 from sqlalchemy.sql import func
 from sqlalchemy.dialects.postgresql import UUID
+from datetime import date, datetime
+from typing import Optional, Sequence
 import uuid
 
+from app.money import to_float
+
 Base = declarative_base()
 
 
@@ -43,32 +50,121 @@ class User(Base):
         result = await db.execute(stmt)
         return result.scalars().first()
 
+    @classmethod
+    async def get_users(
+        cls,
+        db,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+        columns: Optional[Sequence] = None,
+    ) -> list["User"]:
+        """Users by id; with `columns`, plain rows of those columns."""
+        stmt = select(*columns) if columns else select(cls)
+        stmt = stmt.order_by(cls.id)
+        if after_id is not None:
+            stmt = stmt.where(cls.id > after_id)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        result = await db.execute(stmt)
+        return result.all() if columns else result.scalars().all()
+
+    @classmethod
+    async def get_existing_ids(cls, db, user_ids: set[int]) -> set[int]:
+        if not user_ids:
+            return set()
+        stmt = select(cls.id).where(cls.id.in_(user_ids))
+        result = await db.execute(stmt)
+        return set(result.scalars().all())
+
+    @classmethod
+    async def get_existing_emails(cls, db, emails: set[str]) -> set[str]:
+        if not emails:
+            return set()
+        stmt = select(cls.email).where(cls.email.in_(emails))
+        result = await db.execute(stmt)
+        return set(result.scalars().all())
+
 
 class Account(Base):
     __tablename__ = "accounts"
+    __table_args__ = (
+        Index(
+            "ix_accounts_user_id_created_at_id",
+            "user_id",
+            "created_at",
+            "id",
+        ),
+        Index("ix_accounts_id_user_id", "id", "user_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     account_number = Column(
         String(36), unique=True, index=True, default=lambda: str(uuid.uuid4())
     )
-    balance = Column(Numeric(10, 2), default=0.00)
+    # Суммы хранятся в копейках, см. app.money
+    balance_cents = Column(
+        BigInteger, nullable=False, default=0, server_default="0"
+    )
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     user = relationship("User", back_populates="accounts")
     transactions = relationship("Transaction", back_populates="account")
 
+    @property
+    def balance(self) -> float:
+        """Balance in currency units, as `schemas.Account` returns it."""
+        return to_float(self.balance_cents)
+
     @classmethod
-    async def get_user_accounts(cls, db, user_id: int) -> list["Account"]:
-        stmt = select(cls).where(cls.user_id == user_id)
+    async def get_user_accounts(
+        cls,
+        db,
+        user_id: int,
+        limit: Optional[int] = None,
+        after: Optional[tuple] = None,
+        columns: Optional[Sequence] = None,
+    ) -> list["Account"]:
+        """A user's accounts; with `columns`, plain rows of those columns."""
+        stmt = select(*columns) if columns else select(cls)
+        stmt = stmt.where(cls.user_id == user_id).order_by(
+            cls.created_at, cls.id
+        )
+        if after is not None:
+            stmt = stmt.where(tuple_(cls.created_at, cls.id) > after)
+        if limit is not None:
+            stmt = stmt.limit(limit)
         result = await db.execute(stmt)
-        return result.scalars().all()
+        return result.all() if columns else result.scalars().all()
+
+    @classmethod
+    async def get_owners(cls, db, account_ids: set[int]) -> dict[int, int]:
+        """Map each existing account id to its owner's user id."""
+        if not account_ids:
+            return {}
+        stmt = select(cls.id, cls.user_id).where(cls.id.in_(account_ids))
+        result = await db.execute(stmt)
+        return dict(result.all())
 
 
 class Transaction(Base):
     __tablename__ = "transactions"
     __table_args__ = (
         UniqueConstraint("transaction_id", name="uniq_transaction"),
+        Index(
+            "ix_transactions_user_id_created_at_id",
+            "user_id",
+            "created_at",
+            "id",
+        ),
+        Index(
+            "ix_transactions_account_id_created_at_id",
+            "account_id",
+            "created_at",
+            "id",
+        ),
+        Index("ix_transactions_user_id_amount", "user_id", "amount_cents"),
+        Index("ix_transactions_created_at_id", "created_at", "id"),
     )
 
     id = Column(Integer, primary_key=True, index=True)
@@ -79,7 +175,7 @@ class Transaction(Base):
         nullable=False,
         index=True,
     )
-    amount = Column(Numeric(10, 2), nullable=False)
+    amount_cents = Column(BigInteger, nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     account_id = Column(Integer, ForeignKey("accounts.id"), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -87,10 +183,151 @@ class Transaction(Base):
     user = relationship("User", back_populates="transactions")
     account = relationship("Account", back_populates="transactions")
 
+    @property
+    def amount(self) -> float:
+        """Amount in currency units, as `schemas.Transaction` returns it."""
+        return to_float(self.amount_cents)
+
+    @classmethod
+    async def exists(cls, db, transaction_id: str) -> bool:
+        stmt = select(cls.id).where(cls.transaction_id == transaction_id)
+        result = await db.execute(stmt)
+        return result.first() is not None
+
+    @classmethod
+    async def get_recent_ids(cls, db, limit: int) -> list[uuid.UUID]:
+        stmt = select(cls.transaction_id).order_by(cls.id.desc()).limit(limit)
+        result = await db.execute(stmt)
+        return result.scalars().all()
+
     @classmethod
     async def get_user_transactions(
-        cls, db, user_id: int
+        cls,
+        db,
+        user_id: int,
+        limit: Optional[int] = None,
+        after: Optional[tuple] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        account_id: Optional[int] = None,
+        amount_min_cents: Optional[int] = None,
+        amount_max_cents: Optional[int] = None,
+        columns: Optional[Sequence] = None,
     ) -> list["Transaction"]:
-        stmt = select(cls).where(cls.user_id == user_id)
+        """
+        List a user's transactions in (created_at, id) order.
+
+        `after` is the keyset position of the last row of the previous
+        page; the date range is half-open, [date_from, date_to), the
+        amount range in cents is closed. With `columns`, plain rows of
+        those columns are returned instead of ORM objects.
+        """
+        stmt = select(*columns) if columns else select(cls)
+        stmt = stmt.where(cls.user_id == user_id).order_by(
+            cls.created_at, cls.id
+        )
+        if after is not None:
+            stmt = stmt.where(tuple_(cls.created_at, cls.id) > after)
+        if date_from is not None:
+            stmt = stmt.where(cls.created_at >= date_from)
+        if date_to is not None:
+            stmt = stmt.where(cls.created_at < date_to)
+        if account_id is not None:
+            stmt = stmt.where(cls.account_id == account_id)
+        if amount_min_cents is not None:
+            stmt = stmt.where(cls.amount_cents >= amount_min_cents)
+        if amount_max_cents is not None:
+            stmt = stmt.where(cls.amount_cents <= amount_max_cents)
+        if limit is not None:
+            stmt = stmt.limit(limit)
         result = await db.execute(stmt)
-        return result.scalars().all()
+        return result.all() if columns else result.scalars().all()
+
+    @classmethod
+    async def stream_transactions(
+        cls,
+        db,
+        columns: Sequence,
+        after: Optional[tuple] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        user_id: Optional[int] = None,
+        account_id: Optional[int] = None,
+        batch_size: int = 1000,
+    ):
+        """
+        Stream rows of `columns` in (created_at, id) order.
+
+        Rows are fetched from a server-side cursor `batch_size` at a time;
+        iterate the returned result with `.partitions()` to get one batch
+        per fetch.
+        """
+        stmt = select(*columns).order_by(cls.created_at, cls.id)
+        if after is not None:
+            stmt = stmt.where(tuple_(cls.created_at, cls.id) > after)
+        if date_from is not None:
+            stmt = stmt.where(cls.created_at >= date_from)
+        if date_to is not None:
+            stmt = stmt.where(cls.created_at < date_to)
+        if user_id is not None:
+            stmt = stmt.where(cls.user_id == user_id)
+        if account_id is not None:
+            stmt = stmt.where(cls.account_id == account_id)
+        return await db.stream(stmt.execution_options(yield_per=batch_size))
+
+
+class RefreshToken(Base):
+    """
+    A refresh token, stored as the SHA-256 of the opaque value.
+
+    Tokens issued by one login and its refreshes share a `family_id`;
+    `used_at` marks a token exchanged for the next one of its family.
+    """
+
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True)
+    token_hash = Column(String(64), unique=True, nullable=False)
+    family_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    user_id = Column(
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    used_at = Column(DateTime(timezone=True), nullable=True)
+    revoked_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class AccountDailyTotal(Base):
+    """Credits per account and UTC day, kept up to date by the credit paths."""
+
+    __tablename__ = "account_daily_totals"
+
+    account_id = Column(
+        Integer,
+        ForeignKey("accounts.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    day = Column(Date, primary_key=True)
+    credit_count = Column(Integer, nullable=False, default=0)
+    total_cents = Column(BigInteger, nullable=False, default=0)
+
+    @classmethod
+    async def get_days(
+        cls, db, account_id: int, date_from: date, date_to: date
+    ) -> list["AccountDailyTotal"]:
+        """Rollup rows of one account for days in [date_from, date_to]."""
+        stmt = (
+            select(cls.day, cls.credit_count, cls.total_cents)
+            .where(
+                cls.account_id == account_id,
+                cls.day >= date_from,
+                cls.day <= date_to,
+            )
+            .order_by(cls.day)
+        )
+        result = await db.execute(stmt)
+        return result.all()
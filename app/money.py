@@ -0,0 +1,50 @@
+"""
+Money amounts in integer minor units (cents).
+
+Amounts are stored and added as BIGINT cents. The API keeps its wire
+format: webhook amounts come in as floats, balances leave as floats and
+exact amounts (signatures, `new_balance`, exports) are rendered as
+two-decimal strings. These helpers convert at those edges only.
+"""
+
+import math
+from decimal import ROUND_HALF_EVEN, Decimal
+from typing import Union
+
+SCALE = 100
+
+_CENTS = Decimal(SCALE)
+
+
+def to_cents(amount: Union[float, Decimal, str, int]) -> int:
+    """
+    Cents of an amount in currency units, rounded half to even.
+
+    A float is first rounded to two decimals, as `WebhookData` does, so
+    the result is the same as quantizing `Decimal(str(round(amount, 2)))`.
+    Infinity and NaN raise ValueError, like any other malformed amount.
+    """
+    if isinstance(amount, float):
+        if not math.isfinite(amount):
+            raise ValueError(f"Amount must be finite, got {amount}")
+        return round(round(amount, 2) * SCALE)
+    cents = Decimal(amount) * _CENTS
+    if not cents.is_finite():
+        raise ValueError(f"Amount must be finite, got {amount}")
+    return int(cents.to_integral_value(ROUND_HALF_EVEN))
+
+
+def format_cents(cents: int) -> str:
+    """Two-decimal string of an amount in cents: 1250 -> "12.50"."""
+    units, minor = divmod(abs(cents), SCALE)
+    return f"{'-' if cents < 0 else ''}{units}.{minor:02d}"
+
+
+def to_float(cents: int) -> float:
+    """Amount in currency units as the float the schemas return."""
+    return cents / SCALE
+
+
+def to_decimal(cents: int) -> Decimal:
+    """Exact amount in currency units: 1250 -> Decimal("12.50")."""
+    return Decimal(cents).scaleb(-2)
@@ -0,0 +1,59 @@
+import base64
+from datetime import datetime
+from typing import Callable, Optional
+
+from fastapi import HTTPException, Query, status
+
+from app.config import settings
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*key) -> str:
+    """Encode a keyset position, e.g. (created_at, id), as an opaque token."""
+    raw = "|".join(
+        value.isoformat() if isinstance(value, datetime) else str(value)
+        for value in key
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *types) -> tuple:
+    """Decode a cursor made by `encode_cursor` into typed values."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        parts = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        if len(parts) != len(types):
+            raise ValueError("unexpected cursor length")
+        return tuple(
+            datetime.fromisoformat(part) if kind is datetime else kind(part)
+            for part, kind in zip(parts, types)
+        )
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+
+
+def page_limit(
+    limit: Optional[int] = Query(
+        None,
+        ge=1,
+        le=settings.PAGE_SIZE_MAX,
+        description="Page size",
+    ),
+) -> int:
+    return limit or settings.PAGE_SIZE_DEFAULT
+
+
+def paginate(rows: list, limit: int, key: Callable) -> tuple[list, dict]:
+    """
+    Trim a `limit + 1` row fetch to one page.
+
+    Returns the page and the response headers; if there is a further page,
+    its cursor is sent in the X-Next-Cursor header.
+    """
+    if len(rows) <= limit:
+        return rows, {}
+    rows = rows[:limit]
+    return rows, {NEXT_CURSOR_HEADER: encode_cursor(*key(rows[-1]))}
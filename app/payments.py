@@ -0,0 +1,362 @@
+from dataclasses import dataclass
+from typing import Optional
+import uuid
+
+from sqlalchemy import (
+    BigInteger,
+    Integer,
+    String,
+    column,
+    exists,
+    literal,
+    select,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import UUID, insert
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models, rollups
+
+SUCCESS = "success"
+DUPLICATE = "duplicate"
+INVALID_DATA = "invalid_data"
+INVALID_SIGNATURE = "invalid_signature"
+USER_NOT_FOUND = "user_not_found"
+ACCOUNT_CONFLICT = "account_conflict"
+
+
+@dataclass
+class Credit:
+    """A verified, normalized payment ready to be applied."""
+
+    transaction_id: str
+    user_id: int
+    account_id: int
+    amount_cents: int
+
+
+@dataclass
+class CreditResult:
+    transaction_id: str
+    status: str
+    account_id: Optional[int] = None
+    new_balance_cents: Optional[int] = None
+
+
+class _OwnershipChanged(Exception):
+    """An account was created by another user while the batch was running."""
+
+
+def _is_deadlock(error: DBAPIError) -> bool:
+    return getattr(error.orig, "sqlstate", None) == "40P01"
+
+
+async def apply_credits(
+    session: AsyncSession, credits: list[Credit]
+) -> list[CreditResult]:
+    """
+    Apply a batch of credits with set-based statements and one commit.
+
+    Duplicates inside the batch and against `transactions.transaction_id`
+    are reported, not raised. Results are returned in input order; the
+    `new_balance_cents` of every successful credit is the account balance right
+    after that credit, as if the batch had been applied one by one.
+    """
+    for attempt in range(2):
+        try:
+            results = await _apply_credits(session, credits)
+            await session.commit()
+            return results
+        except (IntegrityError, _OwnershipChanged):
+            await session.rollback()
+            # Повторяем один раз: гонка при создании счёта другим запросом
+            if attempt:
+                raise
+        except DBAPIError as e:
+            await session.rollback()
+            # Взаимоблокировка с запросом, который держит те же счета
+            # (например, зачисление вне пакета): один повтор
+            if attempt or not _is_deadlock(e):
+                raise
+
+
+async def _apply_credits(
+    session: AsyncSession, credits: list[Credit]
+) -> list[CreditResult]:
+    results = {}
+    ordered = []
+    unique = []
+    for credit in credits:
+        result = CreditResult(
+            credit.transaction_id, DUPLICATE, credit.account_id
+        )
+        ordered.append(result)
+        if credit.transaction_id not in results:
+            results[credit.transaction_id] = result
+            unique.append(credit)
+
+    user_ids = await models.User.get_existing_ids(
+        session, {c.user_id for c in unique}
+    )
+    owners = await models.Account.get_owners(
+        session, {c.account_id for c in unique}
+    )
+
+    accepted = []
+    new_accounts = {}
+    for credit in unique:
+        result = results[credit.transaction_id]
+        if credit.user_id not in user_ids:
+            result.status = USER_NOT_FOUND
+            continue
+        owner = owners.get(credit.account_id)
+        if owner is None:
+            owners[credit.account_id] = owner = credit.user_id
+            new_accounts[credit.account_id] = credit.user_id
+        if owner != credit.user_id:
+            result.status = ACCOUNT_CONFLICT
+            continue
+        accepted.append(credit)
+
+    if accepted:
+        if new_accounts:
+            await session.execute(
+                insert(models.Account)
+                .values(
+                    [
+                        {
+                            "id": account_id,
+                            "user_id": user_id,
+                            "account_number": str(uuid.uuid4()),
+                            "balance_cents": 0,
+                        }
+                        for account_id, user_id in new_accounts.items()
+                    ]
+                )
+                .on_conflict_do_nothing(index_elements=["id"])
+            )
+
+        inserted = await session.scalars(
+            insert(models.Transaction)
+            .values(
+                [
+                    {
+                        "transaction_id": credit.transaction_id,
+                        "user_id": credit.user_id,
+                        "account_id": credit.account_id,
+                        "amount_cents": credit.amount_cents,
+                    }
+                    for credit in accepted
+                ]
+            )
+            .on_conflict_do_nothing(index_elements=["transaction_id"])
+            .returning(models.Transaction.transaction_id)
+        )
+        inserted = {str(transaction_id) for transaction_id in inserted}
+
+        totals = {}
+        counts = {}
+        for credit in accepted:
+            if credit.transaction_id in inserted:
+                totals[credit.account_id] = (
+                    totals.get(credit.account_id, 0) + credit.amount_cents
+                )
+                counts[credit.account_id] = (
+                    counts.get(credit.account_id, 0) + 1
+                )
+
+        balances = {}
+        if totals:
+            balances = await _add_to_balances(session, totals, owners)
+            await _add_to_rollups(session, totals, counts)
+
+        # Баланс после каждого платежа: итог минус более поздние платежи
+        for credit in reversed(accepted):
+            if credit.transaction_id in inserted:
+                result = results[credit.transaction_id]
+                result.status = SUCCESS
+                result.new_balance_cents = balances[credit.account_id]
+                balances[credit.account_id] -= credit.amount_cents
+
+    return ordered
+
+
+async def _add_to_balances(
+    session: AsyncSession, totals: dict, owners: dict
+) -> dict:
+    """
+    Add per-account totals in a single UPDATE ... FROM (VALUES ...).
+
+    The rows are locked in id order first: the UPDATE itself takes them
+    in join order, so two batches sharing accounts could deadlock. The
+    lock is FOR NO KEY UPDATE, the one the UPDATE takes: FOR UPDATE would
+    also wait on the key-share locks that the foreign key checks of
+    concurrent transaction inserts hold, in their own order.
+    """
+    await session.execute(
+        select(models.Account.id)
+        .where(models.Account.id.in_(sorted(totals)))
+        .order_by(models.Account.id)
+        .with_for_update(key_share=True)
+    )
+    deltas = values(
+        column("id", Integer),
+        column("amount_cents", BigInteger),
+        name="deltas",
+    ).data(list(totals.items()))
+    rows = await session.execute(
+        update(models.Account)
+        .where(models.Account.id == deltas.c.id)
+        .values(
+            balance_cents=models.Account.balance_cents + deltas.c.amount_cents
+        )
+        .returning(
+            models.Account.id,
+            models.Account.user_id,
+            models.Account.balance_cents,
+        )
+    )
+    balances = {}
+    for account_id, user_id, balance in rows:
+        if owners[account_id] != user_id:
+            raise _OwnershipChanged(account_id)
+        balances[account_id] = balance
+    return balances
+
+
+async def _add_to_rollups(session: AsyncSession, totals: dict, counts: dict):
+    """Add per-account totals to today's rollups in one upsert."""
+    credited = values(
+        column("account_id", Integer),
+        column("credit_count", Integer),
+        column("total_cents", BigInteger),
+        name="credited",
+    ).data(
+        [
+            (account_id, counts[account_id], totals[account_id])
+            for account_id in sorted(totals)
+        ]
+    )
+    await session.execute(
+        rollups.add_to_rollups(
+            select(
+                credited.c.account_id,
+                rollups.today(),
+                credited.c.credit_count,
+                credited.c.total_cents,
+            )
+        )
+    )
+
+
+def _credit_statement(credit: Credit):
+    """
+    Build the single-statement credit for one payment.
+
+    The transaction insert, account upsert with `balance_cents =
+    balance_cents + amount_cents` and the daily rollup upsert run as
+    data-modifying CTEs of one statement. The outer SELECT reads the
+    snapshot taken before the statement, so it reports whether the payment
+    was already recorded and whether the user exists.
+    """
+    transaction = models.Transaction
+    account = models.Account
+    user_exists = exists().where(models.User.id == credit.user_id)
+
+    credited = (
+        insert(transaction)
+        .from_select(
+            ["transaction_id", "user_id", "account_id", "amount_cents"],
+            select(
+                literal(credit.transaction_id, UUID(as_uuid=False)),
+                literal(credit.user_id, Integer),
+                literal(credit.account_id, Integer),
+                literal(credit.amount_cents, BigInteger),
+            ).where(user_exists),
+        )
+        .on_conflict_do_nothing(index_elements=["transaction_id"])
+        .returning(
+            transaction.account_id,
+            transaction.user_id,
+            transaction.amount_cents,
+        )
+        .cte("credited")
+    )
+
+    upsert = insert(account).from_select(
+        ["id", "user_id", "account_number", "balance_cents"],
+        select(
+            credited.c.account_id,
+            credited.c.user_id,
+            literal(str(uuid.uuid4()), String),
+            credited.c.amount_cents,
+        ),
+    )
+    balance = (
+        upsert.on_conflict_do_update(
+            index_elements=["id"],
+            set_={
+                "balance_cents": account.balance_cents
+                + upsert.excluded.balance_cents
+            },
+        )
+        .returning(account.user_id, account.balance_cents)
+        .cte("balance")
+    )
+    daily = (
+        rollups.add_to_rollups(
+            select(
+                credited.c.account_id,
+                rollups.today(),
+                literal(1, Integer),
+                credited.c.amount_cents,
+            )
+        )
+        .returning(models.AccountDailyTotal.account_id)
+        .cte("daily")
+    )
+
+    return select(
+        exists()
+        .where(transaction.transaction_id == credit.transaction_id)
+        .label("duplicate"),
+        user_exists.label("user_exists"),
+        select(balance.c.user_id).scalar_subquery().label("owner_id"),
+        select(balance.c.balance_cents)
+        .scalar_subquery()
+        .label("new_balance_cents"),
+    ).add_cte(daily)
+
+
+async def credit_account(
+    session: AsyncSession, credit: Credit
+) -> CreditResult:
+    """
+    Apply one credit in a single round trip and commit it.
+
+    Concurrent credits to the same account serialize on the row update
+    inside Postgres, so no balance increments are lost.
+    """
+    result = CreditResult(credit.transaction_id, DUPLICATE, credit.account_id)
+    row = (await session.execute(_credit_statement(credit))).one()
+
+    if row.duplicate:
+        pass
+    elif not row.user_exists:
+        result.status = USER_NOT_FOUND
+    elif row.owner_id is None:
+        # Платёж вставлен параллельным запросом после снимка
+        pass
+    elif row.owner_id != credit.user_id:
+        result.status = ACCOUNT_CONFLICT
+    else:
+        result.status = SUCCESS
+        result.new_balance_cents = row.new_balance_cents
+
+    if result.status == SUCCESS:
+        await session.commit()
+    else:
+        await session.rollback()
+    return result
@@ -0,0 +1,174 @@
+import hashlib
+import logging
+import re
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Optional
+
+from sqlalchemy import event
+
+from app.config import settings
+from app.metrics import Counter, Histogram, registry
+
+logger = logging.getLogger(__name__)
+
+QUERIES_HEADER = "X-DB-Queries"
+TIME_HEADER = "X-DB-Time"
+
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAMS = re.compile(r"\$\d+|%\(\w+\)s")
+_TUPLE = r"\(\s*\?(?:\s*,\s*\?)*\s*\)"
+_LISTS = re.compile(rf"{_TUPLE}(?:\s*,\s*{_TUPLE})*")
+_SPACES = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(statement: str) -> tuple[str, str]:
+    """
+    Normalize a statement and return (fingerprint, normalized text).
+
+    Literals and bound parameters become `?` and value lists collapse to
+    `(...)`, so `IN ($1, $2)` and `IN ($1, $2, $3)` share a fingerprint.
+    """
+    normalized = _STRINGS.sub("?", statement)
+    normalized = _PARAMS.sub("?", normalized)
+    normalized = _NUMBERS.sub("?", normalized)
+    normalized = _LISTS.sub("(...)", normalized)
+    normalized = _SPACES.sub(" ", normalized).strip()
+    digest = hashlib.blake2b(normalized.encode(), digest_size=8).hexdigest()
+    return digest, normalized
+
+
+class QueryStats:
+    """Statements issued on behalf of one request."""
+
+    __slots__ = ("count", "total")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+
+    @property
+    def total_ms(self) -> float:
+        return self.total * 1000
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar(
+    "query_stats", default=None
+)
+
+
+def current_stats() -> Optional[QueryStats]:
+    return _current.get()
+
+
+def _before_cursor_execute(conn, cursor, statement, params, context, many):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, params, context, many):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    statements_total.inc()
+    stats = _current.get()
+    if stats is not None:
+        stats.count += 1
+        stats.total += elapsed
+    if elapsed * 1000 >= settings.DB_SLOW_QUERY_MS:
+        _log_slow(statement, elapsed)
+
+
+def _handle_error(context):
+    started = (
+        context.connection.info.get("query_started")
+        if context.connection
+        else None
+    )
+    if started:
+        started.pop()
+
+
+def _log_slow(statement: str, elapsed: float):
+    digest, normalized = fingerprint(statement)
+    slow_statements_total.inc(digest)
+    logger.warning(
+        "Slow query %.1f ms [%s] %s",
+        elapsed * 1000,
+        digest,
+        normalized,
+        extra={
+            "fingerprint": digest,
+            "duration_ms": round(elapsed * 1000, 3),
+            "statement": normalized,
+        },
+    )
+
+
+def install(engine):
+    """Attach statement counting and timing to an (async) engine."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+class QueryStatsMiddleware:
+    """
+    Pure ASGI middleware that accounts the statements of each request.
+
+    Every request gets its own `QueryStats` in a context variable read by
+    the engine hooks. The number of statements per request is recorded
+    by route handler; with DB_QUERY_HEADERS on, the count and total time
+    are also sent back as X-DB-Queries and X-DB-Time (milliseconds).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _current.set(stats)
+
+        async def send_wrapper(message):
+            if (
+                message["type"] == "http.response.start"
+                and settings.DB_QUERY_HEADERS
+            ):
+                message["headers"] = list(message.get("headers", [])) + [
+                    (QUERIES_HEADER.lower().encode(), b"%d" % stats.count),
+                    (TIME_HEADER.lower().encode(), b"%.3f" % stats.total_ms),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            handler = getattr(route, "name", None) or "<unmatched>"
+            queries_per_request.observe(stats.count, handler)
+
+
+statements_total = registry.register(
+    Counter("db_statements_total", "SQL statements executed")
+)
+slow_statements_total = registry.register(
+    Counter(
+        "db_slow_statements_total",
+        "SQL statements slower than DB_SLOW_QUERY_MS by fingerprint",
+        labels=("fingerprint",),
+    )
+)
+queries_per_request = registry.register(
+    Histogram(
+        "db_queries_per_request",
+        "SQL statements issued per HTTP request by route handler",
+        labels=("handler",),
+        buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+    )
+)
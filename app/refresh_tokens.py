@@ -0,0 +1,230 @@
+"""
+Rotating refresh tokens.
+
+A password login starts a token family and returns its first refresh
+token with the access token. `rotate` trades a refresh token for the
+next one of the same family and a new access token; it costs one
+indexed UPDATE and one INSERT, no bcrypt. Each refresh token works
+once: presenting a token that was already exchanged means two parties
+hold the family, so the whole family is revoked and both have to log in
+again.
+
+Tokens are random strings; only their SHA-256 is stored. Consumed and
+revoked rows are kept until they expire, so that reuse is still
+detected, and then removed with:
+
+    python -m app.refresh_tokens
+"""
+
+import argparse
+import asyncio
+import hashlib
+import secrets
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.config import settings
+from app.metrics import Counter, registry
+
+ISSUED = "issued"
+ROTATED = "rotated"
+REUSED = "reused"
+INVALID = "invalid"
+REVOKED = "revoked"
+
+
+class RefreshTokenError(Exception):
+    """The refresh token is unknown, expired, revoked or was reused."""
+
+    def __init__(self, outcome: str):
+        super().__init__(outcome)
+        self.outcome = outcome
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def issue(
+    session: AsyncSession,
+    user_id: int,
+    family_id: Optional[uuid.UUID] = None,
+) -> str:
+    """
+    Add a refresh token of `family_id` (a new family when omitted) to the
+    session and return its value; the caller commits.
+    """
+    token = secrets.token_urlsafe(32)
+    session.add(
+        models.RefreshToken(
+            token_hash=hash_token(token),
+            family_id=family_id or uuid.uuid4(),
+            user_id=user_id,
+            expires_at=_now()
+            + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+        )
+    )
+    refresh_token_outcomes.inc(ISSUED)
+    return token
+
+
+async def rotate(session: AsyncSession, token: str) -> tuple[int, str]:
+    """
+    Consume `token` and commit the next token of its family.
+
+    Returns the user id and the new refresh token. Raises
+    `RefreshTokenError` when the token cannot be used; a reused token
+    revokes its family first. Of two concurrent refreshes with the same
+    token only one can consume it, the other is treated as reuse.
+    """
+    refresh = models.RefreshToken
+    token_hash = hash_token(token)
+    now = _now()
+    row = (
+        await session.execute(
+            update(refresh)
+            .where(
+                refresh.token_hash == token_hash,
+                refresh.used_at.is_(None),
+                refresh.revoked_at.is_(None),
+                refresh.expires_at > now,
+            )
+            .values(used_at=now)
+            .returning(refresh.user_id, refresh.family_id)
+        )
+    ).first()
+    if row is None:
+        await session.rollback()
+        outcome = await _reject(session, token_hash)
+        refresh_token_outcomes.inc(outcome)
+        raise RefreshTokenError(outcome)
+
+    new_token = issue(session, row.user_id, row.family_id)
+    await session.commit()
+    refresh_token_outcomes.inc(ROTATED)
+    return row.user_id, new_token
+
+
+async def _reject(session: AsyncSession, token_hash: str) -> str:
+    """
+    Why a token was not consumed; revokes the family of a reused one.
+
+    Only an unexpired token counts as reused: an old token that a client
+    replays after it expired could not be used anyway.
+    """
+    refresh = models.RefreshToken
+    row = (
+        await session.execute(
+            select(
+                refresh.family_id,
+                refresh.used_at,
+                refresh.revoked_at,
+                refresh.expires_at,
+            ).where(refresh.token_hash == token_hash)
+        )
+    ).first()
+    if (
+        row is None
+        or row.used_at is None
+        or row.revoked_at is not None
+        or row.expires_at <= _now()
+    ):
+        return INVALID
+    # Токен уже обменян: им пользуется кто-то ещё
+    await revoke_family(session, row.family_id)
+    await session.commit()
+    return REUSED
+
+
+async def revoke_family(session: AsyncSession, family_id: uuid.UUID) -> int:
+    """Revoke every live token of a family; the caller commits."""
+    refresh = models.RefreshToken
+    result = await session.execute(
+        update(refresh)
+        .where(refresh.family_id == family_id, refresh.revoked_at.is_(None))
+        .values(revoked_at=_now())
+    )
+    refresh_token_outcomes.inc(REVOKED, amount=result.rowcount)
+    return result.rowcount
+
+
+async def revoke(session: AsyncSession, token: str) -> bool:
+    """
+    Log out: revoke the family of `token` and commit. Access tokens
+    already issued stay valid until they expire.
+    """
+    refresh = models.RefreshToken
+    family_id = await session.scalar(
+        select(refresh.family_id).where(
+            refresh.token_hash == hash_token(token)
+        )
+    )
+    if family_id is None:
+        return False
+    await revoke_family(session, family_id)
+    await session.commit()
+    return True
+
+
+async def revoke_user(session: AsyncSession, user_id: int) -> int:
+    """Revoke every live token of a user; the caller commits."""
+    refresh = models.RefreshToken
+    result = await session.execute(
+        update(refresh)
+        .where(refresh.user_id == user_id, refresh.revoked_at.is_(None))
+        .values(revoked_at=_now())
+    )
+    refresh_token_outcomes.inc(REVOKED, amount=result.rowcount)
+    return result.rowcount
+
+
+async def purge_expired(session: AsyncSession) -> int:
+    """Delete expired tokens and commit."""
+    refresh = models.RefreshToken
+    result = await session.execute(
+        delete(refresh).where(refresh.expires_at <= _now())
+    )
+    await session.commit()
+    return result.rowcount
+
+
+refresh_token_outcomes = registry.register(
+    Counter(
+        "refresh_tokens_total",
+        "Refresh tokens issued, rotated, rejected and revoked",
+        labels=("outcome",),
+    )
+)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Purge expired refresh tokens"
+    )
+    return parser.parse_args(argv)
+
+
+async def _main(args):
+    from app.database import SessionLocal, dispose_engine
+
+    async with SessionLocal() as session:
+        rows = await purge_expired(session)
+    await dispose_engine()
+    print(f"Deleted {rows} expired refresh tokens")
+
+
+def main(argv=None):
+    asyncio.run(_main(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
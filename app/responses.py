@@ -0,0 +1,72 @@
+from decimal import Decimal
+from typing import Optional
+from uuid import UUID
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from app.money import to_float
+
+
+def _default(value):
+    # Схемы отдают суммы как float
+    if isinstance(value, Decimal):
+        return float(value)
+    # asyncpg возвращает свой подкласс UUID, orjson знает только uuid.UUID
+    if isinstance(value, UUID):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson.
+
+    The output is byte-for-byte what the default encoder produces for the
+    same response models: compact separators, UTF-8, UTC datetimes with a
+    `Z` suffix, and Decimal amounts as floats.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_UTC_Z)
+
+
+def _cents_columns(schema: type[BaseModel]) -> dict:
+    return getattr(schema, "cents_columns", {})
+
+
+def schema_columns(model, schema: type[BaseModel]) -> list:
+    """
+    Model columns in the field order of a response schema.
+
+    Money fields listed in the schema's `cents_columns` are read from
+    their integer-cents column.
+    """
+    cents = _cents_columns(schema)
+    return [
+        getattr(model, cents.get(name, name)) for name in schema.model_fields
+    ]
+
+
+def rows_response(
+    rows, schema: type[BaseModel], headers: Optional[dict] = None
+) -> FastJSONResponse:
+    """
+    Serialize rows selected with `schema_columns` straight to JSON.
+
+    This skips the ORM identity map and per-row Pydantic validation.
+    Cents columns are converted back to the float amounts of the schema.
+    """
+    fields = list(schema.model_fields)
+    cents = [
+        i for i, name in enumerate(fields) if name in _cents_columns(schema)
+    ]
+    if cents:
+        rows = [list(row) for row in rows]
+        for row in rows:
+            for i in cents:
+                row[i] = to_float(row[i])
+    return FastJSONResponse(
+        [dict(zip(fields, row)) for row in rows], headers=headers
+    )
@@ -0,0 +1,120 @@
+"""
+Per-account daily credit rollups.
+
+Every credit path adds to `account_daily_totals` in the transaction that
+records the payment. `backfill` rebuilds the rollups from `transactions`
+for existing data:
+
+    python -m app.rollups --from 2024-01-01 --to 2024-12-31
+"""
+
+import argparse
+import asyncio
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import BigInteger, Date, cast, func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+
+COLUMNS = ["account_id", "day", "credit_count", "total_cents"]
+
+
+def utc_day(timestamp):
+    """Calendar day of a timestamptz expression in UTC."""
+    return cast(func.timezone("UTC", timestamp), Date)
+
+
+def today():
+    """The rollup day of payments recorded by the current transaction."""
+    return utc_day(func.now())
+
+
+def add_to_rollups(rows):
+    """
+    Upsert that adds (account_id, day, credit_count, total_cents) rows from
+    `rows` to the rollups. Rows must be unique per (account_id, day).
+    """
+    daily = models.AccountDailyTotal
+    stmt = insert(daily).from_select(COLUMNS, rows)
+    return stmt.on_conflict_do_update(
+        index_elements=["account_id", "day"],
+        set_={
+            "credit_count": daily.credit_count + stmt.excluded.credit_count,
+            "total_cents": daily.total_cents + stmt.excluded.total_cents,
+        },
+    )
+
+
+def backfill_statement(
+    date_from: Optional[date] = None, date_to: Optional[date] = None
+):
+    """Recompute the rollups of days in [date_from, date_to]."""
+    transaction = models.Transaction
+    day = utc_day(transaction.created_at)
+    rows = select(
+        transaction.account_id,
+        day,
+        func.count(),
+        # sum(bigint) в Postgres даёт numeric
+        cast(func.sum(transaction.amount_cents), BigInteger),
+    ).group_by(transaction.account_id, day)
+    if date_from is not None:
+        rows = rows.where(day >= date_from)
+    if date_to is not None:
+        rows = rows.where(day <= date_to)
+
+    stmt = insert(models.AccountDailyTotal).from_select(COLUMNS, rows)
+    return stmt.on_conflict_do_update(
+        index_elements=["account_id", "day"],
+        set_={
+            "credit_count": stmt.excluded.credit_count,
+            "total_cents": stmt.excluded.total_cents,
+        },
+    )
+
+
+async def backfill(
+    session: AsyncSession,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+) -> int:
+    """
+    Rebuild the rollups from `transactions` and commit.
+
+    The table lock waits for credit transactions that already wrote to the
+    rollups and holds back new ones until the commit, so a payment that
+    is recorded while the backfill runs is counted exactly once.
+    """
+    await session.execute(
+        text("LOCK TABLE account_daily_totals IN SHARE ROW EXCLUSIVE MODE")
+    )
+    result = await session.execute(backfill_statement(date_from, date_to))
+    await session.commit()
+    return result.rowcount
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild daily rollups")
+    parser.add_argument("--from", dest="date_from", type=date.fromisoformat)
+    parser.add_argument("--to", dest="date_to", type=date.fromisoformat)
+    return parser.parse_args(argv)
+
+
+async def _main(args):
+    from app.database import SessionLocal, engine
+
+    async with SessionLocal() as session:
+        rows = await backfill(session, args.date_from, args.date_to)
+    await engine.dispose()
+    print(f"Rebuilt {rows} daily rollup rows")
+
+
+def main(argv=None):
+    asyncio.run(_main(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
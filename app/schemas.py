@@ -1,6 +1,7 @@
 from pydantic import BaseModel, ConfigDict, EmailStr
-from typing import Optional
-from datetime import datetime
+from typing import ClassVar, Optional
+from datetime import date, datetime
+from decimal import Decimal
 from pydantic import field_validator
 from uuid import UUID
 
@@ -8,6 +9,7 @@ from uuid import UUID
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
 
 
 class TokenData(BaseModel):
@@ -30,6 +32,19 @@ class User(UserBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+class UserImportError(BaseModel):
+    line: int
+    email: Optional[str] = None
+    error: str
+
+
+class UserImportResult(BaseModel):
+    created: int
+    failed: int
+    errors: list[UserImportError]
+    errors_truncated: bool
+
+
 class AccountBase(BaseModel):
     account_number: Optional[str] = None
 
@@ -41,12 +56,17 @@ class Account(AccountBase):
     created_at: datetime
     account_number: Optional[str] = None
 
+    # Поле ответа -> столбец в копейках, см. app.responses
+    cents_columns: ClassVar[dict[str, str]] = {"balance": "balance_cents"}
+
     model_config = ConfigDict(from_attributes=True)
 
 
 class TransactionBase(BaseModel):
     amount: float
 
+    cents_columns: ClassVar[dict[str, str]] = {"amount": "amount_cents"}
+
 
 class Transaction(TransactionBase):
     id: int
@@ -58,6 +78,23 @@ class Transaction(TransactionBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+class DailyTotal(BaseModel):
+    day: date
+    credit_count: int
+    total: Decimal
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class AccountSummary(BaseModel):
+    account_id: int
+    date_from: date
+    date_to: date
+    credit_count: int
+    total: Decimal
+    days: list[DailyTotal]
+
+
 class WebhookData(BaseModel):
     transaction_id: str
     user_id: int
@@ -72,3 +109,14 @@ class WebhookData(BaseModel):
         if v <= 0:
             raise ValueError("Amount must be positive")
         return round(v, 2)
+
+
+class WebhookBatchItemResult(BaseModel):
+    transaction_id: str
+    status: str
+    account_id: Optional[int] = None
+    new_balance: Optional[str] = None
+
+
+class WebhookBatchResult(BaseModel):
+    results: list[WebhookBatchItemResult]
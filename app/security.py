@@ -1,5 +1,9 @@
 import hashlib
 import hmac
+from typing import Iterable, Sequence
+
+from app.config import settings
+from app.money import format_cents
 
 
 def generate_signature(
@@ -68,3 +72,102 @@ def verify_signature(
     )
 
     return hmac.compare_digest(received_signature, expected_signature)
+
+
+# Подпись принимается только в каноничной записи: 64 строчные hex-цифры
+_SIGNATURE_LENGTH = 2 * hashlib.sha256().digest_size
+_HEX_DIGITS = frozenset("0123456789abcdef")
+
+
+class WebhookSigner:
+    """
+    HMAC-SHA256 signer for webhook payloads with precomputed key state.
+
+    The keyed inner/outer state is computed once per key and copied for
+    each message, so a signature costs one `copy()` and one `update()`
+    instead of re-deriving the key pads. The first key signs; every key
+    verifies, which lets a secret be rotated without downtime: deploy
+    `new,old`, move the senders to `new`, then drop `old`.
+    """
+
+    def __init__(self, keys: Sequence[str]):
+        self._states = [
+            hmac.new(key.encode("utf-8"), digestmod=hashlib.sha256)
+            for key in keys
+            if key
+        ]
+
+    @staticmethod
+    def message(
+        account_id: int, amount_cents: int, transaction_id: str, user_id: int
+    ) -> bytes:
+        """
+        Signed payload; the amount in cents is rendered with two decimals,
+        exactly as `generate_signature` renders the same float amount.
+        """
+        return (
+            f"{account_id}:{format_cents(amount_cents)}:"
+            f"{transaction_id}:{user_id}"
+        ).encode("utf-8")
+
+    def sign(
+        self,
+        account_id: int,
+        amount_cents: int,
+        transaction_id: str,
+        user_id: int,
+    ) -> str:
+        """Hex signature with the primary key, as `generate_signature`."""
+        if not self._states:
+            raise RuntimeError("No webhook signing key configured")
+        state = self._states[0].copy()
+        state.update(
+            self.message(account_id, amount_cents, transaction_id, user_id)
+        )
+        return state.hexdigest()
+
+    def _verify(self, received_signature: str, message: bytes) -> bool:
+        if (
+            not isinstance(received_signature, str)
+            or len(received_signature) != _SIGNATURE_LENGTH
+            or not _HEX_DIGITS.issuperset(received_signature)
+        ):
+            return False
+        received = bytes.fromhex(received_signature)
+        valid = False
+        # Проверяем все ключи без досрочного выхода: время ответа не
+        # зависит от того, каким ключом подписан платёж
+        for key_state in self._states:
+            state = key_state.copy()
+            state.update(message)
+            valid |= hmac.compare_digest(received, state.digest())
+        return valid
+
+    def verify(
+        self,
+        received_signature: str,
+        account_id: int,
+        amount_cents: int,
+        transaction_id: str,
+        user_id: int,
+    ) -> bool:
+        """Constant-time check of a signature against every active key."""
+        return self._verify(
+            received_signature,
+            self.message(account_id, amount_cents, transaction_id, user_id),
+        )
+
+    def verify_batch(
+        self, items: Iterable[tuple[str, int, int, str, int]]
+    ) -> list[bool]:
+        """
+        Verify (signature, account_id, amount_cents, transaction_id,
+        user_id) tuples; returns one flag per item in the same order.
+        """
+        return [
+            self._verify(signature, self.message(*fields))
+            for signature, *fields in items
+        ]
+
+
+webhook_signer = WebhookSigner(settings.WEBHOOK_SECRET_KEYS)
@@ -0,0 +1,53 @@
+"""
+Production entry point: `python -m app.serve`.
+
+Runs SERVER_WORKERS uvicorn worker processes behind one socket. Each
+worker imports the app and creates its own engine in the lifespan
+handler, so no connection crosses a process boundary. With the `auto`
+defaults uvicorn uses uvloop and httptools when they are installed.
+
+On SIGTERM a worker stops accepting connections, waits up to
+SERVER_GRACEFUL_TIMEOUT seconds for requests in flight, then runs the
+lifespan shutdown: the intake log is flushed, coalesced credits are
+written and the pool is closed. With SERVER_MAX_REQUESTS set, a worker
+exits the same way after that many requests (plus a random jitter, so
+workers do not recycle together) and the supervisor starts a new one.
+"""
+
+import logging
+
+import uvicorn
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def server_options() -> dict:
+    """Keyword arguments for `uvicorn.run` built from settings."""
+    return {
+        "host": settings.SERVER_HOST,
+        "port": settings.SERVER_PORT,
+        "workers": max(settings.SERVER_WORKERS, 1),
+        "loop": settings.SERVER_LOOP,
+        "http": settings.SERVER_HTTP,
+        "limit_max_requests": settings.SERVER_MAX_REQUESTS or None,
+        "limit_max_requests_jitter": settings.SERVER_MAX_REQUESTS_JITTER,
+        "timeout_graceful_shutdown": settings.SERVER_GRACEFUL_TIMEOUT,
+        "access_log": settings.SERVER_ACCESS_LOG,
+    }
+
+
+def main():
+    options = server_options()
+    logger.info(
+        "Serving with %d workers (loop=%s, http=%s)",
+        options["workers"],
+        options["loop"],
+        options["http"],
+    )
+    uvicorn.run("app.main:app", **options)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import asyncio
+import csv
+import json
+from typing import AsyncIterator, Optional
+
+from pydantic import ValidationError
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models, schemas
+from app.hashing import PasswordHasher
+
+CSV = "csv"
+NDJSON = "ndjson"
+
+CONTENT_TYPES = {
+    "text/csv": CSV,
+    "application/csv": CSV,
+    "application/x-ndjson": NDJSON,
+    "application/ndjson": NDJSON,
+    "application/jsonl": NDJSON,
+}
+
+
+class ImportFormatError(ValueError):
+    """The body cannot be read as the declared format."""
+
+
+async def iter_lines(
+    chunks: AsyncIterator[bytes], max_line: int
+) -> AsyncIterator[tuple[int, str]]:
+    """Split a streamed body into numbered, decoded, non-empty lines."""
+    buffer = b""
+    number = 0
+    async for chunk in chunks:
+        buffer += chunk
+        if b"\n" in chunk:
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                number += 1
+                if len(line) > max_line:
+                    raise ImportFormatError(f"Line {number} is too long")
+                text = _decode(line, number)
+                if text:
+                    yield number, text
+        if len(buffer) > max_line:
+            raise ImportFormatError(f"Line {number + 1} is too long")
+    if buffer:
+        text = _decode(buffer, number + 1)
+        if text:
+            yield number + 1, text
+
+
+def _decode(line: bytes, number: int) -> str:
+    try:
+        text = line.decode("utf-8")
+    except UnicodeDecodeError:
+        raise ImportFormatError(f"Line {number} is not valid UTF-8")
+    if number == 1:
+        text = text.lstrip("\ufeff")
+    return text.strip()
+
+
+async def iter_records(
+    lines: AsyncIterator[tuple[int, str]], fmt: str
+) -> AsyncIterator[tuple[int, object]]:
+    """
+    Turn lines into (line number, dict) records.
+
+    CSV needs a header row naming at least `email`, `full_name` and
+    `password`; each record must fit on one line. A line that cannot be
+    parsed is yielded with an error message instead of a dict.
+    """
+    header: Optional[list[str]] = None
+    async for number, line in lines:
+        if fmt == NDJSON:
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield number, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield number, "Expected a JSON object"
+                continue
+            yield number, record
+            continue
+
+        values = next(csv.reader([line]))
+        if header is None:
+            header = [name.strip().lower() for name in values]
+            missing = {"email", "full_name", "password"} - set(header)
+            if missing:
+                raise ImportFormatError(
+                    f"CSV header lacks: {', '.join(sorted(missing))}"
+                )
+            continue
+        if len(values) != len(header):
+            yield number, f"Expected {len(header)} fields, got {len(values)}"
+            continue
+        yield number, dict(zip(header, values))
+
+
+class ImportReport:
+    """Counts and per-row errors of one import; keeps at most `max_errors`."""
+
+    def __init__(self, max_errors: int):
+        self.max_errors = max_errors
+        self.created = 0
+        self.failed = 0
+        self.errors: list[dict] = []
+
+    def error(self, line: int, email: Optional[str], message: str):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append(
+                {"line": line, "email": email, "error": message}
+            )
+
+    def as_dict(self) -> dict:
+        return {
+            "created": self.created,
+            "failed": self.failed,
+            "errors": sorted(self.errors, key=lambda e: e["line"]),
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+def _validation_message(error: ValidationError) -> str:
+    first = error.errors()[0]
+    field = ".".join(str(part) for part in first["loc"])
+    return f"{field}: {first['msg']}" if field else first["msg"]
+
+
+async def import_users(
+    session: AsyncSession,
+    records: AsyncIterator[tuple[int, object]],
+    hasher: PasswordHasher,
+    chunk_size: int,
+    report: ImportReport,
+):
+    """
+    Create users from `records` chunk by chunk.
+
+    Only one chunk is held in memory. Per chunk: one query for emails that
+    already exist, parallel hashing on `hasher`, one multi-row INSERT and
+    a commit. The connection goes back to the pool while the chunk is
+    hashed. A row whose email is taken by a concurrent insert is
+    reported by ON CONFLICT instead of failing the chunk.
+    """
+    chunk = []
+    async for number, record in records:
+        if isinstance(record, str):
+            report.error(number, None, record)
+            continue
+        try:
+            user = schemas.UserCreate(
+                email=record.get("email"),
+                full_name=record.get("full_name"),
+                password=record.get("password"),
+            )
+        except ValidationError as e:
+            email = record.get("email")
+            report.error(
+                number,
+                email if isinstance(email, str) else None,
+                _validation_message(e),
+            )
+            continue
+        chunk.append((number, user))
+        if len(chunk) >= chunk_size:
+            await _import_chunk(session, chunk, hasher, report)
+            chunk = []
+    if chunk:
+        await _import_chunk(session, chunk, hasher, report)
+
+
+async def _import_chunk(
+    session: AsyncSession,
+    chunk: list[tuple[int, schemas.UserCreate]],
+    hasher: PasswordHasher,
+    report: ImportReport,
+):
+    existing = await models.User.get_existing_emails(
+        session, {user.email for _, user in chunk}
+    )
+    accepted, seen = [], set()
+    for number, user in chunk:
+        if user.email in existing:
+            report.error(number, user.email, "Email already registered")
+        elif user.email in seen:
+            report.error(number, user.email, "Duplicate email in file")
+        else:
+            seen.add(user.email)
+            accepted.append((number, user))
+    # Закрываем читающую транзакцию: на время хеширования соединение
+    # возвращается в пул
+    await session.commit()
+    if not accepted:
+        return
+
+    hashes = await asyncio.gather(
+        *[hasher.hash(user.password) for _, user in accepted]
+    )
+    inserted = await session.scalars(
+        insert(models.User)
+        .values(
+            [
+                {
+                    "email": user.email,
+                    "full_name": user.full_name,
+                    "hashed_password": hashed_password,
+                    "is_admin": False,
+                }
+                for (_, user), hashed_password in zip(accepted, hashes)
+            ]
+        )
+        .on_conflict_do_nothing(index_elements=["email"])
+        .returning(models.User.email)
+    )
+    inserted = set(inserted)
+    await session.commit()
+
+    report.created += len(inserted)
+    for number, user in accepted:
+        if user.email not in inserted:
+            report.error(number, user.email, "Email already registered")
@@ -0,0 +1,306 @@
+"""
+Load and latency benchmark for the payment API.
+
+Drives `app.main:app` in-process through an ASGI transport, or a running
+server with --url, with a weighted mix of realistic traffic:
+
+    webhook     new signed payments spread over many accounts
+    duplicate   provider retries of payments that were already sent
+    hot         new payments to a single hot account
+    login       password logins at /token
+    history     /users/me/transactions reads
+
+Reports requests/s and p50/p95/p99 latency per scenario, writes the result
+as JSON and can compare it against a saved baseline:
+
+    python -m benchmarks.api --requests 2000 --output bench.json
+    python -m benchmarks.api --baseline bench.json --max-regression 10
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import platform
+import random
+import sys
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import httpx
+
+from app.config import settings
+from app.security import generate_signature
+
+SCENARIOS = ("webhook", "duplicate", "hot", "login", "history")
+DEFAULT_MIX = "webhook=50,duplicate=15,hot=15,login=5,history=15"
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def parse_mix(mix: str) -> dict[str, int]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = int(weight or 1)
+    unknown = set(weights) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    return weights
+
+
+class Workload:
+    """
+    Builds requests for each scenario.
+
+    The scenario sequence, accounts and amounts come from a seeded random
+    generator, so two runs with the same seed replay the same traffic.
+    """
+
+    def __init__(self, args, rng: random.Random):
+        self.args = args
+        self.rng = rng
+        self.sent: list[dict] = []
+        self.token: Optional[str] = None
+
+    def payment(self, account_id: int) -> dict:
+        # Id всегда новый: повторный прогон с тем же seed не должен
+        # превращаться в поток дубликатов
+        transaction_id = str(uuid.uuid4())
+        amount = round(self.rng.uniform(1, 500), 2)
+        payload = {
+            "account_id": account_id,
+            "amount": amount,
+            "transaction_id": transaction_id,
+            "user_id": self.args.user_id,
+            "signature": generate_signature(
+                account_id=account_id,
+                amount=amount,
+                transaction_id=transaction_id,
+                user_id=self.args.user_id,
+                secret_key=self.args.secret_key,
+            ),
+        }
+        self.sent.append(payload)
+        return payload
+
+    async def webhook(self, client: httpx.AsyncClient) -> httpx.Response:
+        account_id = self.args.account_base + self.rng.randrange(
+            self.args.accounts
+        )
+        return await client.post(
+            "/webhook/payment", json=self.payment(account_id)
+        )
+
+    async def hot(self, client: httpx.AsyncClient) -> httpx.Response:
+        return await client.post(
+            "/webhook/payment", json=self.payment(self.args.hot_account)
+        )
+
+    async def duplicate(self, client: httpx.AsyncClient) -> httpx.Response:
+        if not self.sent:
+            return await self.webhook(client)
+        return await client.post(
+            "/webhook/payment", json=self.rng.choice(self.sent)
+        )
+
+    async def login(self, client: httpx.AsyncClient) -> httpx.Response:
+        response = await client.post(
+            "/token",
+            data={"username": self.args.email, "password": self.args.password},
+        )
+        if response.status_code == 200:
+            self.token = response.json()["access_token"]
+        return response
+
+    async def history(self, client: httpx.AsyncClient) -> httpx.Response:
+        if self.token is None:
+            await self.login(client)
+        return await client.get(
+            "/users/me/transactions",
+            headers={"Authorization": f"Bearer {self.token}"},
+        )
+
+
+@asynccontextmanager
+async def open_client(url: Optional[str], admission: bool = False):
+    if url:
+        async with httpx.AsyncClient(base_url=url, timeout=30) as client:
+            yield client
+        return
+
+    from app.admission import webhook_admission
+    from app.main import app
+
+    # Все запросы идут из одного источника: без --admission допуск не
+    # отсекает нагрузку, которую мы измеряем
+    webhook_admission.enabled = admission
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", timeout=30
+        ) as client:
+            yield client
+
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    workload = Workload(args, rng)
+    weights = parse_mix(args.mix)
+    names = list(weights)
+    plan = rng.choices(names, [weights[n] for n in names], k=args.requests)
+
+    latencies = {name: [] for name in names}
+    statuses = {name: {} for name in names}
+    queue = iter(plan)
+
+    async with open_client(args.url, args.admission) as client:
+        # Прогрев: токен и несколько платежей для сценария повторов
+        await workload.login(client)
+        for _ in range(min(args.warmup, args.requests)):
+            await workload.webhook(client)
+
+        async def worker():
+            for name in queue:
+                started = time.perf_counter()
+                response = await getattr(workload, name)(client)
+                latencies[name].append(time.perf_counter() - started)
+                code = str(response.status_code)
+                statuses[name][code] = statuses[name].get(code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+        elapsed = time.perf_counter() - started
+
+    endpoints = {}
+    for name in names:
+        samples = latencies[name]
+        endpoints[name] = {
+            "requests": len(samples),
+            "rps": len(samples) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(samples, 50) * 1000,
+            "p95_ms": percentile(samples, 95) * 1000,
+            "p99_ms": percentile(samples, 99) * 1000,
+            "statuses": statuses[name],
+        }
+    return {
+        "target": args.url or "in-process",
+        "python": platform.python_version(),
+        "seed": args.seed,
+        "mix": weights,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "elapsed_s": elapsed,
+        "rps": args.requests / elapsed if elapsed else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+def compare(result: dict, baseline: dict, max_regression: float) -> list[str]:
+    """
+    Compare a run against a baseline.
+
+    Returns one line per regression: throughput lower or p95/p99 latency
+    higher than the baseline by more than `max_regression` percent.
+    """
+    regressions = []
+    limit = max_regression / 100
+    for name, current in result["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if not previous or not previous["requests"] or not current["requests"]:
+            continue
+        if current["rps"] < previous["rps"] * (1 - limit):
+            regressions.append(
+                f"{name}: rps {previous['rps']:.1f} -> {current['rps']:.1f}"
+            )
+        for key in ("p95_ms", "p99_ms"):
+            if current[key] > previous[key] * (1 + limit):
+                regressions.append(
+                    f"{name}: {key} {previous[key]:.2f} -> {current[key]:.2f}"
+                )
+    return regressions
+
+
+def format_table(result: dict) -> str:
+    lines = [
+        f"{'scenario':<10} {'reqs':>6} {'rps':>9} {'p50 ms':>9} "
+        f"{'p95 ms':>9} {'p99 ms':>9}  statuses"
+    ]
+    for name, stats in result["endpoints"].items():
+        lines.append(
+            f"{name:<10} {stats['requests']:>6} {stats['rps']:>9.1f} "
+            f"{stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} "
+            f"{stats['p99_ms']:>9.2f}  {stats['statuses']}"
+        )
+    lines.append(
+        f"total: {result['requests']} requests in "
+        f"{result['elapsed_s']:.2f}s, {result['rps']:.1f} req/s"
+    )
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", help="target a running server instead")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--user-id", type=int, default=1)
+    parser.add_argument("--email", default="testuser@example.com")
+    parser.add_argument("--password", default="userpass")
+    parser.add_argument("--hot-account", type=int, default=1)
+    parser.add_argument(
+        "--account-base",
+        type=int,
+        default=900_000,
+        help="first account id used by the webhook scenario",
+    )
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--secret-key", default=settings.SECRET_KEY)
+    parser.add_argument(
+        "--admission",
+        action="store_true",
+        help="keep webhook admission control on for in-process runs",
+    )
+    parser.add_argument("--output", help="write the result JSON here")
+    parser.add_argument("--baseline", help="compare with a saved result")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=10.0,
+        help="allowed slowdown against the baseline, in percent",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    result = asyncio.run(run(args))
+    print(format_table(result))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.max_regression)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+Per-signature cost of webhook signing and verification.
+
+Compares `generate_signature` / `verify_signature`, which derive the HMAC
+key state for every payload, with `WebhookSigner`, which copies a
+precomputed state:
+
+    python -m benchmarks.signature --number 100000 --keys 2
+"""
+
+import argparse
+import sys
+import timeit
+import uuid
+
+from app.money import to_cents
+from app.security import (
+    WebhookSigner,
+    generate_signature,
+    verify_signature,
+)
+
+
+def measure(number: int, repeat: int, keys: int, batch: int) -> dict:
+    """Best time per signature of each operation, in microseconds."""
+    secret_keys = [f"benchmark-key-{i}" for i in range(keys)]
+    # verify перебирает все ключи, так что каким из них подписано, не важно
+    signer = WebhookSigner(secret_keys)
+    payload = {
+        "account_id": 42,
+        "amount": 1234.5,
+        "transaction_id": str(uuid.uuid4()),
+        "user_id": 7,
+    }
+    # Подписчик принимает сумму в копейках, как её передаёт вебхук
+    cents_payload = {
+        "account_id": payload["account_id"],
+        "amount_cents": to_cents(payload["amount"]),
+        "transaction_id": payload["transaction_id"],
+        "user_id": payload["user_id"],
+    }
+    signature = generate_signature(**payload, secret_key=secret_keys[-1])
+    items = [(signature, *cents_payload.values())] * batch
+
+    cases = {
+        "generate_signature": lambda: generate_signature(
+            **payload, secret_key=secret_keys[0]
+        ),
+        "verify_signature": lambda: verify_signature(
+            signature, **payload, secret_key=secret_keys[-1]
+        ),
+        "signer.sign": lambda: signer.sign(**cents_payload),
+        "signer.verify": lambda: signer.verify(signature, **cents_payload),
+    }
+    result = {}
+    for name, case in cases.items():
+        best = min(timeit.repeat(case, number=number, repeat=repeat))
+        result[name] = best / number * 1e6
+
+    calls = max(number // batch, 1)
+    best = min(
+        timeit.repeat(
+            lambda: signer.verify_batch(items), number=calls, repeat=repeat
+        )
+    )
+    result["signer.verify_batch"] = best / (calls * batch) * 1e6
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--number", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--keys", type=int, default=1, help="active keys in the signer"
+    )
+    parser.add_argument("--batch", type=int, default=1000)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    result = measure(args.number, args.repeat, args.keys, args.batch)
+    print(f"{'operation':<22} {'us/signature':>12}")
+    for name, micros in result.items():
+        print(f"{name:<22} {micros:>12.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""
+Import time and time to first request of the application.
+
+Each sample runs in a fresh interpreter, as a container start would:
+
+    import      `import app.main` until it returns
+    first       process start until GET / answers 200 from uvicorn
+                (imports, lifespan start-up and the first request)
+
+Prints the median of --runs samples and fails when a budget is exceeded:
+
+    python -m benchmarks.startup --runs 5 --import-budget-ms 1500
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+IMPORT_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", 1500))
+FIRST_REQUEST_BUDGET_MS = float(
+    os.getenv("STARTUP_FIRST_REQUEST_BUDGET_MS", 5000)
+)
+
+# Модули, которые не должны загружаться при импорте приложения
+LAZY_MODULES = ("alembic", "uvicorn", "passlib", "asyncpg")
+
+_IMPORT_PROBE = """
+import sys, time
+started = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - started
+loaded = [m for m in sys.argv[1:] if m in sys.modules]
+print(elapsed * 1000, *loaded)
+"""
+
+
+def measure_import(modules=LAZY_MODULES) -> tuple[float, list[str]]:
+    """Milliseconds to import app.main and which `modules` it loaded."""
+    output = subprocess.run(
+        [sys.executable, "-c", _IMPORT_PROBE, *modules],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.split()
+    return float(output[0]), output[1:]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_first_request(timeout: float = 30.0) -> float:
+    """Milliseconds from spawning uvicorn to the first 200 from GET /."""
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise RuntimeError("Server exited during start-up")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - started) * 1000
+            except OSError:
+                time.sleep(0.005)
+        raise TimeoutError(f"No response from {url} in {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def measure(runs: int, first_request: bool = True) -> dict:
+    imports, loaded = [], set()
+    for _ in range(runs):
+        elapsed, modules = measure_import()
+        imports.append(elapsed)
+        loaded.update(modules)
+    result = {
+        "import_ms": statistics.median(imports),
+        "eager_modules": sorted(loaded),
+    }
+    if first_request:
+        result["first_request_ms"] = statistics.median(
+            measure_first_request() for _ in range(runs)
+        )
+    return result
+
+
+def check(result: dict, import_budget: float, first_budget: float) -> list:
+    """Budget violations of a `measure` result."""
+    failures = []
+    if result["eager_modules"]:
+        failures.append(
+            "imported at startup: " + ", ".join(result["eager_modules"])
+        )
+    if result["import_ms"] > import_budget:
+        failures.append(
+            f"import {result['import_ms']:.0f} ms > {import_budget:.0f} ms"
+        )
+    first = result.get("first_request_ms")
+    if first is not None and first > first_budget:
+        failures.append(
+            f"first request {first:.0f} ms > {first_budget:.0f} ms"
+        )
+    return failures
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--import-budget-ms", type=float, default=IMPORT_BUDGET_MS
+    )
+    parser.add_argument(
+        "--first-request-budget-ms",
+        type=float,
+        default=FIRST_REQUEST_BUDGET_MS,
+    )
+    parser.add_argument(
+        "--no-server",
+        action="store_true",
+        help="measure the import only",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    result = measure(args.runs, first_request=not args.no_server)
+    print(f"import app.main      {result['import_ms']:8.1f} ms")
+    if "first_request_ms" in result:
+        print(f"first request        {result['first_request_ms']:8.1f} ms")
+    failures = check(
+        result, args.import_budget_ms, args.first_request_budget_ms
+    )
+    for line in failures:
+        print(f"OVER BUDGET {line}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
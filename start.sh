@@ -5,5 +5,9 @@ while ! nc -z db 5432; do
   sleep 1
 done
 
-echo "Starting FastAPI with Alembic migration inside main.py..."
-python -m app.main
+echo "Applying migrations..."
+python -m app.migrate || exit 1
+
+echo "Starting FastAPI..."
+# exec: SIGTERM от docker получает сам сервер и корректно завершает воркеры
+exec python -m app.serve
@@ -1,17 +1,64 @@
+import uuid
+
 import pytest
+import pytest_asyncio
 from fastapi.testclient import TestClient
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.main import app
-from app.database import SessionLocal
+from app.config import settings
+from app.database import SessionLocal, engine
+from app.security import generate_signature
 
 
 @pytest.fixture
 def client() -> TestClient:
-    return TestClient(app)
+    # Один event loop на тест: соединения из пула не переходят между loop'ами
+    with TestClient(app) as client:
+        yield client
 
 
-@pytest.fixture
+@pytest_asyncio.fixture
 async def session() -> AsyncSession:
     async with SessionLocal() as session:
         yield session
+    await engine.dispose()
+
+
+def login(client: TestClient, username: str, password: str) -> str:
+    res = client.post(
+        "/token", data={"username": username, "password": password}
+    )
+    return res.json()["access_token"]
+
+
+@pytest.fixture
+def admin_token(client) -> str:
+    return login(client, "admin@example.com", "adminpass")
+
+
+@pytest.fixture
+def user_token(client) -> str:
+    return login(client, "testuser@example.com", "userpass")
+
+
+@pytest.fixture
+def signed_payment():
+    # Фабрика тела вебхука с верной подписью; transaction_id каждый раз новый
+    def make(user_id=1, account_id=1, amount=10.0) -> dict:
+        transaction_id = str(uuid.uuid4())
+        return {
+            "account_id": account_id,
+            "amount": amount,
+            "transaction_id": transaction_id,
+            "user_id": user_id,
+            "signature": generate_signature(
+                account_id=account_id,
+                amount=amount,
+                transaction_id=transaction_id,
+                user_id=user_id,
+                secret_key=settings.SECRET_KEY,
+            ),
+        }
+
+    return make
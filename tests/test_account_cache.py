@@ -0,0 +1,125 @@
+import uuid
+
+import orjson
+import pytest
+
+from app.account_cache import (
+    AccountCache,
+    AccountCacheBackend,
+    MemoryBackend,
+    account_cache,
+    load_backend,
+)
+from app.config import settings
+
+
+class SharedBackend(AccountCacheBackend):
+    """Stand-in for a shared store: entries live as bytes in `store`."""
+
+    def __init__(self, store: dict):
+        self.store = store
+
+    async def get(self, user_id):
+        data = self.store.get(user_id)
+        return None if data is None else orjson.loads(data)
+
+    async def set(self, user_id, accounts):
+        self.store[user_id] = orjson.dumps(accounts)
+
+    async def delete(self, user_id):
+        self.store.pop(user_id, None)
+
+    async def clear(self):
+        self.store.clear()
+
+
+def make_backend(maxsize, ttl):
+    return SharedBackend({})
+
+
+def test_load_backend():
+    assert isinstance(load_backend("memory", 10, 5), MemoryBackend)
+    backend = load_backend(f"{__name__}:make_backend", 10, 5)
+    assert isinstance(backend, SharedBackend)
+
+
+@pytest.mark.asyncio
+async def test_shared_backend_is_coherent_across_workers():
+    store = {}
+    first = AccountCache(SharedBackend(store))
+    second = AccountCache(SharedBackend(store))
+    accounts = [
+        {"id": 1, "user_id": 7, "balance": 10.0},
+        {"id": 2, "user_id": 7, "balance": 5.0},
+    ]
+
+    await first.fill(7, accounts, first.version(7))
+    assert await second.get(7) == accounts
+
+    await first.credit(7, 2, 2550)
+    assert [a["balance"] for a in await second.get(7)] == [10.0, 25.5]
+    # Более ранний коммит, завершившийся позже, баланс не уменьшает
+    await second.credit(7, 2, 1550)
+    assert [a["balance"] for a in await first.get(7)] == [10.0, 25.5]
+
+    # Счёт, которого нет в кэше, сбрасывает запись пользователя
+    await second.credit(7, 3, 100)
+    assert await first.get(7) is None
+
+
+@pytest.mark.asyncio
+async def test_fill_discarded_after_concurrent_write():
+    cache = AccountCache(MemoryBackend(10, 60))
+    version = cache.version(7)
+    await cache.invalidate(7)
+    await cache.fill(7, [{"id": 1, "balance": 1.0}], version)
+    assert await cache.get(7) is None
+
+    await cache.fill(7, [{"id": 1, "balance": 1.0}], cache.version(7))
+    assert await cache.get(7) == [{"id": 1, "balance": 1.0}]
+
+
+def test_accounts_served_from_cache_and_written_through(
+    monkeypatch, client, admin_token, signed_payment
+):
+    monkeypatch.setattr(settings, "DB_QUERY_HEADERS", True)
+    admin = {"Authorization": f"Bearer {admin_token}"}
+    email = f"cache-{uuid.uuid4().hex[:8]}@example.com"
+    user = client.post(
+        "/admin/users",
+        json={"email": email, "full_name": "Cache", "password": "secret"},
+        headers=admin,
+    ).json()
+    token = client.post(
+        "/token", data={"username": email, "password": "secret"}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    assert client.get("/users/me/accounts", headers=headers).json() == []
+    res = client.get("/users/me/accounts", headers=headers)
+    assert res.json() == []
+    assert res.headers["X-DB-Queries"] == "0"
+
+    # Новый счёт: запись пользователя сбрасывается и читается заново
+    account_id = 800_000 + user["id"]
+    payment = signed_payment(user["id"], account_id)
+    assert client.post("/webhook/payment", json=payment).status_code == 200
+    accounts = client.get("/users/me/accounts", headers=headers).json()
+    assert [a["id"] for a in accounts] == [account_id]
+
+    # Зачисление на известный счёт записывается в кэш
+    payment = signed_payment(user["id"], account_id, amount=2.5)
+    res = client.post("/webhook/payment", json=payment)
+    res = client.get("/users/me/accounts", headers=headers)
+    assert res.headers["X-DB-Queries"] == "0"
+    assert res.json()[0]["balance"] == 12.5
+
+    invalidations = account_cache.invalidations
+    client.put(
+        f"/admin/users/{user['id']}",
+        json={"email": email, "full_name": "Renamed", "password": "secret"},
+        headers=admin,
+    )
+    assert account_cache.invalidations == invalidations + 1
+    stats = client.get("/admin/cache/accounts", headers=admin).json()
+    assert stats["hits"] >= 2 and stats["writes"] >= 1
@@ -1,18 +1,271 @@
+import csv
+import io
+import json
+import random
+import uuid
+
 import pytest
 
+from app import export, user_import
+from app.config import settings
+from app.hashing import bulk_password_hasher, hash_password
 
-def get_admin_token(client):
-    res = client.post(
-        "/token",
-        data={"username": "admin@example.com", "password": "adminpass"},
+
+def test_admin_get_users(client, admin_token):
+    res = client.get(
+        "/admin/users", headers={"Authorization": f"Bearer {admin_token}"}
     )
-    return res.json()["access_token"]
+    assert res.status_code == 200
+    assert isinstance(res.json(), list)
 
 
-def test_admin_get_users(client):
-    token = get_admin_token(client)
+def test_admin_get_users_keyset_pages(client, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    first = client.get("/admin/users", params={"limit": 1}, headers=headers)
+    assert len(first.json()) == 1
+
+    cursor = first.headers["X-Next-Cursor"]
+    second = client.get(
+        "/admin/users",
+        params={"limit": 1, "cursor": cursor},
+        headers=headers,
+    )
+    assert second.json()[0]["id"] > first.json()[0]["id"]
+
+
+def test_admin_db_pool(client, admin_token):
     res = client.get(
-        "/admin/users", headers={"Authorization": f"Bearer {token}"}
+        "/admin/db/pool", headers={"Authorization": f"Bearer {admin_token}"}
     )
     assert res.status_code == 200
-    assert isinstance(res.json(), list)
+    body = res.json()
+    assert "pool" in body
+    assert "acquired" in body["wait"]
+
+
+def test_admin_idempotency_cache(client, admin_token):
+    res = client.get(
+        "/admin/cache/idempotency",
+        headers={"Authorization": f"Bearer {admin_token}"},
+    )
+    assert res.status_code == 200
+    assert {"hits", "misses", "entries"} <= res.json().keys()
+
+
+def test_admin_hashing_pool(client, admin_token):
+    res = client.get(
+        "/admin/hashing", headers={"Authorization": f"Bearer {admin_token}"}
+    )
+    assert res.status_code == 200
+    assert res.json()["completed"] >= 1
+    assert "queue_depth" in res.json()
+
+
+def test_admin_principal_cache(client, admin_token):
+    res = client.get(
+        "/admin/cache/principals",
+        headers={"Authorization": f"Bearer {admin_token}"},
+    )
+    assert res.status_code == 200
+    assert "hit_rate" in res.json()
+
+
+def test_admin_bulk_import_csv(client, monkeypatch, admin_token):
+    monkeypatch.setattr(bulk_password_hasher, "rounds", 4)
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    prefix = uuid.uuid4().hex[:8]
+    body = "\n".join(
+        [
+            "email,full_name,password",
+            f"{prefix}-1@example.com,First,secret1",
+            f"{prefix}-2@example.com,Second,secret2",
+            "not-an-email,Broken,secret",
+            f"{prefix}-1@example.com,Again,secret",
+            "testuser@example.com,Taken,secret",
+            "only,two",
+            "",
+        ]
+    )
+
+    def chunks():
+        # Тело приходит частями, строки режутся на границах частей
+        data = body.encode()
+        for i in range(0, len(data), 7):
+            yield data[i : i + 7]
+
+    response = client.post(
+        "/admin/users/bulk",
+        content=chunks(),
+        headers={**headers, "Content-Type": "text/csv"},
+    )
+    assert response.status_code == 200
+    report = response.json()
+    assert report["created"] == 2
+    assert report["failed"] == 4
+    errors = [(e["line"], e["error"]) for e in report["errors"]]
+    assert errors[0][0] == 4 and errors[0][1].startswith("email:")
+    assert errors[1:] == [
+        (5, "Duplicate email in file"),
+        (6, "Email already registered"),
+        (7, "Expected 3 fields, got 2"),
+    ]
+
+    login = client.post(
+        "/token",
+        data={"username": f"{prefix}-2@example.com", "password": "secret2"},
+    )
+    assert login.status_code == 200
+
+
+def test_admin_bulk_import_ndjson(client, monkeypatch, admin_token):
+    monkeypatch.setattr(bulk_password_hasher, "rounds", 4)
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    prefix = uuid.uuid4().hex[:8]
+    lines = [
+        json.dumps(
+            {
+                "email": f"{prefix}-{i}@example.com",
+                "full_name": f"User {i}",
+                "password": "pw",
+            }
+        )
+        for i in range(5)
+    ]
+    lines += ["{broken", json.dumps(["not", "an", "object"])]
+
+    response = client.post(
+        "/admin/users/bulk",
+        content="\n".join(lines),
+        headers={**headers, "Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    report = response.json()
+    assert report["created"] == 5
+    assert [e["line"] for e in report["errors"]] == [6, 7]
+
+    unsupported = client.post(
+        "/admin/users/bulk",
+        content="x",
+        headers={**headers, "Content-Type": "application/json"},
+    )
+    assert unsupported.status_code == 415
+
+
+@pytest.mark.asyncio
+async def test_bulk_import_rejects_long_line_within_chunk():
+    async def body():
+        # Длинная строка целиком в одной части вместе с переводом строки
+        yield b"email,full_name,password\n" + b"x" * 100 + b"\nok\n"
+
+    lines = user_import.iter_lines(body(), max_line=50)
+    assert await lines.__anext__() == (1, "email,full_name,password")
+    with pytest.raises(user_import.ImportFormatError, match="Line 2"):
+        await lines.__anext__()
+
+
+@pytest.mark.asyncio
+async def test_bulk_import_hashes_outside_transaction(session):
+    prefix = uuid.uuid4().hex[:8]
+
+    class Hasher:
+        async def hash(self, password):
+            # Пока идёт хеширование, соединение не занято
+            assert not session.in_transaction()
+            return hash_password(password, rounds=4)
+
+    async def records():
+        yield 1, {
+            "email": f"{prefix}@example.com",
+            "full_name": "Hashed",
+            "password": "secret",
+        }
+
+    report = user_import.ImportReport(10)
+    await user_import.import_users(session, records(), Hasher(), 10, report)
+    assert report.as_dict()["created"] == 1
+
+
+def test_admin_export_transactions(
+    client, monkeypatch, admin_token, signed_payment
+):
+    monkeypatch.setattr(settings, "EXPORT_BATCH_SIZE", 2)
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    account_id = random.randint(3_000_000, 3_999_999)
+    for amount in (1.0, 2.5, 3.25, 4.0, 5.75):
+        client.post(
+            "/webhook/payment",
+            json=signed_payment(account_id=account_id, amount=amount),
+        )
+
+    response = client.get(
+        "/admin/transactions/export",
+        params={"account_id": account_id},
+        headers={**headers, "Accept-Encoding": "gzip"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [r["amount"] for r in rows] == [
+        "1.00",
+        "2.50",
+        "3.25",
+        "4.00",
+        "5.75",
+    ]
+
+    # Продолжение с позиции второй строки
+    resumed = client.get(
+        "/admin/transactions/export",
+        params={
+            "account_id": account_id,
+            "format": "ndjson",
+            "after_created_at": rows[1]["created_at"],
+            "after_id": rows[1]["id"],
+        },
+        headers={**headers, "Accept-Encoding": "gzip;q=0, identity"},
+    )
+    assert "content-encoding" not in resumed.headers
+    items = [json.loads(line) for line in resumed.text.splitlines()]
+    assert [item["id"] for item in items] == [int(r["id"]) for r in rows[2:]]
+
+    half = client.get(
+        "/admin/transactions/export",
+        params={"after_id": 1},
+        headers=headers,
+    )
+    assert half.status_code == 400
+
+
+def test_export_accepts_gzip_by_q_value():
+    assert export.accepts_gzip("gzip, deflate")
+    assert export.accepts_gzip("br;q=1.0, gzip;q=0.5")
+    assert export.accepts_gzip("*")
+    assert not export.accepts_gzip("gzip;q=0")
+    assert not export.accepts_gzip("GZIP; q=0.000, *")
+    assert not export.accepts_gzip("*;q=0")
+    assert not export.accepts_gzip("identity")
+    assert not export.accepts_gzip("")
+
+
+def test_admin_revokes_user_refresh_tokens(client, admin_token):
+    tokens = client.post(
+        "/token",
+        data={"username": "testuser@example.com", "password": "userpass"},
+    ).json()
+    user = client.get(
+        "/users/me",
+        headers={"Authorization": f"Bearer {tokens['access_token']}"},
+    ).json()
+
+    res = client.delete(
+        f"/admin/users/{user['id']}/refresh-tokens",
+        headers={"Authorization": f"Bearer {admin_token}"},
+    )
+    assert res.status_code == 200
+    assert res.json()["revoked"] >= 1
+    res = client.post(
+        "/token/refresh", data={"refresh_token": tokens["refresh_token"]}
+    )
+    assert res.status_code == 401
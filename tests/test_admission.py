@@ -0,0 +1,129 @@
+import asyncio
+import uuid
+
+import httpx
+import pytest
+
+from app import admission
+from app.admission import AdmissionController, webhook_admission
+from app.cache import LRUCache
+from app.main import app
+
+
+def forged_payment():
+    return {
+        "account_id": 1,
+        "amount": 10.0,
+        "transaction_id": str(uuid.uuid4()),
+        "user_id": 1,
+        "signature": "0" * 64,
+    }
+
+
+def test_token_bucket_per_source(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+    controller = AdmissionController(rate=2, burst=2, max_in_flight=0)
+
+    assert controller.admit("a") is None
+    assert controller.admit("a") is None
+    assert controller.admit("a") == 0.5
+    # У другого источника своё ведро
+    assert controller.admit("b") is None
+
+    now[0] += 0.5
+    assert controller.admit("a") is None
+    assert controller.admit("a") == 0.5
+
+
+def test_in_flight_cap():
+    controller = AdmissionController(rate=0, burst=1, max_in_flight=2)
+    assert controller.admit("a") is None
+    assert controller.admit("b") is None
+    assert controller.admit("c") == controller.retry_after
+    controller.release()
+    assert controller.admit("c") is None
+    assert controller.stats()["max_seen_in_flight"] == 2
+
+
+def test_pool_capacity_sheds_only_behind_waiters():
+    load = [(3, 15, 0)]
+    controller = AdmissionController(
+        rate=0, burst=1, pool_load=lambda: load[0], max_pool_waiters=15
+    )
+    assert controller.admit("a") is None
+    # Все соединения заняты, но очередь к пулу ещё короткая
+    load[0] = (15, 15, 14)
+    assert controller.admit("a") is None
+    load[0] = (15, 15, 15)
+    assert controller.admit("a") == controller.retry_after
+    # Пул без предела (или ещё не создан) не ограничивает
+    load[0] = None
+    assert controller.admit("a") is None
+
+
+def test_webhook_shed_before_handler(monkeypatch, client):
+    monkeypatch.setattr(webhook_admission, "enabled", True)
+    monkeypatch.setattr(webhook_admission, "rate", 0)
+    monkeypatch.setattr(webhook_admission, "max_in_flight", 1)
+    shed = admission.admission_decisions.value(admission.SHED_IN_FLIGHT)
+
+    # Пока занят единственный слот, запрос отклоняется до проверки подписи
+    monkeypatch.setattr(webhook_admission, "in_flight", 1)
+    res = client.post("/webhook/payment", json=forged_payment())
+    assert res.status_code == 503
+    assert res.headers["Retry-After"] == "1"
+    assert (
+        admission.admission_decisions.value(admission.SHED_IN_FLIGHT)
+        == shed + 1
+    )
+
+    webhook_admission.in_flight = 0
+    res = client.post("/webhook/payment", json=forged_payment())
+    assert res.status_code == 403
+    assert webhook_admission.in_flight == 0
+
+    # Остальные маршруты не ограничиваются
+    webhook_admission.in_flight = 1
+    assert client.get("/").status_code == 200
+    webhook_admission.in_flight = 0
+
+
+def test_webhook_rate_limited_per_source(monkeypatch, client, admin_token):
+    monkeypatch.setattr(webhook_admission, "enabled", True)
+    monkeypatch.setattr(webhook_admission, "rate", 0.1)
+    monkeypatch.setattr(webhook_admission, "burst", 1)
+    monkeypatch.setattr(webhook_admission, "_buckets", LRUCache(10))
+
+    assert client.post("/webhook/payment", json=[]).status_code == 422
+    res = client.post("/webhook/payment", json=forged_payment())
+    assert res.status_code == 503
+    assert 1 <= int(res.headers["Retry-After"]) <= 10
+
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    stats = client.get("/admin/admission", headers=headers).json()
+    assert stats["sources"] == 1
+    assert stats["shed_rate"] >= 1
+    assert stats["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_concurrent_webhooks_above_pool_size_admitted(
+    session, monkeypatch, signed_payment
+):
+    monkeypatch.setattr(webhook_admission, "enabled", True)
+    monkeypatch.setattr(webhook_admission, "_buckets", LRUCache(10))
+    # Больше одновременных запросов, чем соединений в пуле (5 + 10)
+    payloads = [signed_payment(amount=1.0) for _ in range(25)]
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://test"
+    ) as client:
+        responses = await asyncio.gather(
+            *[client.post("/webhook/payment", json=p) for p in payloads]
+        )
+
+    ok = sum(r.status_code == 200 for r in responses)
+    assert ok >= 0.9 * len(responses), [r.status_code for r in responses]
+    assert webhook_admission.in_flight == 0
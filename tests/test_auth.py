@@ -1,4 +1,10 @@
+from datetime import timedelta
+
 import pytest
+from app import models, refresh_tokens
+from app.config import settings
+from app.database import SessionLocal
+from app.hashing import password_hasher
 
 
 def test_login_success(client):
@@ -16,3 +22,96 @@ def test_login_fail(client):
         data={"username": "testuser@example.com", "password": "wrong"},
     )
     assert response.status_code == 401
+
+
+def login(client):
+    return client.post(
+        "/token",
+        data={"username": "testuser@example.com", "password": "userpass"},
+    )
+
+
+async def stored_hash(email):
+    async with SessionLocal() as session:
+        user = await models.User.get_by_email(session, email)
+    return user.hashed_password
+
+
+def test_login_rehashes_password_when_cost_changes(client, monkeypatch):
+    rounds = password_hasher.rounds
+    monkeypatch.setattr(password_hasher, "rounds", 4)
+    assert login(client).status_code == 200
+    assert client.portal.call(stored_hash, "testuser@example.com").startswith(
+        "$2b$04$"
+    )
+
+    monkeypatch.setattr(password_hasher, "rounds", rounds)
+    assert login(client).status_code == 200
+    assert client.portal.call(stored_hash, "testuser@example.com").startswith(
+        f"$2b${rounds:02d}$"
+    )
+
+
+def refresh(client, token):
+    return client.post("/token/refresh", data={"refresh_token": token})
+
+
+def test_refresh_rotates_without_password_check(client, monkeypatch):
+    tokens = login(client).json()
+    assert tokens["refresh_token"]
+
+    async def no_bcrypt(*args):
+        raise AssertionError("refresh must not verify a password")
+
+    monkeypatch.setattr(password_hasher, "verify", no_bcrypt)
+    response = refresh(client, tokens["refresh_token"])
+    assert response.status_code == 200
+    rotated = response.json()
+    assert rotated["refresh_token"] != tokens["refresh_token"]
+    me = client.get(
+        "/users/me",
+        headers={"Authorization": f"Bearer {rotated['access_token']}"},
+    )
+    assert me.json()["email"] == "testuser@example.com"
+
+    assert refresh(client, rotated["refresh_token"]).status_code == 200
+    assert refresh(client, "not-a-token").status_code == 401
+
+
+def test_refresh_token_reuse_revokes_family(client):
+    first = login(client).json()["refresh_token"]
+    other_login = login(client).json()["refresh_token"]
+    second = refresh(client, first).json()["refresh_token"]
+
+    # Повторное предъявление обменянного токена отзывает всё семейство
+    assert refresh(client, first).status_code == 401
+    assert refresh(client, second).status_code == 401
+    # Другие входы пользователя не затронуты
+    assert refresh(client, other_login).status_code == 200
+
+
+def test_expired_used_token_does_not_revoke_family(client, monkeypatch):
+    first = login(client).json()["refresh_token"]
+    second = refresh(client, first).json()["refresh_token"]
+
+    # Старый токен предъявлен уже после истечения срока: это не кража
+    later = refresh_tokens._now() + timedelta(
+        days=settings.REFRESH_TOKEN_EXPIRE_DAYS + 1
+    )
+    monkeypatch.setattr(refresh_tokens, "_now", lambda: later)
+    outcomes = refresh_tokens.refresh_token_outcomes
+    reused = outcomes.value(refresh_tokens.REUSED)
+    assert refresh(client, first).status_code == 401
+    assert outcomes.value(refresh_tokens.REUSED) == reused
+
+    monkeypatch.undo()
+    assert refresh(client, second).status_code == 200
+
+
+def test_revoke_refresh_token(client):
+    token = login(client).json()["refresh_token"]
+    response = client.post("/token/revoke", data={"refresh_token": token})
+    assert response.status_code == 204
+    assert refresh(client, token).status_code == 401
+    response = client.post("/token/revoke", data={"refresh_token": "x"})
+    assert response.status_code == 204
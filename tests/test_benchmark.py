@@ -0,0 +1,65 @@
+import json
+
+from benchmarks import api
+
+
+def test_percentile_nearest_rank():
+    samples = [float(i) for i in range(1, 101)]
+    assert api.percentile(samples, 50) == 50.0
+    assert api.percentile(samples, 99) == 99.0
+    assert api.percentile([], 95) == 0.0
+
+
+def test_compare_flags_regressions():
+    baseline = {
+        "endpoints": {
+            "webhook": {
+                "requests": 10,
+                "rps": 100.0,
+                "p95_ms": 10.0,
+                "p99_ms": 20.0,
+            }
+        }
+    }
+    slower = {
+        "endpoints": {
+            "webhook": {
+                "requests": 10,
+                "rps": 80.0,
+                "p95_ms": 10.5,
+                "p99_ms": 30.0,
+            }
+        }
+    }
+    regressions = api.compare(slower, baseline, max_regression=10)
+    assert len(regressions) == 2
+    assert api.compare(baseline, baseline, max_regression=10) == []
+
+
+def test_in_process_run_writes_result(tmp_path):
+    output = tmp_path / "bench.json"
+    code = api.main(
+        [
+            "--requests",
+            "30",
+            "--concurrency",
+            "3",
+            "--warmup",
+            "2",
+            "--mix",
+            "webhook=3,duplicate=1,hot=1,history=1",
+            "--output",
+            str(output),
+        ]
+    )
+    assert code == 0
+    result = json.loads(output.read_text())
+    assert set(result["endpoints"]) == {
+        "webhook",
+        "duplicate",
+        "hot",
+        "history",
+    }
+    webhook = result["endpoints"]["webhook"]
+    assert webhook["statuses"] == {"200": webhook["requests"]}
+    assert webhook["p50_ms"] <= webhook["p95_ms"] <= webhook["p99_ms"]
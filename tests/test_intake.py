@@ -0,0 +1,227 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+
+import pytest
+
+from app import intake, payments
+from app.config import settings
+from app.database import SessionLocal
+from app.intake import IntakeLog, intake_log
+
+
+async def wait_applied(log: IntakeLog, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while log.offset < log.size:
+        assert time.monotonic() < deadline, log.stats()
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_intake_log_group_commit_and_replay(session, tmp_path):
+    path = str(tmp_path / "intake.log")
+    log = IntakeLog(path, SessionLocal)
+    await log.start()
+    credits = [
+        payments.Credit(str(uuid.uuid4()), 1, 1, 100) for _ in range(20)
+    ]
+
+    await asyncio.gather(*[log.append(c) for c in credits])
+    assert log.appended == 20
+    assert log.fsyncs < 20
+    await wait_applied(log)
+    assert log.applied == 20
+    assert log.stats()["depth"] == 0
+    await log.stop()
+
+    # Контрольная точка потеряна, в конце недописанная строка: после
+    # перезапуска журнал переносится заново без двойного зачисления
+    os.remove(log.checkpoint_path)
+    with open(path, "ab") as f:
+        f.write(b'{"transaction_id":')
+    replay = IntakeLog(path, SessionLocal)
+    await replay.start()
+    assert replay.stats()["depth"] == 20
+    await wait_applied(replay)
+    assert replay.duplicates == 20
+    assert replay.applied == 0
+    await replay.stop()
+
+
+@pytest.mark.asyncio
+async def test_intake_log_compacts_off_the_event_loop(
+    session, tmp_path, monkeypatch
+):
+    log = IntakeLog(
+        str(tmp_path / "intake.log"), SessionLocal, compact_bytes=1
+    )
+    threads = []
+    compact = log._compact
+
+    def record_thread():
+        threads.append(threading.current_thread())
+        compact()
+
+    monkeypatch.setattr(log, "_compact", record_thread)
+    await log.start()
+    await log.append(payments.Credit(str(uuid.uuid4()), 1, 1, 100))
+    deadline = time.monotonic() + 10
+    while not threads:
+        assert time.monotonic() < deadline, log.stats()
+        await asyncio.sleep(0.01)
+    await log.stop()
+
+    # Усечение и fsync выполняются в потоке, а не в цикле событий
+    assert threads[0] is not threading.main_thread()
+    assert log.size == log.offset == 0
+    assert os.path.getsize(log.path) == 0
+
+
+@pytest.mark.asyncio
+async def test_intake_log_rolls_back_failed_write(
+    session, tmp_path, monkeypatch
+):
+    log = IntakeLog(str(tmp_path / "intake.log"), SessionLocal)
+    await log.start()
+    await log.append(payments.Credit(str(uuid.uuid4()), 1, 1, 100))
+    await wait_applied(log)
+    size = log.size
+
+    # Данные записаны, но fsync не прошёл: клиент получит ошибку, а
+    # неподтверждённые байты не должны остаться в журнале
+    fsync = os.fsync
+    calls = []
+
+    def failing_fsync(fd):
+        calls.append(fd)
+        if len(calls) == 1:
+            raise OSError("disk error")
+        fsync(fd)
+
+    monkeypatch.setattr(intake.os, "fsync", failing_fsync)
+    with pytest.raises(OSError):
+        await log.append(payments.Credit(str(uuid.uuid4()), 1, 1, 100))
+    assert log.size == size
+    assert os.path.getsize(log.path) == size
+
+    await log.append(payments.Credit(str(uuid.uuid4()), 1, 1, 200))
+    await wait_applied(log)
+    assert log.applied == 2
+    assert log.rejected == 0
+    await log.stop()
+
+
+@pytest.mark.asyncio
+async def test_intake_poison_entry_moved_to_dead_letters(
+    session, tmp_path, monkeypatch
+):
+    poison = str(uuid.uuid4())
+    apply_credits = payments.apply_credits
+
+    async def failing_apply(session, credits):
+        if any(c.transaction_id == poison for c in credits):
+            raise ValueError("poison")
+        return await apply_credits(session, credits)
+
+    monkeypatch.setattr(payments, "apply_credits", failing_apply)
+    log = IntakeLog(
+        str(tmp_path / "intake.log"),
+        SessionLocal,
+        flush_window=0.05,
+        retry_delay=0,
+        max_attempts=3,
+    )
+    await log.start()
+    good = payments.Credit(str(uuid.uuid4()), 1, 1, 100)
+    await asyncio.gather(
+        log.append(good),
+        log.append(payments.Credit(poison, 1, 1, 100)),
+    )
+    await wait_applied(log)
+    await log.stop()
+
+    # Пакет не застревает: исправная запись перенесена, сбойная отложена
+    assert log.applied == 1
+    assert log.apply_errors == 2
+    assert log.stats()["dead_lettered"] == 1
+    with open(log.dead_letter_path) as f:
+        (record,) = [json.loads(line) for line in f]
+    assert json.loads(record["entry"])["transaction_id"] == poison
+    assert record["reason"] == "error"
+    assert "poison" in record["error"]
+
+
+@pytest.fixture
+def intake_mode(monkeypatch, tmp_path):
+    # Включается до старта приложения: журнал поднимает lifespan
+    monkeypatch.setattr(settings, "INTAKE_ENABLED", True)
+    path = str(tmp_path / "intake.log")
+    monkeypatch.setattr(intake_log, "base_path", path)
+    monkeypatch.setattr(intake_log, "path", path)
+    yield
+    assert intake_log.running is False
+
+
+def test_webhook_intake_mode(intake_mode, client, admin_token, signed_payment):
+    payment = signed_payment(amount=4.0)
+    response = client.post("/webhook/payment", json=payment)
+    assert response.status_code == 202
+    assert response.json()["status"] == "accepted"
+
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    deadline = time.monotonic() + 10
+    while True:
+        stats = client.get("/admin/intake", headers=headers).json()
+        if stats["depth"] == 0:
+            break
+        assert time.monotonic() < deadline, stats
+        time.sleep(0.01)
+    assert stats["enabled"] is True
+    assert stats["applied"] >= 1
+
+    # Перенесённый платёж попал в кэш идемпотентности
+    retry = client.post("/webhook/payment", json=payment)
+    assert retry.status_code == 409
+
+    # Платёж несуществующего пользователя тоже получает 202, но отказ
+    # при переносе остаётся в файле отложенных записей
+    unknown = signed_payment(user_id=987654321, account_id=987654321)
+    assert client.post("/webhook/payment", json=unknown).status_code == 202
+    deadline = time.monotonic() + 10
+    while True:
+        dead = client.get("/admin/intake/dead-letters", headers=headers).json()
+        if dead:
+            break
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    (record,) = dead
+    assert record["reason"] == payments.USER_NOT_FOUND
+    entry = json.loads(record["entry"])
+    assert entry["transaction_id"] == unknown["transaction_id"]
+
+
+@pytest.mark.asyncio
+async def test_intake_log_slot_per_worker(session, tmp_path):
+    path = str(tmp_path / "intake.log")
+    first = IntakeLog(path, SessionLocal)
+    second = IntakeLog(path, SessionLocal)
+    await first.start()
+    await second.start()
+    try:
+        assert first.path == path
+        assert second.path == path + ".1"
+        credit = payments.Credit(str(uuid.uuid4()), 1, 1, 100)
+        await second.append(credit)
+        await wait_applied(second)
+    finally:
+        await first.stop()
+        await second.stop()
+
+    # Освободившийся слот достаётся следующему процессу
+    third = IntakeLog(path, SessionLocal)
+    await third.start()
+    assert third.path == path
+    await third.stop()
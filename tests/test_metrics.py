@@ -0,0 +1,57 @@
+from app.metrics import Histogram, Registry
+
+
+def sample(text: str, name: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(name + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    histogram = registry.register(
+        Histogram("stage_seconds", "Stage time", ("stage",), (0.01, 0.1))
+    )
+    histogram.observe(0.005, "a")
+    histogram.observe(0.05, "a")
+    histogram.observe(0.01, "a")
+    histogram.observe(3.0, "a")
+
+    text = registry.render()
+    assert "# TYPE stage_seconds histogram" in text
+    assert 'stage_seconds_bucket{stage="a",le="0.01"} 2' in text
+    assert 'stage_seconds_bucket{stage="a",le="0.1"} 3' in text
+    assert 'stage_seconds_bucket{stage="a",le="+Inf"} 4' in text
+    assert 'stage_seconds_count{stage="a"} 4' in text
+    assert histogram.count("a") == 4
+
+
+def test_metrics_endpoint(client, signed_payment):
+    route = '{method="POST",handler="handle_webhook",status="%s"}'
+    before = client.get("/metrics").text
+
+    payment = signed_payment()
+    assert client.post("/webhook/payment", json=payment).status_code == 200
+    assert client.post("/webhook/payment", json=payment).status_code == 409
+    forged = dict(signed_payment(), signature="0" * 64)
+    assert client.post("/webhook/payment", json=forged).status_code == 403
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+
+    for code, added in (("200", 1), ("409", 1), ("403", 1)):
+        name = "http_requests_total" + route % code
+        assert sample(text, name) == sample(before, name) + added
+    for outcome in ("success", "duplicate", "invalid_signature"):
+        name = 'webhook_outcomes_total{outcome="%s"}' % outcome
+        assert sample(text, name) >= sample(before, name) + 1
+    for stage in ("normalize", "signature", "dedup", "credit"):
+        name = 'webhook_stage_duration_seconds_count{stage="%s"}' % stage
+        assert sample(text, name) > sample(before, name)
+    assert (
+        'http_request_duration_seconds_bucket{method="POST",'
+        'handler="handle_webhook",le="+Inf"}' in text
+    )
@@ -0,0 +1,40 @@
+import random
+from decimal import Decimal
+
+import pytest
+
+from app.money import format_cents, to_cents, to_decimal, to_float
+
+
+def test_to_cents_matches_decimal_quantize():
+    # Прежняя нормализация вебхука: Decimal(str(round(v, 2))).quantize
+    rng = random.Random(24)
+    amounts = [rng.uniform(0, 10_000_000) for _ in range(10_000)]
+    amounts += [0.005, 0.015, 1.005, 2.675, 99999999.99]
+    for amount in amounts:
+        expected = Decimal(str(round(amount, 2))).quantize(Decimal("0.00"))
+        assert to_cents(amount) == int(expected * 100)
+
+
+def test_to_cents_of_exact_amounts():
+    assert to_cents(Decimal("123.45")) == 12345
+    assert to_cents("0.125") == 12
+    assert to_cents(7) == 700
+
+
+@pytest.mark.parametrize(
+    "amount", [float("inf"), float("nan"), Decimal("Infinity"), "NaN"]
+)
+def test_to_cents_rejects_non_finite(amount):
+    with pytest.raises(ValueError):
+        to_cents(amount)
+
+
+def test_cents_back_to_wire_values():
+    assert format_cents(1250) == "12.50"
+    assert format_cents(5) == "0.05"
+    assert format_cents(-105) == "-1.05"
+    assert format_cents(10**16) == "100000000000000.00"
+    assert to_float(1999) == 19.99
+    assert str(to_decimal(1375)) == "13.75"
+    assert str(to_decimal(0)) == "0.00"
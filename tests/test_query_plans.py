@@ -0,0 +1,239 @@
+import inspect
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models, payments, refresh_tokens, rollups
+from app.database import engine
+
+SEED_USERS = 20_000
+SEED_TRANSACTIONS_PER_ACCOUNT = 10
+SEED_REFRESH_TOKEN = "plan-refresh-token"
+TABLES = {
+    "users",
+    "accounts",
+    "transactions",
+    "account_daily_totals",
+    "refresh_tokens",
+}
+
+
+async def seed(conn):
+    await conn.execute(
+        text(
+            "INSERT INTO users (email, full_name, hashed_password, is_admin) "
+            "SELECT 'plan-' || g || '@example.com', 'Seed', 'x', false "
+            "FROM generate_series(1, :n) g"
+        ),
+        {"n": SEED_USERS},
+    )
+    await conn.execute(
+        text(
+            "INSERT INTO accounts (user_id, account_number, balance_cents) "
+            "SELECT id, gen_random_uuid()::text, 0 FROM users "
+            "WHERE email LIKE 'plan-%'"
+        )
+    )
+    await conn.execute(
+        text(
+            "INSERT INTO transactions "
+            "(transaction_id, user_id, account_id, amount_cents, created_at) "
+            "SELECT gen_random_uuid(), a.user_id, a.id, g * 100 + 50, "
+            "now() - g * interval '1 hour' "
+            "FROM accounts a JOIN users u ON u.id = a.user_id, "
+            "generate_series(1, :n) g WHERE u.email LIKE 'plan-%'"
+        ),
+        {"n": SEED_TRANSACTIONS_PER_ACCOUNT},
+    )
+    await conn.execute(rollups.backfill_statement())
+    await conn.execute(
+        text(
+            "INSERT INTO refresh_tokens "
+            "(token_hash, family_id, user_id, expires_at) "
+            "SELECT :token_hash, gen_random_uuid(), id, "
+            "now() + interval '30 days' FROM users "
+            "WHERE email = 'plan-1@example.com'"
+        ),
+        {"token_hash": refresh_tokens.hash_token(SEED_REFRESH_TOKEN)},
+    )
+    await conn.execute(
+        text(
+            "INSERT INTO refresh_tokens "
+            "(token_hash, family_id, user_id, expires_at) "
+            "SELECT md5(id::text) || md5(email), gen_random_uuid(), id, "
+            "now() + interval '30 days' FROM users "
+            "WHERE email LIKE 'plan-%'"
+        )
+    )
+    for table in sorted(TABLES):
+        await conn.execute(text(f"ANALYZE {table}"))
+    return (
+        await conn.execute(
+            text(
+                "SELECT a.user_id, a.id FROM accounts a "
+                "JOIN users u ON u.id = a.user_id "
+                "WHERE u.email = 'plan-1@example.com'"
+            )
+        )
+    ).one()
+
+
+def model_queries(user_id, account_id):
+    """One representative call for every query classmethod of the models."""
+    now = datetime.now(timezone.utc)
+    return {
+        (models.User, "get_by_email"): lambda db: models.User.get_by_email(
+            db, "plan-1@example.com"
+        ),
+        (models.User, "get_by_id"): lambda db: models.User.get_by_id(
+            db, user_id
+        ),
+        (models.User, "get_users"): lambda db: models.User.get_users(
+            db, limit=101, after_id=user_id
+        ),
+        (models.User, "get_existing_ids"): (
+            lambda db: models.User.get_existing_ids(db, {user_id, 1})
+        ),
+        (models.User, "get_existing_emails"): (
+            lambda db: models.User.get_existing_emails(
+                db, {"plan-1@example.com", "plan-2@example.com"}
+            )
+        ),
+        (models.Account, "get_user_accounts"): (
+            lambda db: models.Account.get_user_accounts(
+                db, user_id, limit=101, after=(now, 0)
+            )
+        ),
+        (models.Account, "get_owners"): lambda db: models.Account.get_owners(
+            db, {account_id, 1}
+        ),
+        (models.Transaction, "exists"): lambda db: models.Transaction.exists(
+            db, str(uuid.uuid4())
+        ),
+        (models.Transaction, "get_recent_ids"): (
+            lambda db: models.Transaction.get_recent_ids(db, 100)
+        ),
+        (models.Transaction, "get_user_transactions"): (
+            lambda db: models.Transaction.get_user_transactions(
+                db,
+                user_id,
+                limit=101,
+                after=(now - timedelta(days=1), 0),
+                date_to=now,
+                account_id=account_id,
+                amount_min_cents=100,
+                amount_max_cents=500,
+            )
+        ),
+        (models.Transaction, "stream_transactions"): (
+            lambda db: models.Transaction.stream_transactions(
+                db,
+                [models.Transaction.id, models.Transaction.created_at],
+                after=(now - timedelta(hours=2), 0),
+                date_to=now,
+            )
+        ),
+        (models.AccountDailyTotal, "get_days"): (
+            lambda db: models.AccountDailyTotal.get_days(
+                db, account_id, (now - timedelta(days=31)).date(), now.date()
+            )
+        ),
+    }
+
+
+def query_classmethods():
+    for model in (
+        models.User,
+        models.Account,
+        models.Transaction,
+        models.AccountDailyTotal,
+    ):
+        for name, member in vars(model).items():
+            if isinstance(member, classmethod) and inspect.iscoroutinefunction(
+                member.__func__
+            ):
+                yield model, name
+
+
+def seq_scans(plan):
+    """Yield relations read with a sequential scan anywhere in the plan."""
+    if plan.get("Node Type") == "Seq Scan":
+        yield plan.get("Relation Name")
+    for child in plan.get("Plans", []):
+        yield from seq_scans(child)
+
+
+async def scanned_tables(conn, call) -> set:
+    """Run `call` in a savepoint and EXPLAIN every statement it issued."""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(conn.sync_connection, "before_cursor_execute", capture)
+    try:
+        savepoint = await conn.begin_nested()
+        async with AsyncSession(
+            bind=conn, join_transaction_mode="create_savepoint"
+        ) as db:
+            await call(db)
+        await savepoint.rollback()
+    finally:
+        event.remove(conn.sync_connection, "before_cursor_execute", capture)
+
+    assert statements, "no query issued"
+    scanned = set()
+    for statement, parameters in statements:
+        if statement.startswith(("SAVEPOINT", "RELEASE", "ROLLBACK")):
+            continue
+        plan = await conn.exec_driver_sql(
+            "EXPLAIN (FORMAT JSON) " + statement, parameters
+        )
+        scanned |= set(seq_scans(plan.scalar()[0]["Plan"])) & TABLES
+    return scanned
+
+
+@pytest.mark.asyncio
+async def test_model_queries_use_indexes():
+    async with engine.connect() as conn:
+        trans = await conn.begin()
+        try:
+            user_id, account_id = await seed(conn)
+            queries = model_queries(user_id, account_id)
+            assert set(queries) == set(query_classmethods())
+
+            credit = payments.Credit(
+                str(uuid.uuid4()), user_id, account_id, 100
+            )
+            calls = {
+                f"{model.__name__}.{name}": call
+                for (model, name), call in queries.items()
+            }
+            calls["payments.credit_account"] = lambda db: db.execute(
+                payments._credit_statement(credit)
+            )
+            calls["payments.apply_credits"] = (
+                lambda db: payments._apply_credits(db, [credit])
+            )
+            calls["refresh_tokens.rotate"] = lambda db: refresh_tokens.rotate(
+                db, SEED_REFRESH_TOKEN
+            )
+            calls["refresh_tokens.revoke_family"] = (
+                lambda db: refresh_tokens.revoke_family(db, uuid.uuid4())
+            )
+            calls["refresh_tokens.revoke_user"] = (
+                lambda db: refresh_tokens.revoke_user(db, user_id)
+            )
+
+            problems = {}
+            for name, call in calls.items():
+                scanned = await scanned_tables(conn, call)
+                if scanned:
+                    problems[name] = scanned
+            assert not problems, f"Sequential scans: {problems}"
+        finally:
+            await trans.rollback()
+    await engine.dispose()
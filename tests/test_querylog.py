@@ -0,0 +1,52 @@
+import logging
+
+from app.account_cache import account_cache
+from app.config import settings
+from app.querylog import fingerprint
+
+
+def test_fingerprint_normalizes_literals_and_lists():
+    short, text = fingerprint(
+        "SELECT id FROM users WHERE id IN ($1, $2) AND email = 'a@b.c'"
+    )
+    long, _ = fingerprint(
+        "SELECT id FROM users\n WHERE id IN ($1, $2, $3) AND email = 'x'"
+    )
+    assert short == long
+    assert text == "SELECT id FROM users WHERE id IN (...) AND email = ?"
+
+
+def test_query_headers_per_request(client, monkeypatch, user_token):
+    monkeypatch.setattr(settings, "DB_QUERY_HEADERS", True)
+    headers = {"Authorization": f"Bearer {user_token}"}
+
+    client.get("/users/me", headers=headers)
+    # Принципал уже в кэше: повторный /users/me не ходит в БД
+    response = client.get("/users/me", headers=headers)
+    assert response.headers["X-DB-Queries"] == "0"
+    assert float(response.headers["X-DB-Time"]) == 0.0
+
+    response = client.get("/users/me/accounts", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["X-DB-Queries"] == "1"
+    assert float(response.headers["X-DB-Time"]) > 0
+
+
+def test_query_headers_are_opt_in(client):
+    response = client.get("/utils/generate-uuid")
+    assert "X-DB-Queries" not in response.headers
+
+
+def test_slow_query_log(client, monkeypatch, caplog, user_token):
+    monkeypatch.setattr(settings, "DB_SLOW_QUERY_MS", 0)
+    monkeypatch.setattr(account_cache, "enabled", False)
+    headers = {"Authorization": f"Bearer {user_token}"}
+    with caplog.at_level(logging.WARNING, logger="app.querylog"):
+        client.get("/users/me/accounts", headers=headers)
+
+    records = [r for r in caplog.records if r.name == "app.querylog"]
+    assert records
+    record = records[-1]
+    assert record.fingerprint == fingerprint(record.statement)[0]
+    assert "FROM accounts" in record.statement
+    assert record.duration_ms >= 0
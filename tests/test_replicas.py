@@ -0,0 +1,76 @@
+import pytest
+from sqlalchemy import text
+
+from app import database
+from app.account_cache import account_cache
+from app.config import settings
+from app.database import ReplicaSet, open_read_session, recent_writes
+
+# Недоступная «реплика»: соединение сразу отклоняется
+DOWN_URL = "postgresql+asyncpg://postgres@127.0.0.1:1/fastapi_app"
+
+
+async def read_only(session) -> str:
+    return await session.scalar(text("SHOW default_transaction_read_only"))
+
+
+@pytest.mark.asyncio
+async def test_replica_round_robin_and_fallback(session, monkeypatch):
+    replicas = ReplicaSet(
+        [settings.DATABASE_URL, DOWN_URL], retry_after=60, connect_timeout=1
+    )
+    monkeypatch.setattr(database, "replicas", replicas)
+    try:
+        async with await open_read_session() as first:
+            assert await read_only(first) == "on"
+        # Вторая по очереди реплика недоступна: берём следующую здоровую
+        async with await open_read_session() as second:
+            assert await read_only(second) == "on"
+        assert replicas.sessions == [2, 0]
+        assert replicas.failures == [0, 1]
+        assert [r["healthy"] for r in replicas.status()] == [True, False]
+
+        async with await open_read_session() as third:
+            assert await read_only(third) == "on"
+        assert replicas.failures == [0, 1]
+
+        replicas.mark_down(0, RuntimeError("lagging"))
+        async with await open_read_session() as primary:
+            assert await read_only(primary) == "off"
+        assert replicas.fallbacks == 1
+
+        async with await open_read_session(primary=True) as primary:
+            assert await read_only(primary) == "off"
+        assert replicas.fallbacks == 1
+    finally:
+        await replicas.dispose()
+
+
+def test_user_reads_go_to_primary_after_webhook(
+    monkeypatch, client, user_token, signed_payment
+):
+    replicas = ReplicaSet([settings.DATABASE_URL])
+    monkeypatch.setattr(database, "replicas", replicas)
+    monkeypatch.setattr(account_cache, "enabled", False)
+    recent_writes.clear()
+    headers = {"Authorization": f"Bearer {user_token}"}
+
+    assert client.get("/users/me/accounts", headers=headers).status_code == 200
+    assert replicas.sessions == [1]
+
+    res = client.post("/webhook/payment", json=signed_payment())
+    assert res.status_code == 200
+    balance = res.json()["new_balance"]
+    accounts = client.get("/users/me/accounts", headers=headers).json()
+    assert replicas.sessions == [1]
+    account = next(a for a in accounts if a["id"] == 1)
+    assert f"{account['balance']:.2f}" == balance
+
+    recent_writes.clear()
+    client.get("/users/me/accounts", headers=headers)
+    assert replicas.sessions == [2]
+    client.get(
+        "/users/me/accounts",
+        headers={**headers, "X-Read-Consistency": "primary"},
+    )
+    assert replicas.sessions == [2]
@@ -0,0 +1,81 @@
+import uuid
+
+import pytest
+
+from app.money import to_cents
+from app.security import WebhookSigner, generate_signature
+
+
+def payload(amount=12.5):
+    return {
+        "account_id": 3,
+        "amount": amount,
+        "transaction_id": str(uuid.uuid4()),
+        "user_id": 2,
+    }
+
+
+def in_cents(data):
+    """The payload as the signer takes it, with the amount in cents."""
+    return {
+        "account_id": data["account_id"],
+        "amount_cents": to_cents(data["amount"]),
+        "transaction_id": data["transaction_id"],
+        "user_id": data["user_id"],
+    }
+
+
+def test_signer_matches_generate_signature():
+    data = payload()
+    signer = WebhookSigner(["primary", "old"])
+    assert signer.sign(**in_cents(data)) == generate_signature(
+        **data, secret_key="primary"
+    )
+    # Состояние ключа копируется, а не дописывается между сообщениями
+    assert signer.sign(**in_cents(data)) == signer.sign(**in_cents(data))
+
+
+def test_signer_signs_cents_like_float_amounts():
+    # Подписи, выданные до перехода на копейки, остаются верными
+    signer = WebhookSigner(["key"])
+    for amount in (0.01, 0.1, 1.005, 10.0, 19.99, 123.45, 99999999.99):
+        data = payload(amount)
+        expected = generate_signature(**data, secret_key="key")
+        assert signer.sign(**in_cents(data)) == expected
+
+
+def test_signer_accepts_every_active_key():
+    data = payload()
+    signer = WebhookSigner(["new", "old"])
+    for key in ("new", "old"):
+        signature = generate_signature(**data, secret_key=key)
+        assert signer.verify(signature, **in_cents(data))
+    retired = generate_signature(**data, secret_key="retired")
+    assert not signer.verify(retired, **in_cents(data))
+    assert not signer.verify("not-hex", **in_cents(data))
+    # Та же подпись в другой записи не принимается
+    signature = signer.sign(**in_cents(data))
+    for variant in (signature.upper(), f" {signature}", signature + "\n"):
+        assert not signer.verify(variant, **in_cents(data))
+    assert not signer.verify(
+        signer.sign(**in_cents(data)), **in_cents(payload())
+    )
+
+
+def test_signer_verify_batch_keeps_order():
+    good, other = in_cents(payload()), in_cents(payload(amount=99.99))
+    signer = WebhookSigner(["key"])
+    items = [
+        (signer.sign(**good), *good.values()),
+        ("0" * 64, *good.values()),
+        (signer.sign(**good), *other.values()),
+        (signer.sign(**other), *other.values()),
+    ]
+    assert signer.verify_batch(items) == [True, False, False, True]
+
+
+def test_signer_without_keys():
+    signer = WebhookSigner([None, ""])
+    with pytest.raises(RuntimeError):
+        signer.sign(**in_cents(payload()))
+    assert signer.verify("0" * 64, **in_cents(payload())) is False
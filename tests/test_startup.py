@@ -0,0 +1,29 @@
+from benchmarks import startup
+
+
+def test_app_import_is_lazy_and_within_budget():
+    result = startup.measure(runs=3, first_request=False)
+    assert result["eager_modules"] == []
+    assert result["import_ms"] < startup.IMPORT_BUDGET_MS
+
+
+def test_first_request_within_budget():
+    elapsed = startup.measure_first_request()
+    assert elapsed < startup.FIRST_REQUEST_BUDGET_MS
+
+
+def test_server_options(monkeypatch):
+    from app.config import settings
+    from app.serve import server_options
+
+    monkeypatch.setattr(settings, "SERVER_WORKERS", 0)
+    monkeypatch.setattr(settings, "SERVER_MAX_REQUESTS", 0)
+    options = server_options()
+    assert options["workers"] == 1
+    assert options["limit_max_requests"] is None
+
+    monkeypatch.setattr(settings, "SERVER_WORKERS", 8)
+    monkeypatch.setattr(settings, "SERVER_MAX_REQUESTS", 10_000)
+    options = server_options()
+    assert options["workers"] == 8
+    assert options["limit_max_requests"] == 10_000
@@ -1,18 +1,224 @@
+import random
+import time
+import uuid
+from datetime import date
+from decimal import Decimal
 import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import update
+from app import auth, models, rollups, schemas
+from app.auth import principal_cache
+from app.database import SessionLocal
 
 
-def get_token(client):
-    res = client.post(
-        "/token",
-        data={"username": "testuser@example.com", "password": "userpass"},
+def test_get_me(client, user_token):
+    response = client.get(
+        "/users/me", headers={"Authorization": f"Bearer {user_token}"}
+    )
+    assert response.status_code == 200
+    assert "email" in response.json()
+
+
+def test_get_me_served_from_principal_cache(
+    client, monkeypatch, user_token
+):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    client.get("/users/me", headers=headers)
+
+    # Попадание в кэш не открывает сессию и не берёт соединение из пула
+    def no_session():
+        raise AssertionError("cached principal must not open a session")
+
+    monkeypatch.setattr(auth, "SessionLocal", no_session)
+    hits = principal_cache.hits
+    response = client.get("/users/me", headers=headers)
+    assert response.status_code == 200
+    assert principal_cache.hits == hits + 1
+
+
+def test_admin_update_invalidates_principal_cache(client, admin_token):
+    admin = {"Authorization": f"Bearer {admin_token}"}
+    email = f"{uuid.uuid4().hex}@example.com"
+    user = {"email": email, "full_name": "Before", "password": "secret"}
+    created = client.post("/admin/users", json=user, headers=admin)
+    user_id = created.json()["id"]
+
+    token = client.post(
+        "/token", data={"username": email, "password": "secret"}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/users/me", headers=headers).json()["full_name"] == (
+        "Before"
+    )
+
+    user["full_name"] = "After"
+    client.put(f"/admin/users/{user_id}", json=user, headers=admin)
+    assert client.get("/users/me", headers=headers).json()["full_name"] == (
+        "After"
+    )
+
+
+def test_principal_cache_index_drops_evicted_tokens(monkeypatch):
+    cache = auth.PrincipalCache(maxsize=2, ttl=60)
+    alice = schemas.User(
+        id=1, email="alice@example.com", full_name="Alice", is_admin=False
     )
-    return res.json()["access_token"]
+    bob = schemas.User(
+        id=2, email="bob@example.com", full_name="Bob", is_admin=False
+    )
+    cache.set("a1", alice)
+    cache.set("a2", alice)
+    cache.set("b1", bob)
+    assert cache.by_user == {1: {"a2"}, 2: {"b1"}}
+
+    # Истёкший токен уходит из индекса вместе с записью
+    cache.set("b2", bob, expires_at=time.time() + 1)
+    later = time.monotonic() + 2
+    monkeypatch.setattr(time, "monotonic", lambda: later)
+    assert cache.get("b2") is None
+    assert cache.by_user == {2: {"b1"}}
+
 
+def test_get_transactions_keyset_pages(client, user_token, signed_payment):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    # Своя сумма на прогон: страницы не зависят от накопленной истории
+    amount = random.randint(100_000, 9_999_999) / 100
+    for _ in range(3):
+        client.post("/webhook/payment", json=signed_payment(amount=amount))
+    only_these = {"amount_min": amount, "amount_max": amount}
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **only_these}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get(
+            "/users/me/transactions", params=params, headers=headers
+        )
+        assert response.status_code == 200
+        assert len(response.json()) <= 2
+        seen.extend(t["id"] for t in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert len(seen) == len(set(seen)) >= 3
+    everything = client.get(
+        "/users/me/transactions",
+        params={"limit": len(seen), **only_these},
+        headers=headers,
+    )
+    assert [t["id"] for t in everything.json()] == seen
+
+
+def test_get_transactions_filters(client, user_token, signed_payment):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    client.post("/webhook/payment", json=signed_payment(amount=123.45))
 
-def test_get_me(client):
-    token = get_token(client)
     response = client.get(
-        "/users/me", headers={"Authorization": f"Bearer {token}"}
+        "/users/me/transactions",
+        params={"account_id": 1, "amount_min": 123.45, "amount_max": 123.45},
+        headers=headers,
     )
     assert response.status_code == 200
-    assert "email" in response.json()
+    assert response.json()
+    assert all(t["amount"] == 123.45 for t in response.json())
+    assert all(t["account_id"] == 1 for t in response.json())
+
+
+def test_get_transactions_invalid_cursor(client, user_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    response = client.get(
+        "/users/me/transactions",
+        params={"cursor": "not-a-cursor"},
+        headers=headers,
+    )
+    assert response.status_code == 400
+
+
+async def response_model_body(schema, load):
+    """Render rows the way the response_model path did before the fast path."""
+    async with SessionLocal() as session:
+        objects = await load(session)
+    items = [schema.model_validate(obj) for obj in objects]
+    return JSONResponse(jsonable_encoder(items)).body
+
+
+def test_list_fast_path_matches_response_models(
+    client, user_token, signed_payment
+):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    client.post("/webhook/payment", json=signed_payment(amount=19.99))
+
+    transactions = client.get(
+        "/users/me/transactions", params={"limit": 1000}, headers=headers
+    )
+    expected = client.portal.call(
+        response_model_body,
+        schemas.Transaction,
+        lambda db: models.Transaction.get_user_transactions(db, 1, limit=1000),
+    )
+    assert transactions.content == expected
+
+    accounts = client.get("/users/me/accounts", headers=headers)
+    expected = client.portal.call(
+        response_model_body,
+        schemas.Account,
+        lambda db: models.Account.get_user_accounts(db, 1),
+    )
+    assert accounts.content == expected
+
+
+def test_account_summary_from_rollups(client, user_token, signed_payment):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    account_id = random.randint(2_000_000, 2_999_999)
+    client.post(
+        "/webhook/payment",
+        json=signed_payment(amount=10.25, account_id=account_id),
+    )
+    client.post(
+        "/webhook/payments/batch",
+        json=[
+            signed_payment(amount=1.5, account_id=account_id),
+            signed_payment(amount=2.0, account_id=account_id),
+        ],
+    )
+
+    url = f"/users/me/accounts/{account_id}/summary"
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200
+    summary = response.json()
+    assert summary["credit_count"] == 3
+    assert Decimal(summary["total"]) == Decimal("13.75")
+    assert len(summary["days"]) == 1
+    assert summary["days"][0]["day"] == summary["date_to"]
+
+    # Пересборка из transactions даёт те же итоги
+    async def rebuild():
+        async with SessionLocal() as session:
+            day = date.fromisoformat(summary["date_to"])
+            await session.execute(
+                update(models.AccountDailyTotal)
+                .where(models.AccountDailyTotal.account_id == account_id)
+                .values(credit_count=0, total_cents=0)
+            )
+            await rollups.backfill(session, day, day)
+
+    client.portal.call(rebuild)
+    assert client.get(url, headers=headers).json() == summary
+
+    empty = client.get(
+        url, params={"from": "2000-01-01", "to": "2000-01-31"}, headers=headers
+    ).json()
+    assert empty["credit_count"] == 0
+    assert empty["days"] == []
+
+    missing = client.get(
+        "/users/me/accounts/999999999/summary", headers=headers
+    )
+    assert missing.status_code == 404
+    reversed_range = client.get(
+        url, params={"from": "2000-02-01", "to": "2000-01-01"}, headers=headers
+    )
+    assert reversed_range.status_code == 400
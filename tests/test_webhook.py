@@ -1,5 +1,16 @@
+import asyncio
+import json
 import uuid
+from decimal import Decimal
+import httpx
 import pytest
+from sqlalchemy import select
+from app import idempotency, models, payments
+from app.coalescer import CreditCoalescer
+from app.database import SessionLocal
+from app.idempotency import idempotency_cache
+from app.main import app
+from app.metrics import webhook_outcomes
 from app.security import generate_signature
 from app.config import settings
 
@@ -24,3 +35,198 @@ def test_webhook_payment(client):
     response = client.post("/webhook/payment", json=data)
     assert response.status_code == 200
     assert response.json()["status"] == "success"
+
+
+def test_webhook_batch(client, signed_payment):
+    ok = signed_payment(amount=10.0)
+    second = signed_payment(amount=5.5)
+    forged = dict(signed_payment(), signature="0" * 64)
+    unknown_user = signed_payment(user_id=999999)
+
+    response = client.post(
+        "/webhook/payments/batch",
+        json=[ok, second, ok, forged, unknown_user],
+    )
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["status"] for r in results] == [
+        "success",
+        "success",
+        "duplicate",
+        "invalid_signature",
+        "user_not_found",
+    ]
+    assert Decimal(results[1]["new_balance"]) == Decimal(
+        results[0]["new_balance"]
+    ) + Decimal("5.50")
+
+    response = client.post("/webhook/payments/batch", json=[ok])
+    assert response.json()["results"][0]["status"] == "duplicate"
+
+
+def test_webhook_batch_records_outcomes_and_feeds_cache(
+    client, signed_payment
+):
+    ok = signed_payment(amount=2.0)
+    assert client.post("/webhook/payment", json=ok).status_code == 200
+    idempotency_cache.clear()
+
+    fresh = signed_payment(amount=1.0)
+    forged = dict(signed_payment(), signature="0" * 64)
+    before = {
+        status: webhook_outcomes.value(status)
+        for status in ("success", "duplicate", "invalid_signature")
+    }
+    response = client.post("/webhook/payments/batch", json=[ok, fresh, forged])
+    statuses = [r["status"] for r in response.json()["results"]]
+    assert statuses == ["duplicate", "success", "invalid_signature"]
+    for status in before:
+        assert webhook_outcomes.value(status) == before[status] + 1
+
+    # Повторы, найденные БД, и новые платежи теперь отсекает кэш
+    for payment in (ok, fresh):
+        tid = payment["transaction_id"]
+        assert idempotency_cache.check(tid) == idempotency.DUPLICATE
+
+
+def test_webhook_rejects_non_finite_amount(client, signed_payment):
+    # JSON Infinity проходит схему; копейки из него не получить
+    payment = dict(signed_payment(), amount=float("inf"))
+    headers = {"Content-Type": "application/json"}
+    response = client.post(
+        "/webhook/payment", content=json.dumps(payment), headers=headers
+    )
+    assert response.status_code == 422
+
+    ok = signed_payment(amount=3.0)
+    response = client.post(
+        "/webhook/payments/batch",
+        content=json.dumps([payment, ok]),
+        headers=headers,
+    )
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["status"] for r in results] == ["invalid_data", "success"]
+
+
+def test_webhook_payment_duplicate(client, signed_payment):
+    data = signed_payment(amount=7.25)
+    first = client.post("/webhook/payment", json=data)
+    assert first.status_code == 200
+
+    retry = client.post("/webhook/payment", json=data)
+    assert retry.status_code == 409
+
+
+def test_webhook_payment_unknown_user(client, signed_payment):
+    response = client.post(
+        "/webhook/payment", json=signed_payment(user_id=999999)
+    )
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_coalesced_credits_share_one_write(session):
+    coalescer = CreditCoalescer(SessionLocal, window=0.05, max_items=100)
+    credits = [payments.Credit(str(uuid.uuid4()), 1, 1, 100) for _ in range(5)]
+    credits.append(credits[0])
+
+    results = await asyncio.gather(*[coalescer.submit(c) for c in credits])
+
+    assert [r.status for r in results] == ["success"] * 5 + ["duplicate"]
+    balances = [r.new_balance_cents for r in results[:5]]
+    assert balances == sorted(balances)
+    assert balances[-1] - balances[0] == 400
+
+
+@pytest.mark.asyncio
+async def test_webhook_payment_coalescing(
+    session, monkeypatch, signed_payment
+):
+    monkeypatch.setattr(settings, "WEBHOOK_COALESCE_ENABLED", True)
+    payloads = [signed_payment(amount=2.0) for _ in range(4)]
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://test"
+    ) as client:
+        responses = await asyncio.gather(
+            *[client.post("/webhook/payment", json=p) for p in payloads]
+        )
+        retry = await client.post("/webhook/payment", json=payloads[0])
+
+    assert [r.status_code for r in responses] == [200] * 4
+    assert len({r.json()["new_balance"] for r in responses}) == 4
+    assert retry.status_code == 409
+
+
+def test_webhook_duplicate_rejected_from_cache(client, signed_payment):
+    data = signed_payment(amount=3.0)
+    assert client.post("/webhook/payment", json=data).status_code == 200
+
+    hits = idempotency_cache.hits
+    retry = client.post("/webhook/payment", json=data)
+    assert retry.status_code == 409
+    assert idempotency_cache.hits == hits + 1
+
+
+def test_webhook_duplicate_detected_after_cache_reset(client, signed_payment):
+    data = signed_payment(amount=3.0)
+    assert client.post("/webhook/payment", json=data).status_code == 200
+
+    idempotency_cache.clear()
+    retry = client.post("/webhook/payment", json=data)
+    assert retry.status_code == 409
+    assert idempotency_cache.check(data["transaction_id"]) == "duplicate"
+
+
+def test_webhook_accepts_rotated_key(client, monkeypatch, signed_payment):
+    from app.api import webhook
+    from app.security import WebhookSigner
+
+    monkeypatch.setattr(
+        webhook,
+        "webhook_signer",
+        WebhookSigner(["next-secret", settings.SECRET_KEY]),
+    )
+    old = signed_payment()
+    response = client.post("/webhook/payment", json=old)
+    assert response.status_code == 200
+
+    forged = dict(signed_payment(), signature="0" * 64)
+    response = client.post("/webhook/payment", json=forged)
+    assert response.status_code == 403
+    assert "expected" not in response.json()["detail"]
+
+
+@pytest.mark.asyncio
+async def test_overlapping_credit_batches_do_not_deadlock(session):
+    base = 4_000_000 + uuid.uuid4().int % 900_000
+    accounts = [base, base + 1, base + 2]
+
+    def batch(order):
+        return [
+            payments.Credit(str(uuid.uuid4()), 1, account_id, 100)
+            for account_id in order
+        ]
+
+    async def apply(credits):
+        async with SessionLocal() as batch_session:
+            return await payments.apply_credits(batch_session, credits)
+
+    await apply(batch(accounts))
+    # Встречный порядок счетов в параллельных пакетах
+    results = await asyncio.gather(
+        *[
+            apply(batch(accounts if i % 2 else accounts[::-1]))
+            for i in range(20)
+        ]
+    )
+    statuses = {r.status for rows in results for r in rows}
+    assert statuses == {payments.SUCCESS}
+    balances = await session.scalars(
+        select(models.Account.balance_cents).where(
+            models.Account.id.in_(accounts)
+        )
+    )
+    assert list(balances) == [2100] * 3